@@ -1,18 +1,62 @@
 from django.contrib import admin
-from .models import Consulta, SignosVitales
 
+from apps.usuarios.admin_listas import FiltroAutocompletar, ListaGrandeMixin
 
-class ConsultaAdmin(admin.ModelAdmin):
+from .busqueda import buscar_texto
+from .models import Consulta, PacienteResumen, SignosVitales, TrabajoExportacion
+from .resumen_paciente import recalcular_resumen
+
+
+class ConsultaAdmin(ListaGrandeMixin, admin.ModelAdmin):
     list_display = ('id_consulta', 'fecha', 'padecimiento_actual', 'categoria_de_padecimiento', 'clave_paciente', 'clave_medico')
+    list_select_related = ('categoria_de_padecimiento', 'clave_paciente', 'clave_medico')
     ordering = ('id_consulta',)
-    list_filter = ('fecha', 'categoria_de_padecimiento', 'clave_paciente', 'clave_medico')
+    # Paciente y médico se eligen con autocompletado: listarlos pondría a todos los usuarios en la página
+    list_filter = (
+        'fecha',
+        'categoria_de_padecimiento',
+        ('clave_paciente', FiltroAutocompletar),
+        ('clave_medico', FiltroAutocompletar),
+    )
+    autocomplete_fields = ('clave_paciente', 'clave_medico')
     search_fields = ('id_consulta',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """ Un número busca por id; cualquier otro texto usa la búsqueda de texto completo. """
+        if not search_term or search_term.strip().isdigit():
+            return super().get_search_results(request, queryset, search_term)
+        return buscar_texto(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Cambiar el paciente o la fecha desde el admin puede cambiar la última consulta de ambos pacientes
+        recalcular_resumen(obj.clave_paciente_id)
+        if change and 'clave_paciente' in form.changed_data:
+            recalcular_resumen(form.initial['clave_paciente'])
+
 
-class SignosVitalesAdmin(admin.ModelAdmin):
+class SignosVitalesAdmin(ListaGrandeMixin, admin.ModelAdmin):
     list_display = ('id_signos', 'peso', 'talla', 'temperatura', 'frecuencia_cardiaca', 'frecuencia_respiratoria', 'presion_arterial', 'imc')
     ordering = ('id_signos',)
+    # Un select con todas las consultas sería enorme
+    raw_id_fields = ('consulta',)
+
+
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'medico', 'formato', 'estado', 'total', 'creado', 'terminado')
+    list_select_related = ('medico',)
+    list_filter = ('estado', 'formato')
+    ordering = ('-creado',)
+
+
+class PacienteResumenAdmin(admin.ModelAdmin):
+    list_display = ('paciente', 'total_consultas', 'fecha_ultima_consulta', 'imc')
+    list_select_related = ('paciente',)
+    search_fields = ('paciente__clave',)
+    readonly_fields = [field.name for field in PacienteResumen._meta.fields]
 
 
 admin.site.register(Consulta, ConsultaAdmin)
-admin.site.register(SignosVitales, SignosVitalesAdmin)
\ No newline at end of file
+admin.site.register(SignosVitales, SignosVitalesAdmin)
+admin.site.register(TrabajoExportacion, TrabajoExportacionAdmin)
+admin.site.register(PacienteResumen, PacienteResumenAdmin)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ConsultasConfig(AppConfig):
@@ -6,4 +7,9 @@ class ConsultasConfig(AppConfig):
     name = 'apps.consultas'
 
     def ready(self):
-        import apps.consultas.signals
\ No newline at end of file
+        import apps.consultas.signals
+        from apps.consultas.signals import crear_motivos_de_consultas, restaurar_busqueda_texto
+
+        # Solo con la señal de esta app, no con la de cada app migrada
+        post_migrate.connect(crear_motivos_de_consultas, sender=self)
+        post_migrate.connect(restaurar_busqueda_texto, sender=self)
@@ -0,0 +1,143 @@
+"""
+Búsqueda de texto completo en el padecimiento actual y los tratamientos de las
+consultas.
+
+- PostgreSQL: la columna `busqueda` (tsvector con configuración `spanish`) es
+  una columna generada, así que la base de datos la mantiene en cada INSERT o
+  UPDATE, incluidos los `bulk_create`. Tiene un índice GIN y los resultados se
+  ordenan con `ts_rank`.
+- SQLite: la tabla virtual FTS5 `consultas_consulta_fts` se mantiene con
+  triggers y los resultados se ordenan con `bm25`. No hay stemming en español;
+  cada palabra se busca como prefijo.
+- Otros motores: `icontains` sobre los tres campos, sin orden por relevancia.
+
+Ni la columna ni la tabla virtual forman parte del modelo: las crea la
+migración 0010 con su propia copia de estas sentencias. `crear_indice_texto`
+las vuelve a ejecutar cuando SQLite pierde los triggers (ver `signals.py`).
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+CAMPOS = ('padecimiento_actual', 'tratamiento_farmacologico_recetado', 'tratamiento_no_farmacologico')
+
+TABLA_FTS = 'consultas_consulta_fts'
+
+SQL_POSTGRESQL = [
+    """
+    ALTER TABLE consultas_consulta ADD COLUMN IF NOT EXISTS busqueda tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(padecimiento_actual, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(tratamiento_farmacologico_recetado, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(tratamiento_no_farmacologico, '')), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS consultas_consulta_busqueda_gin ON consultas_consulta USING gin (busqueda)',
+]
+
+_COLUMNAS = ', '.join(CAMPOS)
+_NUEVOS = ', '.join(f'new.{campo}' for campo in CAMPOS)
+_ANTERIORES = ', '.join(f'old.{campo}' for campo in CAMPOS)
+
+SQL_SQLITE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        {_COLUMNAS}, content='consultas_consulta', content_rowid='id_consulta',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON consultas_consulta BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, {_COLUMNAS}) VALUES (new.id_consulta, {_NUEVOS});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON consultas_consulta BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, {_COLUMNAS}) VALUES ('delete', old.id_consulta, {_ANTERIORES});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE ON consultas_consulta BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, {_COLUMNAS}) VALUES ('delete', old.id_consulta, {_ANTERIORES});
+        INSERT INTO {TABLA_FTS}(rowid, {_COLUMNAS}) VALUES (new.id_consulta, {_NUEVOS});
+    END
+    """,
+]
+
+
+def crear_indice_texto(connection):
+    """
+    Crea el índice de texto completo del motor de `connection`. Es idempotente;
+    en SQLite también reconstruye el contenido de la tabla virtual.
+    """
+    if connection.vendor == 'postgresql':
+        sentencias = SQL_POSTGRESQL
+    elif connection.vendor == 'sqlite':
+        sentencias = SQL_SQLITE + [f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')"]
+    else:
+        return
+    with connection.cursor() as cursor:
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+
+
+def triggers_faltantes(connection):
+    """
+    En SQLite, Django reconstruye la tabla al alterar ciertos campos y con ella
+    se pierden los triggers; devuelve True si la tabla virtual existe pero le
+    faltan sus triggers.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT type FROM sqlite_master WHERE name LIKE %s", [f'{TABLA_FTS}%'])
+        tipos = [fila[0] for fila in cursor.fetchall()]
+    return 'table' in tipos and tipos.count('trigger') < 3
+
+
+def _consulta_fts5(texto):
+    """ Convierte el texto libre en una consulta FTS5 segura: cada palabra como prefijo. """
+    palabras = re.findall(r'\w+', texto)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def buscar_texto(consultas, texto):
+    """
+    Filtra `consultas` a las que coinciden con `texto` y anota su relevancia en
+    `rango` (mayor es más relevante).
+    """
+    connection = connections[consultas.db]
+    if connection.vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('spanish', %s)"
+        return consultas.annotate(
+            # float8 para que el valor devuelto al cursor de paginación se compare exacto
+            rango=RawSQL(f'ts_rank("consultas_consulta"."busqueda", {tsquery})::float8', (texto,), output_field=FloatField()),
+        ).filter(
+            RawSQL(f'"consultas_consulta"."busqueda" @@ {tsquery}', (texto,), output_field=BooleanField())
+        )
+
+    if connection.vendor == 'sqlite':
+        consulta = _consulta_fts5(texto)
+        if not consulta:
+            return consultas.none()
+        return consultas.annotate(
+            rango=RawSQL(
+                f'(SELECT -bm25({TABLA_FTS}) FROM {TABLA_FTS} '
+                f'WHERE {TABLA_FTS} MATCH %s AND rowid = "consultas_consulta"."id_consulta")',
+                (consulta,),
+                output_field=FloatField(),
+            ),
+        ).filter(
+            RawSQL(
+                f'"consultas_consulta"."id_consulta" IN (SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s)',
+                (consulta,),
+                output_field=BooleanField(),
+            )
+        )
+
+    coincidencias = Q()
+    for campo in CAMPOS:
+        coincidencias |= Q(**{f'{campo}__icontains': texto})
+    return consultas.annotate(rango=Value(0.0, output_field=FloatField())).filter(coincidencias)
@@ -0,0 +1,151 @@
+"""
+Exportación de consultas médicas.
+
+Las filas se leen con una sola consulta (paciente, médico, categoría y signos
+vitales unidos con JOIN) y se recorren por bloques con `.iterator()`, de modo
+que la memoria usada no depende del número de consultas exportadas.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+
+TAMANO_BLOQUE = 2000
+
+# Campos leídos de la base de datos, en el orden en que los usan las columnas
+CAMPOS = (
+    'id_consulta',
+    'fecha',
+    'clave_paciente__nombres',
+    'clave_paciente__apellido_paterno',
+    'clave_paciente__apellido_materno',
+    'clave_medico__nombres',
+    'clave_medico__apellido_paterno',
+    'clave_medico__apellido_materno',
+    'categoria_de_padecimiento__padecimiento',
+    'padecimiento_actual',
+    'tratamiento_no_farmacologico',
+    'tratamiento_farmacologico_recetado',
+    'signos_vitales__peso',
+    'signos_vitales__talla',
+    'signos_vitales__temperatura',
+    'signos_vitales__frecuencia_cardiaca',
+    'signos_vitales__frecuencia_respiratoria',
+    'signos_vitales__presion_arterial',
+    'signos_vitales__imc',
+)
+
+ENCABEZADOS = (
+    'ID Consulta',
+    'Fecha',
+    'Paciente',
+    'Médico',
+    'Categoría de padecimiento',
+    'Padecimiento actual',
+    'Tratamiento no farmacológico',
+    'Tratamiento farmacológico recetado',
+    'Peso',
+    'Talla',
+    'Temperatura',
+    'Frecuencia cardíaca',
+    'Frecuencia respiratoria',
+    'Presión arterial',
+    'IMC',
+)
+
+
+def _nombre_completo(*partes):
+    return ' '.join(parte for parte in partes if parte) or '—'
+
+
+def filas_consultas(consultas, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Genera una tupla por consulta con los valores de `ENCABEZADOS`.
+    """
+    for (id_consulta, fecha, p_nombres, p_paterno, p_materno, m_nombres, m_paterno, m_materno,
+         categoria, padecimiento, no_farmacologico, farmacologico, *signos) in (
+        consultas.values_list(*CAMPOS).iterator(chunk_size=tamano_bloque)
+    ):
+        yield (
+            id_consulta,
+            timezone.localtime(fecha).strftime('%Y-%m-%d %H:%M'),
+            _nombre_completo(p_nombres, p_paterno, p_materno),
+            _nombre_completo(m_nombres, m_paterno, m_materno),
+            categoria or '—',
+            padecimiento,
+            no_farmacologico or '',
+            farmacologico or '',
+            *signos,
+        )
+
+
+class _Eco:
+    """ Objeto tipo archivo que devuelve lo escrito en lugar de guardarlo. """
+
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(consultas):
+    """
+    Genera el CSV línea por línea para enviarlo con `StreamingHttpResponse`.
+    Empieza con BOM para que Excel reconozca los acentos.
+    """
+    escritor = csv.writer(_Eco())
+    yield '\ufeff' + escritor.writerow(ENCABEZADOS)
+    for fila in filas_consultas(consultas):
+        yield escritor.writerow(fila)
+
+
+def lineas_jsonl(consultas):
+    """ Genera un objeto JSON por consulta, uno por línea (JSON Lines). """
+    for fila in filas_consultas(consultas):
+        yield json.dumps(dict(zip(ENCABEZADOS, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def escribir_xlsx(consultas, destino, avance=None):
+    """
+    Escribe las consultas en un libro de Excel dentro de `destino` (ruta o archivo)
+    y devuelve cuántas se exportaron. `avance` se llama cada `TAMANO_BLOQUE` filas.
+
+    El modo de solo escritura de openpyxl manda cada fila a un archivo temporal
+    en lugar de mantener la hoja completa en memoria.
+    """
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Consultas Médicas')
+    hoja.append(ENCABEZADOS)
+    total = 0
+    for fila in filas_consultas(consultas):
+        hoja.append(fila)
+        total += 1
+        if avance and total % TAMANO_BLOQUE == 0:
+            avance()
+    libro.save(destino)
+    return total
+
+
+def escribir_exportacion(consultas, formato, destino, avance=None):
+    """
+    Escribe las consultas en el archivo binario `destino` con el formato indicado
+    (`xlsx`, `csv` o `jsonl`) y devuelve cuántas se exportaron. `avance`, si se
+    da, se llama cada `TAMANO_BLOQUE` filas escritas.
+    """
+    if formato == 'xlsx':
+        return escribir_xlsx(consultas, destino, avance)
+    if formato == 'csv':
+        lineas, encabezado = lineas_csv(consultas), 1
+    elif formato == 'jsonl':
+        lineas, encabezado = lineas_jsonl(consultas), 0
+    else:
+        raise ValueError(f'Formato de exportación no soportado: {formato}')
+    total = 0
+    for linea in lineas:
+        destino.write(linea.encode('utf-8'))
+        total += 1
+        if avance and total % TAMANO_BLOQUE == 0:
+            avance()
+    return total - encabezado
@@ -0,0 +1,82 @@
+from datetime import date, datetime, time, timedelta
+from urllib.parse import urlencode
+
+from django.utils import timezone
+
+from apps.usuarios.busqueda import CONTIENE, PREFIJO, filtrar_por_clave
+
+from .busqueda import buscar_texto
+
+
+def _leer_fecha(valor):
+    try:
+        return date.fromisoformat(valor) if valor else None
+    except ValueError:
+        return None
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+class FiltroConsultas:
+    """
+    Filtros de la lista de consultas del médico leídos de los parámetros GET
+    (`todas`, `clave_paciente`, `clave_prefijo`, `fecha_inicio`, `fecha_fin` y
+    `q`, el texto a buscar en el padecimiento y los tratamientos). Con
+    `clave_prefijo=1` la clave solo coincide desde su inicio.
+
+    La lista y la exportación usan el mismo filtro para que el archivo exportado
+    contenga exactamente las consultas que el médico está viendo.
+    """
+
+    def __init__(self, datos, medico):
+        self.medico = medico
+        self.todas = datos.get('todas', '0') == '1'
+        self.clave_paciente = (datos.get('clave_paciente') or '').strip()
+        self.clave_prefijo = datos.get('clave_prefijo') == '1'
+        self.fecha_inicio = datos.get('fecha_inicio') or ''
+        self.fecha_fin = datos.get('fecha_fin') or ''
+        self.texto = (datos.get('q') or '').strip()
+
+    def aplicar(self, consultas):
+        if not self.todas:
+            consultas = consultas.filter(clave_medico=self.medico)
+
+        if self.clave_paciente:
+            modo = PREFIJO if self.clave_prefijo else CONTIENE
+            consultas = filtrar_por_clave(consultas, 'clave_paciente_id', self.clave_paciente, modo)
+
+        # Los límites se comparan contra `fecha` directamente para poder usar su índice
+        inicio = _leer_fecha(self.fecha_inicio)
+        if inicio:
+            consultas = consultas.filter(fecha__gte=_inicio_del_dia(inicio))
+        fin = _leer_fecha(self.fecha_fin)
+        if fin:
+            consultas = consultas.filter(fecha__lt=_inicio_del_dia(fin + timedelta(days=1)))
+
+        if self.texto:
+            consultas = buscar_texto(consultas, self.texto)
+
+        return consultas
+
+    @property
+    def orden(self):
+        """ Campo por el que se pagina: relevancia si hay texto de búsqueda, si no la fecha. """
+        return 'rango' if self.texto else 'fecha'
+
+    def datos(self):
+        """ Devuelve los filtros activos como diccionario, p. ej. para guardarlos en una exportación. """
+        datos = {
+            'todas': '1' if self.todas else '',
+            'clave_paciente': self.clave_paciente,
+            'clave_prefijo': '1' if self.clave_prefijo else '',
+            'fecha_inicio': self.fecha_inicio,
+            'fecha_fin': self.fecha_fin,
+            'q': self.texto,
+        }
+        return {nombre: valor for nombre, valor in datos.items() if valor}
+
+    def parametros(self):
+        """ Devuelve los filtros activos como query string para enlaces y exportaciones. """
+        return urlencode(self.datos())
@@ -1,6 +1,9 @@
 import re
 from django.core.exceptions import ValidationError
 from django import forms
+
+from apps.usuarios.referencias import datos_referencia
+
 from .models import Consulta, SignosVitales
 
 class ConsultaForm(forms.ModelForm):
@@ -19,6 +22,15 @@ class ConsultaForm(forms.ModelForm):
             'categoria_de_padecimiento': forms.Select(attrs={'class': 'form-select'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Las opciones salen de la copia en memoria: mostrar el formulario no consulta las categorías
+        campo = self.fields['categoria_de_padecimiento']
+        opciones = list(datos_referencia.categorias().items())
+        if campo.empty_label is not None:
+            opciones.insert(0, ('', campo.empty_label))
+        campo.choices = opciones
+
 
 class SignosVitalesForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,16 @@
+from sistema_medico.trabajos import ComandoTrabajos
+
+from ...models import TrabajoExportacion
+from ...trabajos import procesar
+
+
+class Command(ComandoTrabajos):
+    help = 'Genera en segundo plano las exportaciones de consultas solicitadas por los médicos'
+    modelo = TrabajoExportacion
+    nombre = 'exportaciones'
+
+    def procesar(self, trabajo):
+        procesar(trabajo)
+
+    def resumen(self, trabajo):
+        return f'{trabajo.total} consultas en {trabajo.archivo.name}'
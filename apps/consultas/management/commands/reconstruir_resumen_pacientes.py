@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ...resumen_paciente import TAMANO_BLOQUE, reconstruir_resumen_pacientes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero el resumen de consultas y últimos signos vitales de cada paciente'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-bloque', type=int, default=TAMANO_BLOQUE,
+                            help='Pacientes que se insertan por cada INSERT')
+
+    def handle(self, *args, **options):
+        creados = reconstruir_resumen_pacientes(options['tamano_bloque'])
+        self.stdout.write(self.style.SUCCESS(f'Se reconstruyeron {creados} resúmenes de pacientes'))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:21
+
+import apps.consultas.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('consultas', '0006_signosvitales_imc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('formato', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV'), ('jsonl', 'JSON Lines')], default='xlsx', max_length=5)),
+                ('filtros', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('terminado', 'Terminado'), ('error', 'Error')], default='pendiente', max_length=10)),
+                ('archivo', models.FileField(blank=True, upload_to=apps.consultas.models._ruta_exportacion)),
+                ('total', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exportaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-creado', '-id'],
+                'indexes': [models.Index(fields=['estado', 'creado'], name='consultas_t_estado_7d5f05_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trabajoexportacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['pendiente', 'procesando'])), fields=('medico',), name='una_exportacion_activa_por_medico'),
+        ),
+    ]
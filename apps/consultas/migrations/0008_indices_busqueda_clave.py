@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from sistema_medico.migraciones import RunSQLPostgreSQL
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0007_trabajoexportacion'),
+    ]
+
+    # Índices sobre UPPER(clave_paciente_id) para filtrar consultas por la clave
+    # del paciente sin unir la tabla de usuarios
+    operations = [
+        RunSQLPostgreSQL(
+            sql='CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            # La extensión puede usarla otra tabla; no se borra al revertir
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        RunSQLPostgreSQL(
+            sql='CREATE INDEX IF NOT EXISTS consultas_consulta_paciente_upper_like ON consultas_consulta '
+                'USING btree ((UPPER(clave_paciente_id)) text_pattern_ops)',
+            reverse_sql='DROP INDEX IF EXISTS consultas_consulta_paciente_upper_like',
+        ),
+        RunSQLPostgreSQL(
+            sql='CREATE INDEX IF NOT EXISTS consultas_consulta_paciente_upper_trgm ON consultas_consulta '
+                'USING gin ((UPPER(clave_paciente_id)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS consultas_consulta_paciente_upper_trgm',
+        ),
+    ]
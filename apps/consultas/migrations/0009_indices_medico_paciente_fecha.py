@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0008_indices_busqueda_clave'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consulta',
+            index=models.Index(fields=['clave_medico', '-fecha', '-id_consulta'], name='consulta_medico_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consulta',
+            index=models.Index(fields=['clave_paciente', '-fecha', '-id_consulta'], name='consulta_paciente_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+from django.db import migrations
+
+
+# Sentencias fijas de esta migración; `apps.consultas.busqueda` tiene su propia
+# copia para reparar los triggers de SQLite y puede cambiar sin afectar a esta
+POSTGRESQL = [
+    """
+    ALTER TABLE consultas_consulta ADD COLUMN IF NOT EXISTS busqueda tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(padecimiento_actual, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(tratamiento_farmacologico_recetado, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(tratamiento_no_farmacologico, '')), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS consultas_consulta_busqueda_gin ON consultas_consulta USING gin (busqueda)',
+]
+
+POSTGRESQL_REVERSA = [
+    'DROP INDEX IF EXISTS consultas_consulta_busqueda_gin',
+    'ALTER TABLE consultas_consulta DROP COLUMN IF EXISTS busqueda',
+]
+
+SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS consultas_consulta_fts USING fts5(
+        padecimiento_actual, tratamiento_farmacologico_recetado, tratamiento_no_farmacologico,
+        content='consultas_consulta', content_rowid='id_consulta',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS consultas_consulta_fts_ai AFTER INSERT ON consultas_consulta BEGIN
+        INSERT INTO consultas_consulta_fts(
+            rowid, padecimiento_actual, tratamiento_farmacologico_recetado, tratamiento_no_farmacologico
+        ) VALUES (
+            new.id_consulta, new.padecimiento_actual, new.tratamiento_farmacologico_recetado,
+            new.tratamiento_no_farmacologico
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS consultas_consulta_fts_ad AFTER DELETE ON consultas_consulta BEGIN
+        INSERT INTO consultas_consulta_fts(
+            consultas_consulta_fts, rowid, padecimiento_actual, tratamiento_farmacologico_recetado,
+            tratamiento_no_farmacologico
+        ) VALUES (
+            'delete', old.id_consulta, old.padecimiento_actual, old.tratamiento_farmacologico_recetado,
+            old.tratamiento_no_farmacologico
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS consultas_consulta_fts_au AFTER UPDATE ON consultas_consulta BEGIN
+        INSERT INTO consultas_consulta_fts(
+            consultas_consulta_fts, rowid, padecimiento_actual, tratamiento_farmacologico_recetado,
+            tratamiento_no_farmacologico
+        ) VALUES (
+            'delete', old.id_consulta, old.padecimiento_actual, old.tratamiento_farmacologico_recetado,
+            old.tratamiento_no_farmacologico
+        );
+        INSERT INTO consultas_consulta_fts(
+            rowid, padecimiento_actual, tratamiento_farmacologico_recetado, tratamiento_no_farmacologico
+        ) VALUES (
+            new.id_consulta, new.padecimiento_actual, new.tratamiento_farmacologico_recetado,
+            new.tratamiento_no_farmacologico
+        );
+    END
+    """,
+    "INSERT INTO consultas_consulta_fts(consultas_consulta_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSA = [
+    'DROP TRIGGER IF EXISTS consultas_consulta_fts_ai',
+    'DROP TRIGGER IF EXISTS consultas_consulta_fts_ad',
+    'DROP TRIGGER IF EXISTS consultas_consulta_fts_au',
+    'DROP TABLE IF EXISTS consultas_consulta_fts',
+]
+
+
+def _ejecutar(schema_editor, por_motor):
+    # Otros motores no tienen índice de texto; la búsqueda usa icontains
+    for sentencia in por_motor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+def crear(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRESQL, 'sqlite': SQLITE})
+
+
+def borrar(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRESQL_REVERSA, 'sqlite': SQLITE_REVERSA})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0009_indices_medico_paciente_fecha'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear, borrar),
+    ]
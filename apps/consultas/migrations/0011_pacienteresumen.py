@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0011_indices_busqueda_clave'),
+        ('consultas', '0010_busqueda_texto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PacienteResumen',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_consultas', models.IntegerField(default=0)),
+                ('fecha_ultima_consulta', models.DateTimeField(blank=True, null=True)),
+                ('peso', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True, verbose_name='Peso (kg)')),
+                ('talla', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True, verbose_name='Talla (m)')),
+                ('temperatura', models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True, verbose_name='Temperatura (°C)')),
+                ('presion_arterial', models.CharField(blank=True, max_length=7, null=True, verbose_name='Presión arterial')),
+                ('imc', models.FloatField(blank=True, null=True, verbose_name='Índice de Masa Corporal(IMC)')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('ultima_consulta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='consultas.consulta')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0011_pacienteresumen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
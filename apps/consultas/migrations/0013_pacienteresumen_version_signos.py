@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0012_trabajoexportacion_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pacienteresumen',
+            name='version_signos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.core.validators import RegexValidator
 from django.db import models
 
 from apps.usuarios.models import Usuario
+from sistema_medico.trabajos import Trabajo, ruta_aleatoria
 
 
 class CategoriaPadecimiento(models.Model):
@@ -34,10 +35,16 @@ class Consulta(models.Model):
 
     class Meta:
         ordering = ["-fecha", "-id_consulta"]
-        indexes = [models.Index(fields=["-fecha", "-id_consulta"]),]
+        indexes = [
+            models.Index(fields=["-fecha", "-id_consulta"]),
+            # Consultas de un médico o de un paciente ordenadas por fecha sin paso de ordenamiento
+            models.Index(fields=["clave_medico", "-fecha", "-id_consulta"], name="consulta_medico_fecha_idx"),
+            models.Index(fields=["clave_paciente", "-fecha", "-id_consulta"], name="consulta_paciente_fecha_idx"),
+        ]
 
     def __str__(self):
-        return f"Consulta {self.id_consulta} - {self.fecha} - {self.clave_paciente} - {self.clave_medico}"
+        # Con las claves y no con los usuarios: mostrar una consulta no consulta a sus usuarios
+        return f"Consulta {self.id_consulta} - {self.fecha} - {self.clave_paciente_id} - {self.clave_medico_id}"
 
 
 class SignosVitales(models.Model):
@@ -76,3 +83,68 @@ class SignosVitales(models.Model):
 
     def __str__(self):
         return f"{self.id_signos} - {self.consulta}"
+
+
+class PacienteResumen(models.Model):
+    """
+    Datos más recientes de cada paciente: cuántas consultas tiene, cuándo fue la
+    última y sus últimos signos vitales.
+
+    Se actualiza en la misma transacción que crea la consulta (ver
+    `resumen_paciente.registrar_consulta`) para que las listas de médicos los
+    muestren sin agregar `Consulta` y `SignosVitales` por cada paciente. El
+    comando `reconstruir_resumen_pacientes` lo recalcula desde cero.
+    """
+    paciente = models.OneToOneField(Usuario, on_delete=models.CASCADE, primary_key=True, related_name='resumen')
+    total_consultas = models.IntegerField(default=0)
+    ultima_consulta = models.ForeignKey(Consulta, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha_ultima_consulta = models.DateTimeField(null=True, blank=True)
+    peso = models.DecimalField('Peso (kg)', max_digits=4, decimal_places=1, blank=True, null=True)
+    talla = models.DecimalField('Talla (m)', max_digits=4, decimal_places=2, blank=True, null=True)
+    temperatura = models.DecimalField('Temperatura (°C)', max_digits=3, decimal_places=1, blank=True, null=True)
+    presion_arterial = models.CharField('Presión arterial', max_length=7, blank=True, null=True)
+    imc = models.FloatField('Índice de Masa Corporal(IMC)', blank=True, null=True)
+    # Aumenta con cada cambio en los signos de cualquier consulta del paciente;
+    # forma parte de la llave de caché y el ETag de la gráfica de tendencias
+    version_signos = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.paciente_id}: {self.total_consultas} consultas'
+
+
+def _ruta_exportacion(instance, filename):
+    return ruta_aleatoria('exportaciones', filename)
+
+
+class TrabajoExportacion(Trabajo):
+    """
+    Exportación de consultas solicitada por un médico y generada fuera de la
+    petición por el comando `procesar_exportaciones`.
+    """
+    FORMATOS = [
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    ]
+    MENSAJE_INTERRUMPIDO = 'La exportación se interrumpió.'
+
+    medico = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='exportaciones')
+    formato = models.CharField(max_length=5, choices=FORMATOS, default='xlsx')
+    filtros = models.JSONField(default=dict, blank=True)
+    archivo = models.FileField(upload_to=_ruta_exportacion, blank=True)
+    total = models.IntegerField(null=True, blank=True)
+
+    class Meta(Trabajo.Meta):
+        constraints = [
+            # Cada médico puede tener a lo más una exportación pendiente o en proceso
+            models.UniqueConstraint(
+                fields=['medico'],
+                condition=models.Q(estado__in=['pendiente', 'procesando']),
+                name='una_exportacion_activa_por_medico',
+            )
+        ]
+        indexes = [models.Index(fields=["estado", "creado"]),]
+
+    def __str__(self):
+        return f"Exportación {self.pk} - {self.medico_id} - {self.estado}"
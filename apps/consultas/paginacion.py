@@ -0,0 +1,105 @@
+"""
+Paginación por cursor (keyset) para listas de consultas.
+
+`Paginator` ejecuta un COUNT(*) y un OFFSET que recorre todas las filas
+anteriores, así que cada página es más lenta que la anterior. Aquí cada página
+continúa desde la última consulta mostrada usando el orden `(-fecha, -id_consulta)`
+del índice de `Consulta`, y su costo no depende de qué tan lejos se navegue.
+Los resultados de una búsqueda de texto se paginan igual usando `(-rango, -id_consulta)`.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+TAMANO_PAGINA = 20
+
+SIGUIENTE = 's'
+ANTERIOR = 'a'
+
+
+def _codificar(direccion, consulta, campo):
+    valor = getattr(consulta, campo)
+    valor = valor.isoformat() if isinstance(valor, datetime) else repr(valor)
+    texto = f'{direccion}|{valor}|{consulta.id_consulta}'
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor, campo):
+    """ Devuelve (dirección, valor de `campo`, id) o None si el cursor no es válido. """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        direccion, valor, id_consulta = base64.urlsafe_b64decode(cursor + relleno).decode().split('|')
+        if direccion not in (SIGUIENTE, ANTERIOR):
+            return None
+        valor = datetime.fromisoformat(valor) if campo == 'fecha' else float(valor)
+        return direccion, valor, int(id_consulta)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class PaginaCursor:
+    """
+    Página de consultas con los cursores para avanzar (`siguiente`) y
+    retroceder (`anterior`); un cursor en None indica que no hay más páginas.
+    """
+
+    def __init__(self, objetos, siguiente=None, anterior=None):
+        self.objetos = objetos
+        self.siguiente = siguiente
+        self.anterior = anterior
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    @property
+    def es_primera(self):
+        return self.anterior is None
+
+
+def paginar_por_cursor(consultas, cursor=None, tamano=TAMANO_PAGINA, campo='fecha'):
+    """
+    Devuelve la página de `consultas` indicada por `cursor` (la primera si no hay
+    cursor o no es válido), en orden descendente de `campo` y luego de id.
+    Se lee una fila extra para saber si hay más páginas.
+    """
+    posicion = _decodificar(cursor, campo) if cursor else None
+    if posicion is None:
+        filas = list(consultas.order_by(f'-{campo}', '-id_consulta')[:tamano + 1])
+        siguiente = _codificar(SIGUIENTE, filas[tamano - 1], campo) if len(filas) > tamano else None
+        return PaginaCursor(filas[:tamano], siguiente=siguiente)
+
+    direccion, valor, id_consulta = posicion
+    if direccion == SIGUIENTE:
+        # campo <= x permite al índice acotar el rango; el OR solo desempata por id
+        filas = list(
+            consultas.filter(
+                Q(**{f'{campo}__lte': valor}),
+                Q(**{f'{campo}__lt': valor}) | Q(id_consulta__lt=id_consulta),
+            ).order_by(f'-{campo}', '-id_consulta')[:tamano + 1]
+        )
+        objetos = filas[:tamano]
+        return PaginaCursor(
+            objetos,
+            siguiente=_codificar(SIGUIENTE, objetos[-1], campo) if len(filas) > tamano else None,
+            anterior=_codificar(ANTERIOR, objetos[0], campo) if objetos else None,
+        )
+
+    filas = list(
+        consultas.filter(
+            Q(**{f'{campo}__gte': valor}),
+            Q(**{f'{campo}__gt': valor}) | Q(id_consulta__gt=id_consulta),
+        ).order_by(campo, 'id_consulta')[:tamano + 1]
+    )
+    objetos = filas[:tamano][::-1]
+    if not objetos:
+        return paginar_por_cursor(consultas, tamano=tamano, campo=campo)
+    return PaginaCursor(
+        objetos,
+        siguiente=_codificar(SIGUIENTE, objetos[-1], campo),
+        anterior=_codificar(ANTERIOR, objetos[0], campo) if len(filas) > tamano else None,
+    )
@@ -0,0 +1,136 @@
+"""
+Mantenimiento de `PacienteResumen`.
+
+`registrar_consulta` se llama dentro de la transacción que crea la consulta y
+sus signos vitales, así que el resumen nunca queda a medias si algo falla. En
+el caso común (el paciente ya tiene resumen) solo cuesta un UPDATE.
+`recalcular_resumen` y `reconstruir_resumen_pacientes` leen las consultas
+desde cero; los usan las señales de borrado y el comando
+`reconstruir_resumen_pacientes`.
+
+Cualquier cambio en los signos de una consulta del paciente, sea o no la
+última, aumenta `version_signos` para que la gráfica de tendencias no sirva
+datos viejos desde la caché.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Now
+
+from .models import Consulta, PacienteResumen
+
+
+CAMPOS_SIGNOS = ('peso', 'talla', 'temperatura', 'presion_arterial', 'imc')
+
+TAMANO_BLOQUE = 1000
+
+
+def _valores_signos(signos):
+    return {campo: getattr(signos, campo) if signos else None for campo in CAMPOS_SIGNOS}
+
+
+def registrar_consulta(consulta, signos=None):
+    """ Suma la consulta recién creada al resumen de su paciente y guarda sus signos como los últimos. """
+    actualizados = PacienteResumen.objects.filter(paciente_id=consulta.clave_paciente_id).update(
+        total_consultas=F('total_consultas') + 1,
+        ultima_consulta=consulta,
+        fecha_ultima_consulta=consulta.fecha,
+        version_signos=F('version_signos') + 1,
+        actualizado=Now(),
+        **_valores_signos(signos),
+    )
+    if not actualizados:
+        recalcular_resumen(consulta.clave_paciente_id)
+
+
+def actualizar_signos(signos, borrados=False):
+    """
+    Registra que cambiaron los signos de una consulta: si es la última del
+    paciente copia los valores al resumen; en cualquier caso aumenta
+    `version_signos`. Con `borrados=True` los signos se eliminaron.
+    """
+    version = {'version_signos': F('version_signos') + 1, 'actualizado': Now()}
+    if PacienteResumen.objects.filter(ultima_consulta_id=signos.consulta_id).update(
+        **version, **_valores_signos(None if borrados else signos)
+    ):
+        return
+    paciente = Consulta.objects.filter(pk=signos.consulta_id).values('clave_paciente_id')
+    PacienteResumen.objects.filter(paciente_id=Subquery(paciente)).update(**version)
+
+
+def _datos_resumen(clave):
+    consultas = Consulta.objects.filter(clave_paciente_id=clave)
+    ultima = consultas.order_by('-fecha', '-id_consulta').values(
+        'id_consulta', 'fecha', *[f'signos_vitales__{campo}' for campo in CAMPOS_SIGNOS]
+    ).first()
+    datos = {
+        'total_consultas': consultas.count(),
+        'ultima_consulta_id': ultima and ultima['id_consulta'],
+        'fecha_ultima_consulta': ultima and ultima['fecha'],
+    }
+    for campo in CAMPOS_SIGNOS:
+        datos[campo] = ultima and ultima[f'signos_vitales__{campo}']
+    return datos
+
+
+def recalcular_resumen(clave, crear=True):
+    """
+    Recalcula el resumen de un paciente. Con `crear=False` solo actualiza un
+    resumen existente, como al borrar consultas de un paciente que también se
+    está borrando.
+    """
+    datos = _datos_resumen(clave)
+    version = {'version_signos': F('version_signos') + 1, 'actualizado': Now()}
+    if PacienteResumen.objects.filter(paciente_id=clave).update(**version, **datos) or not crear:
+        return
+    try:
+        with transaction.atomic():
+            PacienteResumen.objects.create(paciente_id=clave, **datos)
+    except IntegrityError:
+        # Otra petición creó el resumen al mismo tiempo
+        PacienteResumen.objects.filter(paciente_id=clave).update(**version, **_datos_resumen(clave))
+
+
+def reconstruir_resumen_pacientes(tamano_bloque=TAMANO_BLOQUE):
+    """
+    Borra y vuelve a crear todos los resúmenes con una agregación por paciente
+    y una subconsulta para la última consulta. Devuelve cuántos se crearon.
+    """
+    ultima = Consulta.objects.filter(clave_paciente=OuterRef('clave_paciente')).order_by('-fecha', '-id_consulta')
+    totales = (
+        Consulta.objects.values('clave_paciente_id')
+        .annotate(total=Count('id_consulta'), ultima=Subquery(ultima.values('id_consulta')[:1]))
+        .order_by()
+    )
+    campos = ['id_consulta', 'fecha', *[f'signos_vitales__{campo}' for campo in CAMPOS_SIGNOS]]
+
+    creados = 0
+    with transaction.atomic():
+        PacienteResumen.objects.all().delete()
+        bloque = []
+        for fila in totales.iterator(chunk_size=tamano_bloque):
+            bloque.append(fila)
+            if len(bloque) == tamano_bloque:
+                creados += _crear_bloque(bloque, campos)
+                bloque = []
+        if bloque:
+            creados += _crear_bloque(bloque, campos)
+    return creados
+
+
+def _crear_bloque(filas, campos):
+    ultimas = {
+        valores['id_consulta']: valores
+        for valores in Consulta.objects.filter(pk__in=[fila['ultima'] for fila in filas]).values(*campos)
+    }
+    resumenes = []
+    for fila in filas:
+        ultima = ultimas[fila['ultima']]
+        resumenes.append(PacienteResumen(
+            paciente_id=fila['clave_paciente_id'],
+            total_consultas=fila['total'],
+            ultima_consulta_id=ultima['id_consulta'],
+            fecha_ultima_consulta=ultima['fecha'],
+            **{campo: ultima[f'signos_vitales__{campo}'] for campo in CAMPOS_SIGNOS},
+        ))
+    PacienteResumen.objects.bulk_create(resumenes)
+    return len(resumenes)
@@ -1,5 +1,8 @@
-from django.db.models.signals import post_save, post_migrate
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .busqueda import crear_indice_texto, triggers_faltantes
+from .resumen_paciente import actualizar_signos, recalcular_resumen
 from .models import Consulta, SignosVitales, CategoriaPadecimiento
 
 
@@ -10,15 +13,16 @@ from .models import Consulta, SignosVitales, CategoriaPadecimiento
 #         SignosVitales.objects.create(consulta=instance)
 
 
-# Usamos el decorador @receiver para escuchar la señal 'post_migrate', que se ejecuta después de que se apliquen las migraciones
-@receiver(post_migrate)
-def crear_motivos_de_consultas(sender, **kwargs):
+# Conectada a 'post_migrate' en ConsultasConfig.ready(), que se ejecuta después de que se apliquen las migraciones
+def crear_motivos_de_consultas(sender, using=DEFAULT_DB_ALIAS, **kwargs):
     """
     Esta función se ejecuta automáticamente después de las migraciones para crear los motivos de consulta 
     predefinidos en la base de datos. Los motivos se definen como categorías de padecimientos comunes que
     los pacientes podrían tener al visitar a un médico.
+
+    Solo corre con la señal de esta app: una consulta y, si faltan motivos, una inserción en bloque.
     """
-    
+
     # Lista de padecimientos o motivos comunes de consulta
     padecimientos = [
         "IRAS",  # Infecciones respiratorias agudas
@@ -43,7 +47,36 @@ def crear_motivos_de_consultas(sender, **kwargs):
         "ASESORÍA", # Consultas para orientación general
     ]
 
-    # Iterar sobre la lista de padecimientos y crear una categoría de padecimiento para cada uno
-    for padecimientoC in padecimientos:
-        # Crear o buscar una categoría de padecimiento en la base de datos
-        CategoriaPadecimiento.objects.get_or_create(padecimiento=padecimientoC)
+    # `padecimiento` no es único, así que no basta con ignore_conflicts: se insertan solo los que faltan
+    categorias = CategoriaPadecimiento.objects.using(using)
+    existentes = set(categorias.filter(padecimiento__in=padecimientos).values_list('padecimiento', flat=True))
+    faltantes = [CategoriaPadecimiento(padecimiento=p) for p in padecimientos if p not in existentes]
+    if faltantes:
+        categorias.bulk_create(faltantes)
+
+
+def restaurar_busqueda_texto(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    En SQLite, una migración que reconstruye `consultas_consulta` elimina los
+    triggers que mantienen la tabla FTS5; aquí se vuelven a crear.
+    """
+    connection = connections[using]
+    if triggers_faltantes(connection):
+        crear_indice_texto(connection)
+
+
+@receiver(post_delete, sender=Consulta)
+def descontar_resumen_paciente(sender, instance, **kwargs):
+    """ Recalcula el resumen del paciente; si era su última consulta, pasa a la anterior. """
+    recalcular_resumen(instance.clave_paciente_id, crear=False)
+
+
+@receiver(post_save, sender=SignosVitales)
+def actualizar_signos_resumen(sender, instance, **kwargs):
+    # También los nuevos: pueden agregarse a una consulta que ya estaba registrada
+    actualizar_signos(instance)
+
+
+@receiver(post_delete, sender=SignosVitales)
+def borrar_signos_resumen(sender, instance, **kwargs):
+    actualizar_signos(instance, borrados=True)
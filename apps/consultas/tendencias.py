@@ -0,0 +1,102 @@
+"""
+Series de signos vitales de un paciente para la gráfica de tendencias.
+
+Las series salen de una sola consulta ordenada sobre `SignosVitales` unida a
+`Consulta`. Si el paciente tiene más de `MAX_PUNTOS` consultas, las visitas
+consecutivas se agrupan y se promedian para no enviar al navegador un punto
+por cada consulta.
+
+El resultado se guarda en la caché con una llave que incluye la versión del
+`PacienteResumen` del paciente: cada consulta nueva y cada cambio en los signos
+de cualquiera de sus consultas aumenta `version_signos` y con ello cambia la
+llave, así que no hace falta borrar entradas viejas; caducan solas después de
+`DURACION_CACHE`.
+"""
+import math
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import PacienteResumen, SignosVitales
+
+
+MAX_PUNTOS = 200
+DURACION_CACHE = 60 * 60 * 24
+
+SERIES = ('peso', 'imc', 'temperatura', 'sistolica', 'diastolica')
+
+
+def version_signos(clave):
+    """ Identifica el estado de los signos del paciente; None si no tiene consultas registradas. """
+    resumen = PacienteResumen.objects.filter(paciente_id=clave).values_list(
+        'total_consultas', 'version_signos', 'actualizado'
+    ).first()
+    if resumen is None:
+        return None
+    total, version, actualizado = resumen
+    # `actualizado` distingue un resumen reconstruido, cuya versión vuelve a empezar
+    return f'{total}-{version}-{actualizado.timestamp():.6f}'
+
+
+def _numero(valor):
+    return None if valor is None else float(valor)
+
+
+def _presion(presion):
+    """ '120/80' -> (120.0, 80.0); (None, None) si falta o no tiene ese formato. """
+    try:
+        sistolica, diastolica = (presion or '').split('/')
+        return float(sistolica), float(diastolica)
+    except ValueError:
+        return None, None
+
+
+def _puntos(clave):
+    filas = SignosVitales.objects.filter(consulta__clave_paciente_id=clave).order_by(
+        'consulta__fecha', 'consulta__id_consulta'
+    ).values_list('consulta__fecha', 'peso', 'imc', 'temperatura', 'presion_arterial')
+    for fecha, peso, imc, temperatura, presion in filas.iterator():
+        yield (fecha, _numero(peso), _numero(imc), _numero(temperatura), *_presion(presion))
+
+
+def _promedio(valores):
+    valores = [valor for valor in valores if valor is not None]
+    return round(sum(valores) / len(valores), 2) if valores else None
+
+
+def agrupar(puntos, max_puntos=MAX_PUNTOS):
+    """
+    Reduce `puntos` (tuplas de fecha y valores) a lo más `max_puntos`
+    promediando grupos de visitas consecutivas; cada grupo toma la fecha de
+    su última visita. Devuelve los puntos y el tamaño de grupo usado.
+    """
+    tamano = max(1, math.ceil(len(puntos) / max_puntos))
+    if tamano == 1:
+        return puntos, 1
+    agrupados = []
+    for inicio in range(0, len(puntos), tamano):
+        grupo = puntos[inicio:inicio + tamano]
+        columnas = list(zip(*grupo))
+        agrupados.append((grupo[-1][0], *[_promedio(columna) for columna in columnas[1:]]))
+    return agrupados, tamano
+
+
+def calcular_series(clave, max_puntos=MAX_PUNTOS):
+    puntos, tamano = agrupar(list(_puntos(clave)), max_puntos)
+    series = {'fecha': [timezone.localtime(punto[0]).isoformat() for punto in puntos]}
+    for i, nombre in enumerate(SERIES, start=1):
+        series[nombre] = [punto[i] for punto in puntos]
+    return {'puntos': len(puntos), 'visitas_por_punto': tamano, 'series': series}
+
+
+def series_signos(clave, version=None):
+    """ Devuelve las series del paciente desde la caché o las calcula y las guarda. """
+    version = version or version_signos(clave)
+    if version is None:
+        return calcular_series(clave)
+    llave = f'signos_paciente:{clave}:{version}'
+    datos = cache.get(llave)
+    if datos is None:
+        datos = calcular_series(clave)
+        cache.set(llave, datos, DURACION_CACHE)
+    return datos
@@ -1,8 +1,28 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
 from apps.usuarios.models import Usuario
+from sistema_medico.tests_utils import STORAGES_PRUEBAS, crear_usuario
 
-from .models import Consulta, SignosVitales, CategoriaPadecimiento
+from .busqueda import buscar_texto
+from .exportacion import ENCABEZADOS, filas_consultas
+from .filtros import FiltroConsultas
+from .models import Consulta, SignosVitales, CategoriaPadecimiento, PacienteResumen, TrabajoExportacion
+from .paginacion import paginar_por_cursor
+from .resumen_paciente import reconstruir_resumen_pacientes
+from .tendencias import agrupar
+from .trabajos import ExportacionEnCurso, solicitar_exportacion
 
 
 class ConsultaTestCase(TestCase):
@@ -54,4 +74,626 @@ class ConsultaTestCase(TestCase):
 
     def test_signos_vitales_exists(self):
         signos_vitales = SignosVitales.objects.get(id_signos=self.signos_vitales.id_signos)
-        self.assertEqual(signos_vitales, self.signos_vitales)
\ No newline at end of file
+        self.assertEqual(signos_vitales, self.signos_vitales)
+
+    def test_filas_exportacion_en_una_consulta(self):
+        Consulta.objects.create(
+            padecimiento_actual='Sin signos vitales',
+            categoria_de_padecimiento=self.categoria,
+            clave_paciente=self.paciente,
+            clave_medico=self.medico
+        )
+        with self.assertNumQueries(1):
+            filas = list(filas_consultas(Consulta.objects.all(), tamano_bloque=1))
+        self.assertEqual(2, len(filas))
+        self.assertEqual(len(ENCABEZADOS), len(filas[0]))
+        self.assertIsNone(filas[0][-1])  # la consulta nueva no tiene signos vitales
+
+    def test_exportar_consultas_excel(self):
+        from openpyxl import load_workbook
+
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        response = self.client.get(reverse('exportar_consultas'))
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        hoja = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        filas = list(hoja.iter_rows(values_only=True))
+        self.assertEqual(ENCABEZADOS, filas[0])
+        self.assertEqual(self.consulta.id_consulta, filas[1][0])
+        self.assertEqual('JOHN DOE', filas[1][2])
+        self.assertEqual('120/80', filas[1][13])
+
+    def test_filtro_consultas(self):
+        otra = Consulta.objects.create(
+            padecimiento_actual='Otra consulta',
+            categoria_de_padecimiento=self.categoria,
+            clave_paciente=self.paciente,
+            clave_medico=self.medico
+        )
+        Consulta.objects.filter(pk=self.consulta.pk).update(fecha='2023-01-01T12:00:00-06:00')
+
+        filtro = FiltroConsultas({'fecha_inicio': '2023-01-01', 'fecha_fin': '2023-01-01'}, self.medico)
+        self.assertEqual([self.consulta.pk], list(filtro.aplicar(Consulta.objects.all()).values_list('pk', flat=True)))
+        self.assertEqual('fecha_inicio=2023-01-01&fecha_fin=2023-01-01', filtro.parametros())
+
+        filtro = FiltroConsultas({'fecha_fin': '2023-01-01'}, self.medico)
+        self.assertNotIn(otra.pk, filtro.aplicar(Consulta.objects.all()).values_list('pk', flat=True))
+
+        filtro = FiltroConsultas({'fecha_inicio': 'no-es-fecha', 'clave_paciente': 'isc2217'}, self.medico)
+        self.assertEqual(2, filtro.aplicar(Consulta.objects.all()).count())
+
+        # Con clave_prefijo la clave solo coincide desde su inicio
+        filtro = FiltroConsultas({'clave_paciente': 'sc2217', 'clave_prefijo': '1'}, self.medico)
+        self.assertFalse(filtro.aplicar(Consulta.objects.all()).exists())
+        self.assertEqual('clave_paciente=sc2217&clave_prefijo=1', filtro.parametros())
+        filtro = FiltroConsultas({'clave_paciente': 'isc2217', 'clave_prefijo': '1'}, self.medico)
+        self.assertEqual(2, filtro.aplicar(Consulta.objects.all()).count())
+
+    def test_autocompletar_pacientes(self):
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        response = self.client.get(reverse('autocompletar_pacientes'), {'q': 'isc22'})
+        self.assertEqual({'resultados': [{'clave': 'ISC221733', 'nombre': 'JOHN DOE'}]}, response.json())
+
+        self.client.login(clave='ISC221733', password='P@ssword123')
+        response = self.client.get(reverse('autocompletar_pacientes'), {'q': 'isc22'})
+        self.assertNotEqual(200, response.status_code)
+
+    @override_settings(STORAGES=STORAGES_PRUEBAS)
+    def test_exportar_csv_y_jsonl_con_filtros(self):
+        import csv
+        import json
+
+        Consulta.objects.filter(pk=self.consulta.pk).update(fecha='2023-01-01T12:00:00-06:00')
+        Consulta.objects.create(
+            padecimiento_actual='Fuera del rango',
+            categoria_de_padecimiento=self.categoria,
+            clave_paciente=self.paciente,
+            clave_medico=self.medico
+        )
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        parametros = {'fecha_inicio': '2023-01-01', 'fecha_fin': '2023-01-31'}
+
+        response = self.client.get(reverse('exportar_consultas'), {'formato': 'csv', **parametros})
+        self.assertTrue(response.streaming)
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(list(ENCABEZADOS), filas[0])
+        self.assertEqual([str(self.consulta.pk)], [fila[0] for fila in filas[1:]])
+
+        response = self.client.get(reverse('exportar_consultas'), {'formato': 'jsonl', **parametros})
+        lineas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(1, len(lineas))
+        self.assertEqual('120/80', json.loads(lineas[0])['Presión arterial'])
+
+        response = self.client.get(reverse('exportar_consultas'), {'formato': 'pdf'})
+        self.assertEqual(404, response.status_code)
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class TrabajoExportacionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_usuario('ISC221734', 'medico')
+        cls.otro_medico = crear_usuario('ISC221735', 'medico', nombres='JANE')
+        paciente = crear_usuario('ISC221733')
+        categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='IRAS')[0]
+        for medico in (cls.medico, cls.otro_medico):
+            Consulta.objects.create(
+                padecimiento_actual='Padecimiento actual',
+                categoria_de_padecimiento=categoria,
+                clave_paciente=paciente,
+                clave_medico=medico
+            )
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_una_exportacion_activa_por_medico(self):
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        response = self.client.post(reverse('solicitar_exportacion'), {'formato': 'csv'})
+        self.assertRedirects(response, reverse('exportaciones'), fetch_redirect_response=False)
+        self.client.post(reverse('solicitar_exportacion'), {'formato': 'xlsx'})
+
+        self.assertEqual(1, TrabajoExportacion.objects.filter(medico=self.medico).count())
+        with self.assertRaises(ExportacionEnCurso):
+            solicitar_exportacion(self.medico, 'csv', FiltroConsultas({}, self.medico))
+        # Otro médico sí puede exportar al mismo tiempo
+        solicitar_exportacion(self.otro_medico, 'csv', FiltroConsultas({}, self.otro_medico))
+
+    def test_procesar_y_descargar_exportacion(self):
+        trabajo = solicitar_exportacion(self.medico, 'jsonl', FiltroConsultas({'todas': '1'}, self.medico))
+
+        call_command('procesar_exportaciones', una_vez=True, stdout=StringIO())
+
+        trabajo.refresh_from_db()
+        self.assertEqual(TrabajoExportacion.TERMINADO, trabajo.estado)
+        self.assertEqual(2, trabajo.total)
+        self.assertTrue(trabajo.archivo.name.endswith('.jsonl'))
+
+        self.client.login(clave='ISC221735', password='P@ssword123')
+        response = self.client.get(reverse('descargar_exportacion', args=[trabajo.pk]))
+        self.assertEqual(404, response.status_code)
+
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        response = self.client.get(reverse('descargar_exportacion', args=[trabajo.pk]))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(b''.join(response.streaming_content).splitlines()))
+        response.close()
+
+        # Terminada la exportación, el médico puede solicitar otra
+        solicitar_exportacion(self.medico, 'xlsx', FiltroConsultas({}, self.medico))
+
+        # Sin el archivo (otro proceso con otro MEDIA_ROOT) la descarga es un 404
+        shutil.rmtree(self.media)
+        response = self.client.get(reverse('descargar_exportacion', args=[trabajo.pk]))
+        self.assertEqual(404, response.status_code)
+
+    def test_exportacion_interrumpida(self):
+        solicitar_exportacion(self.medico, 'csv', FiltroConsultas({}, self.medico))
+        trabajo = TrabajoExportacion.objects.tomar_siguiente()
+        self.assertEqual(TrabajoExportacion.PROCESANDO, trabajo.estado)
+        self.assertIsNone(TrabajoExportacion.objects.tomar_siguiente())
+
+        self.assertEqual(0, TrabajoExportacion.objects.expirar_interrumpidos(30))
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(actualizado=timezone.now() - timedelta(hours=1))
+        self.assertEqual(1, TrabajoExportacion.objects.expirar_interrumpidos(30))
+
+        trabajo.refresh_from_db()
+        self.assertEqual('La exportación se interrumpió.', trabajo.error)
+        solicitar_exportacion(self.medico, 'csv', FiltroConsultas({}, self.medico))
+
+    def test_exportacion_larga_renueva_actualizado(self):
+        from . import exportacion, trabajos
+
+        solicitar_exportacion(self.medico, 'csv', FiltroConsultas({'todas': '1'}, self.medico))
+        trabajo = TrabajoExportacion.objects.tomar_siguiente()
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(actualizado=hace_una_hora)
+        trabajo.refresh_from_db()
+
+        vistos = []
+
+        def escribir(*args, **kwargs):
+            # Lo que vería otro proceso que revisa los trabajos interrumpidos a la mitad
+            total = escribir_exportacion(*args, **kwargs)
+            vistos.append(TrabajoExportacion.objects.get(pk=trabajo.pk).actualizado)
+            return total
+
+        escribir_exportacion = exportacion.escribir_exportacion
+        with mock.patch.object(exportacion, 'TAMANO_BLOQUE', 1), \
+                mock.patch.object(trabajos, 'escribir_exportacion', escribir):
+            trabajos.procesar(trabajo)
+
+        self.assertGreater(vistos[0], hace_una_hora + timedelta(minutes=30))
+        trabajo.refresh_from_db()
+        self.assertEqual(TrabajoExportacion.TERMINADO, trabajo.estado)
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class PaginacionCursorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_usuario('ISC221733')
+        cls.medico = crear_usuario('ISC221734', 'medico')
+        categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='IRAS')[0]
+        for i in range(45):
+            consulta = Consulta.objects.create(
+                padecimiento_actual=f'Consulta {i}',
+                categoria_de_padecimiento=categoria,
+                clave_paciente=cls.paciente,
+                clave_medico=cls.medico
+            )
+            # Varias consultas comparten fecha para probar el desempate por id
+            Consulta.objects.filter(pk=consulta.pk).update(fecha=f'2024-01-{i // 3 + 1:02d}T10:00:00-06:00')
+        cls.orden = list(Consulta.objects.order_by('-fecha', '-id_consulta').values_list('pk', flat=True))
+
+    def test_recorrer_paginas_hacia_adelante_y_atras(self):
+        paginas = []
+        pagina = paginar_por_cursor(Consulta.objects.all(), tamano=10)
+        self.assertIsNone(pagina.anterior)
+        paginas.append([c.pk for c in pagina])
+        while pagina.siguiente:
+            with self.assertNumQueries(1):
+                pagina = paginar_por_cursor(Consulta.objects.all(), pagina.siguiente, tamano=10)
+            paginas.append([c.pk for c in pagina])
+        self.assertEqual(self.orden, [pk for ids in paginas for pk in ids])
+        self.assertEqual([10, 10, 10, 10, 5], [len(ids) for ids in paginas])
+
+        regreso = [[c.pk for c in pagina]]
+        while pagina.anterior:
+            pagina = paginar_por_cursor(Consulta.objects.all(), pagina.anterior, tamano=10)
+            regreso.append([c.pk for c in pagina])
+        self.assertEqual(paginas, regreso[::-1])
+
+    def test_cursor_invalido_muestra_primera_pagina(self):
+        pagina = paginar_por_cursor(Consulta.objects.all(), 'no-es-un-cursor', tamano=10)
+        self.assertEqual(self.orden[:10], [c.pk for c in pagina])
+
+    def test_vistas_usan_cursor(self):
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        response = self.client.get(reverse('medico_consultas'), {'fecha_inicio': '2024-01-01'})
+        self.assertEqual(20, len(response.context['consultas']))
+        siguiente = response.context['consultas'].siguiente
+        self.assertContains(response, f'fecha_inicio=2024-01-01&cursor={siguiente}')
+
+        response = self.client.get(reverse('medico_consultas'), {'cursor': siguiente})
+        self.assertEqual(self.orden[20:40], [c.pk for c in response.context['consultas']])
+
+        self.client.login(clave='ISC221733', password='P@ssword123')
+        response = self.client.get(reverse('paciente_consultas'))
+        self.assertEqual(self.orden[:20], [c.pk for c in response.context['consultas']])
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class PacienteResumenTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_usuario('1000', 'medico')
+        cls.pacientes = [
+            crear_usuario(f'ISC22{i:04d}')
+            for i in range(3)
+        ]
+        cls.categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='IRAS')[0]
+
+    def crear_consulta(self, paciente, peso):
+        return self.client.post(reverse('crear_consulta'), {
+            'clave_paciente': paciente.clave,
+            'padecimiento_actual': 'Dolor de garganta',
+            'categoria_de_padecimiento': self.categoria.pk,
+            'peso': peso,
+            'talla': '1.70',
+            'presion_arterial': '120/80',
+        })
+
+    def test_crear_consulta_actualiza_resumen(self):
+        paciente = self.pacientes[0]
+        self.client.force_login(self.medico)
+        self.crear_consulta(paciente, '80.0')
+        self.crear_consulta(paciente, '75.0')
+
+        resumen = PacienteResumen.objects.get(paciente=paciente)
+        ultima = Consulta.objects.filter(clave_paciente=paciente).first()
+        self.assertEqual(2, resumen.total_consultas)
+        self.assertEqual(ultima.pk, resumen.ultima_consulta_id)
+        self.assertEqual(ultima.fecha, resumen.fecha_ultima_consulta)
+        self.assertEqual(75, resumen.peso)
+        self.assertEqual(25.95, resumen.imc)
+
+        # Al borrar la última consulta el resumen vuelve a la anterior
+        ultima.delete()
+        resumen.refresh_from_db()
+        self.assertEqual(1, resumen.total_consultas)
+        self.assertEqual(80, resumen.peso)
+
+    def test_reconstruir_resumenes(self):
+        for i, paciente in enumerate(self.pacientes[:2]):
+            for peso in range(60, 63 + i):
+                consulta = Consulta.objects.create(
+                    padecimiento_actual='Revisión', categoria_de_padecimiento=self.categoria,
+                    clave_paciente=paciente, clave_medico=self.medico,
+                )
+                SignosVitales.objects.create(consulta=consulta, peso=peso)
+        PacienteResumen.objects.create(paciente=self.pacientes[2], total_consultas=5)
+
+        self.assertEqual(2, reconstruir_resumen_pacientes(tamano_bloque=1))
+        resumenes = {r.paciente_id: r for r in PacienteResumen.objects.all()}
+        self.assertEqual({self.pacientes[0].pk, self.pacientes[1].pk}, set(resumenes))
+        self.assertEqual((3, 62), (resumenes[self.pacientes[0].pk].total_consultas, resumenes[self.pacientes[0].pk].peso))
+        self.assertEqual((4, 63), (resumenes[self.pacientes[1].pk].total_consultas, resumenes[self.pacientes[1].pk].peso))
+
+        salida = StringIO()
+        call_command('reconstruir_resumen_pacientes', stdout=salida)
+        self.assertIn('2 resúmenes', salida.getvalue())
+
+    def test_historiales_sin_consultas_por_tarjeta(self):
+        self.client.force_login(self.medico)
+        for paciente in self.pacientes:
+            self.crear_consulta(paciente, '70.0')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('medico_historiales'))
+        self.assertContains(response, 'IMC 24.22', count=3)
+        tablas = [q['sql'] for q in consultas.captured_queries if 'consultas_pacienteresumen' in q['sql']]
+        self.assertEqual(1, len(tablas))
+
+    def test_historiales_por_prefijo_de_clave(self):
+        self.client.force_login(self.medico)
+        url = reverse('medico_historiales')
+        claves = lambda datos: [h.id_historial for h in self.client.get(url, datos).context['historiales']]
+        self.assertEqual(3, len(claves({'search': 'sc22'})))
+        self.assertEqual([], claves({'search': 'sc22', 'prefijo': '1'}))
+        self.assertEqual(['ISC220001'], claves({'search': 'isc220001', 'prefijo': '1'}))
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class TendenciasSignosTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_usuario('1000', 'medico')
+        cls.paciente = crear_usuario('ISC221733')
+        cls.categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='IRAS')[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.medico)
+
+    def crear_consulta(self, peso, presion='120/80'):
+        self.client.post(reverse('crear_consulta'), {
+            'clave_paciente': self.paciente.clave,
+            'padecimiento_actual': 'Revisión',
+            'categoria_de_padecimiento': self.categoria.pk,
+            'peso': peso,
+            'talla': '1.70',
+            'temperatura': '36.5',
+            'presion_arterial': presion,
+        })
+
+    def test_agrupar_visitas_consecutivas(self):
+        puntos = [(i, float(i), None) for i in range(450)]
+        agrupados, tamano = agrupar(puntos, max_puntos=200)
+        self.assertEqual(3, tamano)
+        self.assertEqual(150, len(agrupados))
+        self.assertEqual((2, 1.0, None), agrupados[0])
+        self.assertEqual((449, 448.0, None), agrupados[-1])
+        self.assertEqual((puntos, 1), agrupar(puntos, max_puntos=500))
+
+    def test_series_del_paciente(self):
+        self.crear_consulta('80.0')
+        self.crear_consulta('78.0', presion='130/85')
+        url = reverse('signos_paciente_datos', args=[self.paciente.clave])
+
+        response = self.client.get(url)
+        datos = response.json()
+        self.assertEqual(2, datos['puntos'])
+        self.assertEqual([80.0, 78.0], datos['series']['peso'])
+        self.assertEqual([27.68, 26.99], datos['series']['imc'])
+        self.assertEqual([120.0, 130.0], datos['series']['sistolica'])
+        self.assertEqual([80.0, 85.0], datos['series']['diastolica'])
+
+        # Sin cambios responde 304 al navegador y las series salen de la caché
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        self.assertFalse([q for q in consultas.captured_queries if 'consultas_signosvitales' in q['sql']])
+
+        # Una consulta nueva cambia la versión y con ella la llave de la caché
+        self.crear_consulta('76.0')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([80.0, 78.0, 76.0], response.json()['series']['peso'])
+
+    def test_signos_de_una_consulta_anterior(self):
+        self.crear_consulta('80.0')
+        self.crear_consulta('78.0')
+        url = reverse('signos_paciente_datos', args=[self.paciente.clave])
+        etag = self.client.get(url)['ETag']
+
+        # Editar los signos de la primera consulta, que no es la última del paciente
+        signos = SignosVitales.objects.get(consulta__clave_paciente=self.paciente, peso='80.0')
+        signos.peso = '81.0'
+        signos.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([81.0, 78.0], response.json()['series']['peso'])
+
+        # Agregar signos después a una consulta que no los tenía (sin pasar por `registrar_consulta`)
+        etag = response['ETag']
+        consulta = Consulta.objects.create(
+            padecimiento_actual='Revisión', categoria_de_padecimiento=self.categoria,
+            clave_paciente=self.paciente, clave_medico=self.medico,
+        )
+        SignosVitales.objects.create(consulta=consulta, peso='77.0')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, response.json()['puntos'])
+
+    def test_pagina_de_signos(self):
+        response = self.client.get(reverse('signos_paciente', args=[self.paciente.clave]))
+        self.assertContains(response, reverse('signos_paciente_datos', args=[self.paciente.clave]))
+        self.assertEqual(404, self.client.get(reverse('signos_paciente_datos', args=[self.medico.clave])).status_code)
+
+
+def plan_de_ejecucion(sql):
+    """
+    Devuelve el plan de `sql` como lista de líneas. En PostgreSQL se desactivan
+    los recorridos secuenciales y los ordenamientos para que el plan solo los
+    incluya cuando ningún índice sirve, sin depender del tamaño de los datos.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [fila[0] for fila in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [fila[-1] for fila in cursor.fetchall()]
+
+
+def problemas_del_plan(plan, tabla='consultas_consulta'):
+    """ Líneas del plan que indican un recorrido completo de `tabla` o un ordenamiento. """
+    problemas = []
+    for linea in plan:
+        if connection.vendor == 'postgresql':
+            if f'Seq Scan on {tabla}' in linea or linea.strip().lstrip('-> ').startswith('Sort'):
+                problemas.append(linea)
+        elif 'TEMP B-TREE' in linea or (linea.startswith(f'SCAN {tabla}') and 'INDEX' not in linea):
+            problemas.append(linea)
+    return problemas
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class PlanesConsultaTestCase(TestCase):
+    """
+    Ejecuta las vistas principales contra un conjunto de datos sembrado y revisa
+    el plan de cada consulta a `consultas_consulta`: ninguna debe recorrer la
+    tabla completa ni ordenar en memoria.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Varios médicos y pacientes para que filtrar por uno de ellos sea selectivo
+        cls.medicos = [
+            crear_usuario(f'{1000 + i}', 'medico')
+            for i in range(10)
+        ]
+        cls.pacientes = [
+            crear_usuario(f'ISC22{i:04d}')
+            for i in range(20)
+        ]
+        categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='IRAS')[0]
+        Consulta.objects.bulk_create([
+            Consulta(
+                padecimiento_actual=f'Consulta {i}',
+                categoria_de_padecimiento=categoria,
+                clave_paciente=cls.pacientes[i % 20],
+                clave_medico=cls.medicos[i % 10],
+            )
+            for i in range(1000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertPlanesSinRecorridoNiOrden(self, url, parametros=None):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url, parametros or {})
+        self.assertEqual(200, response.status_code)
+        revisadas = 0
+        for consulta in consultas.captured_queries:
+            sql = consulta['sql']
+            if not sql.startswith('SELECT') or 'consultas_consulta' not in sql:
+                continue
+            plan = plan_de_ejecucion(sql)
+            self.assertEqual([], problemas_del_plan(plan), f'{sql}\n' + '\n'.join(plan))
+            revisadas += 1
+        self.assertGreater(revisadas, 0)
+        return response
+
+    def test_consultas_del_medico(self):
+        self.client.login(clave='1000', password='P@ssword123')
+        response = self.assertPlanesSinRecorridoNiOrden(reverse('medico_consultas'))
+        self.assertPlanesSinRecorridoNiOrden(
+            reverse('medico_consultas'), {'cursor': response.context['consultas'].siguiente}
+        )
+        self.assertPlanesSinRecorridoNiOrden(reverse('medico_consultas'), {'todas': '1'})
+
+    def test_consultas_del_paciente(self):
+        self.client.login(clave='ISC220000', password='P@ssword123')
+        response = self.assertPlanesSinRecorridoNiOrden(reverse('paciente_consultas'))
+        self.assertPlanesSinRecorridoNiOrden(
+            reverse('paciente_consultas'), {'cursor': response.context['consultas'].siguiente}
+        )
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class BusquedaTextoTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_usuario('ISC221733')
+        cls.medico = crear_usuario('ISC221734', 'medico')
+        cls.categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='CEFALEA')[0]
+
+    def _crear(self, padecimiento, tratamiento=''):
+        return Consulta.objects.create(
+            padecimiento_actual=padecimiento,
+            tratamiento_farmacologico_recetado=tratamiento,
+            categoria_de_padecimiento=self.categoria,
+            clave_paciente=self.paciente,
+            clave_medico=self.medico
+        )
+
+    def _buscar(self, texto):
+        return list(buscar_texto(Consulta.objects.all(), texto).order_by('-rango', '-id_consulta').values_list('pk', flat=True))
+
+    def test_busqueda_por_relevancia(self):
+        poco = self._crear('Fiebre y tos', 'Paracetamol 500 mg')
+        mucho = self._crear('Dolor de cabeza, la cabeza punza', 'Paracetamol')
+        nada = self._crear('Esguince de tobillo', 'Reposo')
+
+        self.assertEqual([mucho.pk], self._buscar('cabeza'))
+        self.assertEqual({poco.pk, mucho.pk}, set(self._buscar('paracetamol')))
+        self.assertEqual([mucho.pk], self._buscar('cabeza paracetamol'))
+        self.assertEqual([], self._buscar('"; DROP TABLE'))
+
+        # Los triggers mantienen el índice al editar y borrar
+        nada.padecimiento_actual = 'Dolor de cabeza leve'
+        nada.save()
+        self.assertEqual(mucho.pk, self._buscar('cabeza')[0])
+        self.assertIn(nada.pk, self._buscar('cabeza'))
+        mucho.delete()
+        self.assertEqual([nada.pk], self._buscar('cabeza'))
+
+    def test_lista_de_consultas_paginada_por_relevancia(self):
+        for i in range(25):
+            self._crear('Migraña ' + 'cabeza ' * (i % 5 + 1))
+        self._crear('Fractura de brazo')
+
+        self.client.login(clave='ISC221734', password='P@ssword123')
+        response = self.client.get(reverse('medico_consultas'), {'q': 'cabeza'})
+        primera = list(response.context['consultas'])
+        self.assertEqual(20, len(primera))
+        self.assertContains(response, 'q=cabeza&cursor=')
+
+        response = self.client.get(
+            reverse('medico_consultas'), {'q': 'cabeza', 'cursor': response.context['consultas'].siguiente}
+        )
+        segunda = list(response.context['consultas'])
+        self.assertEqual(5, len(segunda))
+        self.assertEqual(self._buscar('cabeza'), [c.pk for c in primera + segunda])
+
+
+@override_settings(RATELIMIT_ENABLE=False, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], STORAGES=STORAGES_PRUEBAS)
+class ConsultaAdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(
+            clave='admin1', nombres='ADMIN', email='admin1@admin.com', apellido_paterno='ADMIN', password='P@ssword123',
+        )
+        cls.categoria = CategoriaPadecimiento.objects.get_or_create(padecimiento='IRAS')[0]
+        cls.medico = crear_usuario('1234', 'medico')
+        cls.crear_consultas(range(5))
+
+    @classmethod
+    def crear_consultas(cls, numeros):
+        for i in numeros:
+            paciente = crear_usuario(f'ISC22{i:04d}')
+            Consulta.objects.create(
+                padecimiento_actual=f'Consulta {i}', categoria_de_padecimiento=cls.categoria,
+                clave_paciente=paciente, clave_medico=cls.medico,
+            )
+
+    def consultas_de(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return response, len(consultas)
+
+    def test_lista_no_crece_con_usuarios_ni_consultas(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:consultas_consulta_changelist')
+        _, antes = self.consultas_de(url)
+        self.crear_consultas(range(5, 30))
+        response, despues = self.consultas_de(url)
+
+        self.assertEqual(antes, despues)
+        # El filtro lateral no enumera a los pacientes
+        self.assertNotContains(response, 'clave_paciente__clave__exact=ISC22')
+        self.assertContains(response, 'data-field-name="clave_paciente"')
+        self.assertContains(response, 'admin/js/autocomplete.js')
+        # Dos filtros de autocompletado, pero el script de navegación se incluye una vez
+        self.assertContains(response, 'data-url-seleccion=', count=2)
+        self.assertContains(response, 'js/filtro_autocompletar.js', count=1)
+
+    def test_filtrar_por_paciente(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:consultas_consulta_changelist'), {'clave_paciente__clave__exact': 'ISC220003'}
+        )
+        self.assertEqual(['Consulta 3'], [c.padecimiento_actual for c in response.context['cl'].result_list])
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'consultas', 'model_name': 'consulta', 'field_name': 'clave_paciente', 'term': 'ISC220003',
+        })
+        self.assertEqual(['ISC220003'], [resultado['id'] for resultado in response.json()['results']])
@@ -0,0 +1,60 @@
+"""
+Exportaciones de consultas en segundo plano.
+
+Las vistas solo registran un `TrabajoExportacion`; el comando
+`procesar_exportaciones` los toma en orden de llegada (ver
+`sistema_medico/trabajos.py`), escribe el archivo en `MEDIA_ROOT` y deja el
+trabajo como terminado para que el médico lo descargue.
+"""
+import logging
+import tempfile
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .exportacion import escribir_exportacion
+from .filtros import FiltroConsultas
+from .models import Consulta, TrabajoExportacion
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExportacionEnCurso(Exception):
+    """ El médico ya tiene una exportación pendiente o en proceso. """
+
+
+def solicitar_exportacion(medico, formato, filtros):
+    """
+    Registra una exportación para `medico` con los filtros de la lista de consultas.
+    La restricción `una_exportacion_activa_por_medico` impide que haya dos activas.
+    """
+    try:
+        with transaction.atomic():
+            return TrabajoExportacion.objects.create(medico=medico, formato=formato, filtros=filtros.datos())
+    except IntegrityError:
+        raise ExportacionEnCurso('Ya tienes una exportación en proceso.')
+
+
+def procesar(trabajo):
+    """ Genera el archivo de la exportación y actualiza su estado. """
+    consultas = FiltroConsultas(trabajo.filtros, trabajo.medico).aplicar(Consulta.objects.all())
+    nombre = f"consultas_medicas_{timezone.localtime(trabajo.creado).strftime('%Y-%m-%d_%H%M')}.{trabajo.formato}"
+    try:
+        with tempfile.TemporaryFile() as archivo:
+            # Una exportación larga sigue viva mientras escriba bloques
+            total = escribir_exportacion(consultas, trabajo.formato, archivo, avance=trabajo.registrar_avance)
+            archivo.seek(0)
+            trabajo.archivo.save(nombre, File(archivo), save=False)
+    except Exception as e:
+        logger.exception('Falló la exportación %s', trabajo.pk)
+        trabajo.estado = TrabajoExportacion.ERROR
+        trabajo.error = str(e)
+    else:
+        trabajo.estado = TrabajoExportacion.TERMINADO
+        trabajo.total = total
+    trabajo.terminado = timezone.now()
+    trabajo.save()
+    return trabajo
+
@@ -4,5 +4,11 @@ from . import views
 urlpatterns = [
     path('crear_consulta/', views.crear_consulta_view, name='crear_consulta'),
     path('api/buscar-paciente/', views.buscar_paciente_por_clave_view, name='buscar_paciente'),
-    path('exportar-consultas/', views.exportar_consultas_excel, name='exportar_consultas_excel'),
+    path('api/pacientes/', views.autocompletar_pacientes_view, name='autocompletar_pacientes'),
+    path('pacientes/<str:clave>/signos/', views.signos_paciente_view, name='signos_paciente'),
+    path('api/pacientes/<str:clave>/signos/', views.signos_paciente_datos_view, name='signos_paciente_datos'),
+    path('exportar-consultas/', views.exportar_consultas, name='exportar_consultas'),
+    path('exportaciones/', views.exportaciones_view, name='exportaciones'),
+    path('exportaciones/solicitar/', views.solicitar_exportacion_view, name='solicitar_exportacion'),
+    path('exportaciones/<int:pk>/descargar/', views.descargar_exportacion_view, name='descargar_exportacion'),
 ]
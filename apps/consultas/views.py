@@ -1,19 +1,27 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import redirect, render
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect, render
 from django.http import JsonResponse
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control, never_cache
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
 
 from apps.usuarios.decorators import role_required
+from apps.usuarios.indice_pacientes import indice_pacientes
 from apps.usuarios.models import Usuario
 
 from .forms import ConsultaForm, SignosVitalesForm
 
-import pandas as pd
-from django.http import HttpResponse
-from .models import Consulta
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from .exportacion import escribir_xlsx, lineas_csv, lineas_jsonl
+from .filtros import FiltroConsultas
+from .models import Consulta, TrabajoExportacion
+from .resumen_paciente import registrar_consulta
+from .tendencias import series_signos, version_signos
+from .trabajos import ExportacionEnCurso, solicitar_exportacion
 from datetime import datetime
+import tempfile
 
 @never_cache
 @login_required
@@ -24,7 +32,7 @@ def crear_consulta_view(request):
     Solo accesible para usuarios con el rol de 'medico'.
     """
     # Verificar si el usuario tiene el rol 'medico'. Si no, redirigir al dashboard con un mensaje de error.
-    if not request.user.role.nombre_rol == 'medico':
+    if not request.user.role_id == 'medico':
         messages.error(request, 'Solo los médicos pueden crear consultas.')
         return redirect('dashboard')
     # Crear las instancias de los formularios con los datos enviados
@@ -35,25 +43,30 @@ def crear_consulta_view(request):
     if request.method == 'POST':
         # Validar ambos formularios
         if consulta_form.is_valid() and signos_form.is_valid():
-            clave = request.POST.get('clave_paciente_display').split('-')[0].strip()
+            # El autocompletado manda la clave elegida; el texto mostrado queda como respaldo
+            clave = request.POST.get('clave_paciente') or request.POST.get('clave_paciente_display', '').split('-')[0].strip()
             try:
                 paciente = Usuario.objects.get(clave=clave, role__nombre_rol='paciente', is_active=True)
             except Usuario.DoesNotExist:
                 messages.error(request, 'No se encontró un paciente con esa clave.')
                 return redirect('crear_consulta')
 
-            consulta = consulta_form.save(commit=False)
-            consulta.clave_medico = request.user
-            consulta.clave_paciente = paciente
-            consulta.save()
+            # La consulta, sus signos y el resumen del paciente se guardan juntos o no se guarda nada
+            with transaction.atomic():
+                consulta = consulta_form.save(commit=False)
+                consulta.clave_medico = request.user
+                consulta.clave_paciente = paciente
+                consulta.save()
 
-            signos_vitales = signos_form.save(commit=False)
-            signos_vitales.consulta = consulta
-            if signos_vitales.peso and signos_vitales.talla and signos_vitales.talla > 0: #Formula para calcular el imc
-                signos_vitales.imc = round(signos_vitales.peso / (signos_vitales.talla ** 2), 2)
-            else:
-                signos_vitales.imc = None
-            signos_vitales.save()
+                signos_vitales = signos_form.save(commit=False)
+                signos_vitales.consulta = consulta
+                if signos_vitales.peso and signos_vitales.talla and signos_vitales.talla > 0: #Formula para calcular el imc
+                    signos_vitales.imc = round(signos_vitales.peso / (signos_vitales.talla ** 2), 2)
+                else:
+                    signos_vitales.imc = None
+                signos_vitales.save()
+
+                registrar_consulta(consulta, signos_vitales)
 
             messages.success(request, 'Consulta registrada correctamente.')
             return redirect('medico_consultas')
@@ -69,6 +82,19 @@ def crear_consulta_view(request):
     })
 
 
+@login_required
+@role_required(['medico'])
+def autocompletar_pacientes_view(request):
+    """
+    Devuelve los pacientes activos cuya clave o nombre empieza con `q`.
+    Responde desde el índice en memoria de `indice_pacientes`, sin consultar la base de datos.
+    """
+    resultados = indice_pacientes.buscar(request.GET.get('q', ''))
+    response = JsonResponse({'resultados': resultados})
+    response['Cache-Control'] = 'private, max-age=30'
+    return response
+
+
 @csrf_exempt
 @never_cache
 @login_required
@@ -76,48 +102,132 @@ def crear_consulta_view(request):
 def buscar_paciente_por_clave_view(request):
     clave = request.GET.get('clave', '').lower()
     try:
-        paciente = Usuario.objects.get(clave__iexact=clave, role__nombre_rol='paciente', is_active=True)
-        return JsonResponse({'encontrado': True, 'clave': paciente.clave, 'nombre': paciente.nombres})
+        paciente = Usuario.objects.select_related('resumen').get(clave__iexact=clave, role__nombre_rol='paciente', is_active=True)
     except Usuario.DoesNotExist:
         return JsonResponse({'encontrado': False})
+    datos = {'encontrado': True, 'clave': paciente.clave, 'nombre': paciente.nombres}
+    # Sin consultas registradas el paciente todavía no tiene resumen
+    resumen = getattr(paciente, 'resumen', None)
+    if resumen:
+        datos.update({
+            'total_consultas': resumen.total_consultas,
+            'ultima_consulta': resumen.fecha_ultima_consulta,
+            'imc': resumen.imc,
+        })
+    return JsonResponse(datos)
 
 
 @login_required
 @role_required(['medico'])
-def exportar_consultas_excel(request):
-    # Obtener las consultas
-    consultas = Consulta.objects.select_related('clave_paciente', 'clave_medico', 'categoria_de_padecimiento')
-
-    # Convertir a una lista de diccionarios
-    data = []
-    for c in consultas:
-        data.append({
-            'ID Consulta': c.id_consulta,
-            'Fecha': c.fecha.strftime('%Y-%m-%d %H:%M'),
-            'Paciente': f"{c.clave_paciente.nombres} {c.clave_paciente.apellido_paterno} {c.clave_paciente.apellido_materno}" if c.clave_paciente else '—',
-            'Médico': f"{c.clave_medico.nombres} {c.clave_medico.apellido_paterno} {c.clave_medico.apellido_materno}" if c.clave_medico else '—',
-            'Categoría de padecimiento': c.categoria_de_padecimiento.padecimiento if c.categoria_de_padecimiento else '—',
-            'Padecimiento actual': c.padecimiento_actual,
-            'Tratamiento no farmacológico': c.tratamiento_no_farmacologico or '',
-            'Tratamiento farmacológico recetado': c.tratamiento_farmacologico_recetado or '',
-            'Peso': c.signos_vitales.peso,
-            'Talla': c.signos_vitales.talla,
-            'Temperatura': c.signos_vitales.temperatura,
-            'Frecuencia cardíaca': c.signos_vitales.frecuencia_cardiaca,
-            'Frecuencia respiratoria': c.signos_vitales.frecuencia_respiratoria,
-            'Presión arterial': c.signos_vitales.presion_arterial,
-            'IMC': c.signos_vitales.imc,
-        })
+def exportar_consultas(request):
+    """
+    Exporta las consultas que coinciden con los filtros de la lista del médico.
 
-    # Crear el DataFrame
-    df = pd.DataFrame(data)
-    fecha_y_hora_actual = datetime.now().strftime('%Y-%m-%d %H:%M')
+    El parámetro `formato` elige entre `xlsx` (por defecto), `csv` y `jsonl`.
+    CSV y JSON Lines se envían conforme se leen las filas; el libro de Excel se
+    escribe por bloques en un archivo temporal y se envía al terminar.
+    """
+    filtros = FiltroConsultas(request.GET, request.user)
+    consultas = filtros.aplicar(Consulta.objects.all())
+    formato = request.GET.get('formato', 'xlsx')
+    nombre = f"consultas_medicas_{datetime.now().strftime('%Y-%m-%d %H:%M')}"
+
+    if formato == 'csv':
+        response = StreamingHttpResponse(lineas_csv(consultas), content_type='text/csv; charset=utf-8')
+    elif formato == 'jsonl':
+        response = StreamingHttpResponse(lineas_jsonl(consultas), content_type='application/x-ndjson; charset=utf-8')
+    elif formato == 'xlsx':
+        archivo = tempfile.TemporaryFile()
+        escribir_xlsx(consultas, archivo)
+        archivo.seek(0)
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=f'{nombre}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    else:
+        raise Http404('Formato de exportación no soportado')
+
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return response
+
+
+@require_POST
+@login_required
+@role_required(['medico'])
+def solicitar_exportacion_view(request):
+    """
+    Registra una exportación con los filtros actuales para que la genere el
+    comando `procesar_exportaciones` sin ocupar el proceso web.
+    """
+    formato = request.POST.get('formato', 'xlsx')
+    if formato not in dict(TrabajoExportacion.FORMATOS):
+        raise Http404('Formato de exportación no soportado')
+    try:
+        solicitar_exportacion(request.user, formato, FiltroConsultas(request.POST, request.user))
+        messages.success(request, 'La exportación se está generando. Podrás descargarla desde esta página.')
+    except ExportacionEnCurso as e:
+        messages.warning(request, str(e))
+    return redirect('exportaciones')
 
-    # Exportar a Excel (en memoria)
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=consultas_medicas_{fecha_y_hora_actual}.xlsx'
 
-    with pd.ExcelWriter(response, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Consultas Médicas')
+@never_cache
+@login_required
+@role_required(['medico'])
+def exportaciones_view(request):
+    """ Lista las exportaciones recientes del médico con su estado y enlace de descarga. """
+    exportaciones = list(TrabajoExportacion.objects.filter(medico=request.user)[:20])
+    return render(request, 'exportaciones.html', {
+        'exportaciones': exportaciones,
+        'hay_activas': any(trabajo.activo for trabajo in exportaciones),
+    })
+
+
+@login_required
+@role_required(['medico'])
+def descargar_exportacion_view(request, pk):
+    """ Descarga el archivo de una exportación terminada; solo su autor puede hacerlo. """
+    trabajo = get_object_or_404(
+        TrabajoExportacion, pk=pk, medico=request.user, estado=TrabajoExportacion.TERMINADO
+    )
+    if not trabajo.archivo:
+        raise Http404('La exportación no tiene archivo')
+    try:
+        archivo = trabajo.archivo.open('rb')
+    except FileNotFoundError:
+        # El proceso que la generó escribió en un MEDIA_ROOT que este no ve
+        raise Http404('El archivo de la exportación no está disponible')
+    return FileResponse(archivo, as_attachment=True, filename=trabajo.archivo.name.rsplit('/', 1)[-1])
+
+
+def _version_signos(request, clave):
+    """ Calcula la versión de los signos una sola vez por petición (la usan el ETag y la caché). """
+    if not hasattr(request, '_version_signos'):
+        request._version_signos = version_signos(clave)
+    return request._version_signos
+
 
-    return response
\ No newline at end of file
+@never_cache
+@login_required
+@role_required(['medico'])
+def signos_paciente_view(request, clave):
+    """ Página con las gráficas de tendencia de los signos vitales de un paciente. """
+    paciente = get_object_or_404(
+        Usuario.objects.select_related('resumen'), clave=clave, role__nombre_rol='paciente'
+    )
+    return render(request, 'signos_paciente.html', {'paciente': paciente})
+
+
+@cache_control(private=True, no_cache=True)
+@login_required
+@role_required(['medico'])
+@condition(etag_func=lambda request, clave: _version_signos(request, clave))
+def signos_paciente_datos_view(request, clave):
+    """
+    Devuelve en JSON las series de peso, IMC, temperatura y presión arterial del
+    paciente, ya agrupadas si tiene muchas consultas.
+    """
+    if not Usuario.objects.filter(clave=clave, role__nombre_rol='paciente').exists():
+        raise Http404('Paciente no encontrado')
+    return JsonResponse(series_signos(clave, _version_signos(request, clave)))
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class EstadisticasConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.estadisticas'
+
+    def ready(self):
+        import apps.estadisticas.signals
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from ...resumenes import (
+    reconstruir_resumen_consultas,
+    reconstruir_resumen_habitos,
+    reconstruir_resumen_usuarios,
+)
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero las tablas de resumen usadas por el dashboard médico'
+
+    def handle(self, *args, **options):
+        reconstruir_resumen_consultas()
+        self.stdout.write('Resumen de consultas reconstruido')
+
+        reconstruir_resumen_usuarios()
+        self.stdout.write('Resumen de usuarios por área reconstruido')
+
+        reconstruir_resumen_habitos()
+        self.stdout.write('Resumen de hábitos reconstruido')
+
+        self.stdout.write(self.style.SUCCESS('Resúmenes del dashboard actualizados'))
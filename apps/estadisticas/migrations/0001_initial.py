@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('usuarios', '0010_contactoemergencia_and_more'),
+        ('consultas', '0006_signosvitales_imc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenHabitos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('habito', models.CharField(max_length=40, unique=True)),
+                ('total', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenUsuariosArea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('area', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.area')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenPacientesAtendidos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sexo', models.CharField(blank=True, max_length=1, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('area', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.area')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenConsultasDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('sexo', models.CharField(blank=True, max_length=1, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('area', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.area')),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='consultas.categoriapadecimiento')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resumenpacientesatendidos',
+            constraint=models.UniqueConstraint(fields=('area', 'sexo'), name='unique_resumen_pacientes_atendidos'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenconsultasdiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'categoria', 'area', 'sexo'), name='unique_resumen_consultas_diario'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:14
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def llenar_resumen_consultas(apps, schema_editor):
+    """ El total por categoría, área y sexo es la suma de los días del resumen diario. """
+    ResumenConsultasDiario = apps.get_model('estadisticas', 'ResumenConsultasDiario')
+    ResumenConsultas = apps.get_model('estadisticas', 'ResumenConsultas')
+    filas = (
+        ResumenConsultasDiario.objects.values('categoria_id', 'area_id', 'sexo')
+        .annotate(suma=Sum('total'))
+        .order_by()
+    )
+    ResumenConsultas.objects.bulk_create([
+        ResumenConsultas(categoria_id=f['categoria_id'], area_id=f['area_id'], sexo=f['sexo'], total=f['suma'])
+        for f in filas
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0010_contactoemergencia_and_more'),
+        ('consultas', '0006_signosvitales_imc'),
+        ('estadisticas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenConsultas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sexo', models.CharField(blank=True, max_length=1, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('area', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.area')),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='consultas.categoriapadecimiento')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resumenconsultas',
+            constraint=models.UniqueConstraint(fields=('categoria', 'area', 'sexo'), name='unique_resumen_consultas'),
+        ),
+        # Al revertir, el resumen diario queda vacío; `reconstruir_resumenes` lo vuelve a llenar
+        migrations.RunPython(llenar_resumen_consultas, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='ResumenConsultasDiario',
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:39
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+def fusionar_duplicados(apps, schema_editor):
+    """ Suma en una sola fila las que se duplicaron con llaves NULL antes de esta restricción. """
+    for modelo, llaves in (
+        ('ResumenConsultas', ('categoria_id', 'area_id', 'sexo')),
+        ('ResumenPacientesAtendidos', ('area_id', 'sexo')),
+        ('ResumenUsuariosArea', ('area_id',)),
+    ):
+        Modelo = apps.get_model('estadisticas', modelo)
+        filas = {}
+        for fila in Modelo.objects.order_by('pk'):
+            llave = tuple(getattr(fila, campo) for campo in llaves)
+            if llave in filas:
+                filas[llave].total += fila.total
+                filas[llave].save(update_fields=['total'])
+                fila.delete()
+            else:
+                filas[llave] = fila
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estadisticas', '0002_resumenconsultas_delete_resumenconsultasdiario'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='resumenconsultas',
+            name='unique_resumen_consultas',
+        ),
+        migrations.RemoveConstraint(
+            model_name='resumenpacientesatendidos',
+            name='unique_resumen_pacientes_atendidos',
+        ),
+        migrations.RunPython(fusionar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='resumenconsultas',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('categoria', models.Value(0)), django.db.models.functions.comparison.Coalesce('area', models.Value('')), django.db.models.functions.comparison.Coalesce('sexo', models.Value('')), name='unique_resumen_consultas'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenpacientesatendidos',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('area', models.Value('')), django.db.models.functions.comparison.Coalesce('sexo', models.Value('')), name='unique_resumen_pacientes_atendidos'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenusuariosarea',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('area', models.Value('')), name='unique_resumen_usuarios_area'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+
+from apps.consultas.models import CategoriaPadecimiento
+from apps.usuarios.models import Area
+
+
+class ResumenConsultas(models.Model):
+    """
+    Total de consultas agrupadas por categoría de padecimiento, área y sexo del paciente.
+
+    Las gráficas del dashboard leen estas filas (a lo más categorías × áreas × sexos)
+    en lugar de recorrer la tabla de consultas completa.
+    """
+    categoria = models.ForeignKey(CategoriaPadecimiento, on_delete=models.CASCADE, null=True, blank=True)
+    area = models.ForeignKey(Area, on_delete=models.CASCADE, null=True, blank=True)
+    sexo = models.CharField(max_length=1, null=True, blank=True)
+    total = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Con COALESCE las llaves con NULL también son únicas; si no, dos inserciones
+        # simultáneas de la misma fila sin área o sin sexo la duplicarían
+        constraints = [
+            models.UniqueConstraint(
+                Coalesce('categoria', Value(0)), Coalesce('area', Value('')), Coalesce('sexo', Value('')),
+                name='unique_resumen_consultas',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.categoria_id} - {self.area_id} - {self.sexo}: {self.total}'
+
+
+class ResumenPacientesAtendidos(models.Model):
+    """
+    Número de pacientes distintos con al menos una consulta,
+    agrupados por área y sexo.
+    """
+    area = models.ForeignKey(Area, on_delete=models.CASCADE, null=True, blank=True)
+    sexo = models.CharField(max_length=1, null=True, blank=True)
+    total = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                Coalesce('area', Value('')), Coalesce('sexo', Value('')),
+                name='unique_resumen_pacientes_atendidos',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.area_id} - {self.sexo}: {self.total}'
+
+
+class ResumenUsuariosArea(models.Model):
+    """
+    Número de usuarios registrados en cada área o puesto; la fila con `area`
+    NULL cuenta a los usuarios sin área.
+    """
+    area = models.OneToOneField(Area, on_delete=models.CASCADE, null=True, blank=True)
+    total = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # La unicidad de OneToOneField no impide dos filas con `area` NULL
+        constraints = [
+            models.UniqueConstraint(Coalesce('area', Value('')), name='unique_resumen_usuarios_area')
+        ]
+
+    def __str__(self):
+        return f'{self.area_id}: {self.total}'
+
+
+class ResumenHabitos(models.Model):
+    """
+    Número de pacientes activos que reportan cada hábito del historial médico.
+    El campo `habito` guarda el nombre del campo booleano de `HistorialMedico`.
+    """
+    habito = models.CharField(max_length=40, unique=True)
+    total = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.habito}: {self.total}'
@@ -0,0 +1,178 @@
+"""
+Mantenimiento de las tablas de resumen usadas por el dashboard médico.
+
+Las señales de `signals.py` ajustan los totales de forma incremental cada vez
+que cambia una consulta, un usuario o un historial. Las funciones
+`reconstruir_*` recalculan las tablas desde cero con agregaciones en la base
+de datos y las usa el comando `reconstruir_resumenes`.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import Now
+
+from apps.consultas.models import Consulta
+from apps.usuarios.models import HistorialMedico, Usuario
+
+from .models import (
+    ResumenConsultas,
+    ResumenHabitos,
+    ResumenPacientesAtendidos,
+    ResumenUsuariosArea,
+)
+
+
+# Campo booleano de HistorialMedico -> etiqueta mostrada en la gráfica
+HABITOS = {
+    'usa_cigarro': 'Fuman',
+    'ingiere_alcohol': 'Ingiere alcohol',
+    'usa_drogas': 'Usa drogas',
+    'es_embarazada': 'Embarazadas',
+    'usa_lentes': 'Usa lentes',
+    'vida_sexual_activa': 'Vida sexual activa',
+    'usa_metodos_anticonceptivos': 'Usa métodos anticonceptivos',
+}
+
+
+def _ajustar(modelo, delta, **claves):
+    """
+    Suma `delta` al total de la fila identificada por `claves`, creándola si no existe.
+    En el caso común (la fila ya existe) solo cuesta un UPDATE.
+    """
+    if not delta:
+        return
+    if modelo.objects.filter(**claves).update(total=F('total') + delta, actualizado=Now()):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(total=max(delta, 0), **claves)
+    except IntegrityError:
+        # Otra petición creó la fila al mismo tiempo
+        modelo.objects.filter(**claves).update(total=F('total') + delta, actualizado=Now())
+
+
+def datos_paciente(clave):
+    """ Devuelve (área, sexo) del paciente, o (None, None) si ya no existe. """
+    return Usuario.objects.filter(pk=clave).values_list('carrera_o_puesto_id', 'sexo').first() or (None, None)
+
+
+def ajustar_consulta(categoria_id, area_id, sexo, delta):
+    _ajustar(ResumenConsultas, delta, categoria_id=categoria_id, area_id=area_id, sexo=sexo)
+
+
+def recalcular_pacientes_atendidos(area_id, sexo):
+    """
+    Recalcula cuántos pacientes de un área y sexo tienen al menos una consulta.
+    Solo se invoca cuando un paciente gana su primera consulta, pierde la última
+    o cambia de área/sexo, por lo que el costo no depende del volumen de consultas.
+    """
+    total = Usuario.objects.filter(
+        carrera_o_puesto_id=area_id,
+        sexo=sexo,
+    ).filter(
+        Exists(Consulta.objects.filter(clave_paciente=OuterRef('pk')))
+    ).count()
+    ResumenPacientesAtendidos.objects.update_or_create(area_id=area_id, sexo=sexo, defaults={'total': total})
+
+
+def mover_consultas_paciente(clave, anterior, nuevo):
+    """
+    Reasigna las consultas de un paciente cuando cambia su área o sexo.
+    `anterior` y `nuevo` son tuplas (área, sexo).
+    """
+    grupos = (
+        Consulta.objects.filter(clave_paciente_id=clave)
+        .values('categoria_de_padecimiento_id')
+        .annotate(total=Count('id_consulta'))
+        .order_by()
+    )
+    for grupo in grupos:
+        for (area_id, sexo), signo in ((anterior, -1), (nuevo, 1)):
+            _ajustar(
+                ResumenConsultas, signo * grupo['total'],
+                categoria_id=grupo['categoria_de_padecimiento_id'], area_id=area_id, sexo=sexo,
+            )
+    if grupos:
+        recalcular_pacientes_atendidos(*anterior)
+        recalcular_pacientes_atendidos(*nuevo)
+
+
+def ajustar_usuarios_area(area_id, delta):
+    _ajustar(ResumenUsuariosArea, delta, area_id=area_id)
+
+
+def ajustar_habitos(deltas):
+    """
+    Aplica los cambios de `deltas` ({campo_habito: delta}) con un solo UPDATE.
+    """
+    deltas = {habito: delta for habito, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    actualizados = ResumenHabitos.objects.filter(habito__in=deltas).update(
+        total=F('total') + Case(
+            *[When(habito=habito, then=Value(delta)) for habito, delta in deltas.items()],
+            default=Value(0),
+        ),
+        actualizado=Now(),
+    )
+    if actualizados < len(deltas):
+        existentes = set(ResumenHabitos.objects.filter(habito__in=deltas).values_list('habito', flat=True))
+        for habito in deltas.keys() - existentes:
+            _ajustar(ResumenHabitos, deltas[habito], habito=habito)
+
+
+def habitos_de(valores, signo=1):
+    """ Convierte los valores de un historial en deltas para `ajustar_habitos`. """
+    return {habito: signo for habito in HABITOS if valores.get(habito)}
+
+
+def reconstruir_resumen_consultas():
+    filas = (
+        Consulta.objects.values('categoria_de_padecimiento_id', 'clave_paciente__carrera_o_puesto_id', 'clave_paciente__sexo')
+        .annotate(total=Count('id_consulta'))
+        .order_by()
+    )
+    atendidos = (
+        Consulta.objects.values('clave_paciente__carrera_o_puesto_id', 'clave_paciente__sexo')
+        .annotate(total=Count('clave_paciente', distinct=True))
+        .order_by()
+    )
+    with transaction.atomic():
+        ResumenConsultas.objects.all().delete()
+        ResumenConsultas.objects.bulk_create([
+            ResumenConsultas(
+                categoria_id=f['categoria_de_padecimiento_id'],
+                area_id=f['clave_paciente__carrera_o_puesto_id'],
+                sexo=f['clave_paciente__sexo'],
+                total=f['total'],
+            )
+            for f in filas
+        ])
+        ResumenPacientesAtendidos.objects.all().delete()
+        ResumenPacientesAtendidos.objects.bulk_create([
+            ResumenPacientesAtendidos(
+                area_id=f['clave_paciente__carrera_o_puesto_id'],
+                sexo=f['clave_paciente__sexo'],
+                total=f['total'],
+            )
+            for f in atendidos
+        ])
+
+
+def reconstruir_resumen_usuarios():
+    filas = Usuario.objects.values('carrera_o_puesto_id').annotate(total=Count('clave')).order_by()
+    with transaction.atomic():
+        ResumenUsuariosArea.objects.all().delete()
+        ResumenUsuariosArea.objects.bulk_create([
+            ResumenUsuariosArea(area_id=f['carrera_o_puesto_id'], total=f['total']) for f in filas
+        ])
+
+
+def reconstruir_resumen_habitos():
+    totales = HistorialMedico.objects.filter(paciente__is_active=True).aggregate(
+        **{habito: Count('pk', filter=Q(**{habito: True})) for habito in HABITOS}
+    )
+    with transaction.atomic():
+        ResumenHabitos.objects.all().delete()
+        ResumenHabitos.objects.bulk_create([
+            ResumenHabitos(habito=habito, total=total) for habito, total in totales.items()
+        ])
@@ -0,0 +1,150 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.consultas.models import CategoriaPadecimiento, Consulta
+from apps.usuarios.models import Area, HistorialMedico, Usuario
+
+from . import resumenes
+
+
+CAMPOS_USUARIO = ('carrera_o_puesto_id', 'sexo', 'is_active')
+
+
+def _datos_paciente_consulta(consulta):
+    """ Usa el paciente ya cargado en la consulta si está disponible para evitar una consulta extra. """
+    if Consulta.clave_paciente.is_cached(consulta):
+        paciente = consulta.clave_paciente
+        return paciente.carrera_o_puesto_id, paciente.sexo
+    return resumenes.datos_paciente(consulta.clave_paciente_id)
+
+
+def _paciente_activo(historial):
+    if historial.paciente_id is None:
+        return False
+    if HistorialMedico.paciente.is_cached(historial):
+        return historial.paciente.is_active
+    return Usuario.objects.filter(pk=historial.paciente_id, is_active=True).exists()
+
+
+@receiver(pre_save, sender=Consulta)
+def recordar_consulta_anterior(sender, instance, **kwargs):
+    """ Guarda los datos de la consulta antes de modificarla para poder mover su conteo. """
+    instance._resumen_anterior = None
+    if not instance._state.adding:
+        instance._resumen_anterior = Consulta.objects.filter(pk=instance.pk).values(
+            'categoria_de_padecimiento_id', 'clave_paciente_id'
+        ).first()
+
+
+@receiver(post_save, sender=Consulta)
+def actualizar_resumen_consulta(sender, instance, created, **kwargs):
+    anterior = getattr(instance, '_resumen_anterior', None)
+    actual = {
+        'categoria_de_padecimiento_id': instance.categoria_de_padecimiento_id,
+        'clave_paciente_id': instance.clave_paciente_id,
+    }
+    if not created and (anterior is None or anterior == actual):
+        return
+
+    area_id, sexo = _datos_paciente_consulta(instance)
+    resumenes.ajustar_consulta(instance.categoria_de_padecimiento_id, area_id, sexo, 1)
+
+    if anterior:
+        anterior_area, anterior_sexo = resumenes.datos_paciente(anterior['clave_paciente_id'])
+        resumenes.ajustar_consulta(anterior['categoria_de_padecimiento_id'], anterior_area, anterior_sexo, -1)
+        if anterior['clave_paciente_id'] != instance.clave_paciente_id:
+            resumenes.recalcular_pacientes_atendidos(anterior_area, anterior_sexo)
+            resumenes.recalcular_pacientes_atendidos(area_id, sexo)
+        return
+
+    # Solo la primera consulta de un paciente cambia el número de pacientes atendidos
+    otras = Consulta.objects.filter(clave_paciente_id=instance.clave_paciente_id).exclude(pk=instance.pk)
+    if not otras.exists():
+        resumenes.recalcular_pacientes_atendidos(area_id, sexo)
+
+
+@receiver(post_delete, sender=Consulta)
+def descontar_resumen_consulta(sender, instance, **kwargs):
+    area_id, sexo = resumenes.datos_paciente(instance.clave_paciente_id)
+    resumenes.ajustar_consulta(instance.categoria_de_padecimiento_id, area_id, sexo, -1)
+    if not Consulta.objects.filter(clave_paciente_id=instance.clave_paciente_id).exists():
+        resumenes.recalcular_pacientes_atendidos(area_id, sexo)
+
+
+@receiver(pre_save, sender=Usuario)
+def recordar_usuario_anterior(sender, instance, update_fields=None, **kwargs):
+    instance._resumen_anterior = None
+    if instance._state.adding:
+        return
+    # Guardados parciales como el de `last_login` no afectan a los resúmenes
+    if update_fields is not None and not {'carrera_o_puesto', 'sexo', 'is_active'} & set(update_fields):
+        return
+    instance._resumen_anterior = Usuario.objects.filter(pk=instance.pk).values(*CAMPOS_USUARIO).first()
+
+
+@receiver(post_save, sender=Usuario)
+def actualizar_resumen_usuario(sender, instance, created, **kwargs):
+    if created:
+        resumenes.ajustar_usuarios_area(instance.carrera_o_puesto_id, 1)
+        return
+
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if anterior is None:
+        return
+    instance._resumen_anterior = None
+
+    if anterior['carrera_o_puesto_id'] != instance.carrera_o_puesto_id:
+        resumenes.ajustar_usuarios_area(anterior['carrera_o_puesto_id'], -1)
+        resumenes.ajustar_usuarios_area(instance.carrera_o_puesto_id, 1)
+
+    datos_anteriores = (anterior['carrera_o_puesto_id'], anterior['sexo'])
+    datos_nuevos = (instance.carrera_o_puesto_id, instance.sexo)
+    if datos_anteriores != datos_nuevos:
+        resumenes.mover_consultas_paciente(instance.pk, datos_anteriores, datos_nuevos)
+
+    if anterior['is_active'] != instance.is_active:
+        valores = HistorialMedico.objects.filter(paciente_id=instance.pk).values(*resumenes.HABITOS).first()
+        if valores:
+            resumenes.ajustar_habitos(resumenes.habitos_de(valores, 1 if instance.is_active else -1))
+
+
+@receiver(post_delete, sender=Usuario)
+def descontar_resumen_usuario(sender, instance, **kwargs):
+    resumenes.ajustar_usuarios_area(instance.carrera_o_puesto_id, -1)
+
+
+@receiver(pre_save, sender=HistorialMedico)
+def recordar_historial_anterior(sender, instance, **kwargs):
+    instance._resumen_anterior = None
+    if not instance._state.adding:
+        instance._resumen_anterior = HistorialMedico.objects.filter(pk=instance.pk).values(*resumenes.HABITOS).first()
+
+
+@receiver(post_save, sender=HistorialMedico)
+def actualizar_resumen_historial(sender, instance, created, **kwargs):
+    actuales = {habito: getattr(instance, habito) for habito in resumenes.HABITOS}
+    anteriores = getattr(instance, '_resumen_anterior', None) or {}
+    deltas = {
+        habito: int(bool(actuales[habito])) - int(bool(anteriores.get(habito)))
+        for habito in resumenes.HABITOS
+    }
+    if any(deltas.values()) and _paciente_activo(instance):
+        resumenes.ajustar_habitos(deltas)
+
+
+@receiver(post_delete, sender=HistorialMedico)
+def descontar_resumen_historial(sender, instance, **kwargs):
+    deltas = resumenes.habitos_de({h: getattr(instance, h) for h in resumenes.HABITOS}, -1)
+    if deltas and _paciente_activo(instance):
+        resumenes.ajustar_habitos(deltas)
+
+
+@receiver(post_delete, sender=CategoriaPadecimiento)
+@receiver(post_delete, sender=Area)
+def reconstruir_por_catalogo(sender, instance, **kwargs):
+    """
+    Al borrar una categoría o un área, las consultas y usuarios afectados se
+    actualizan con SET_NULL sin emitir señales, así que se reconstruyen los resúmenes.
+    """
+    resumenes.reconstruir_resumen_consultas()
+    resumenes.reconstruir_resumen_usuarios()
@@ -0,0 +1,141 @@
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+
+from apps.consultas.models import CategoriaPadecimiento, Consulta
+from apps.usuarios.carga_masiva import importar_bloque
+from apps.usuarios.models import Usuario
+from sistema_medico.tests_utils import crear_usuario
+
+from .models import (
+    ResumenConsultas,
+    ResumenHabitos,
+    ResumenPacientesAtendidos,
+    ResumenUsuariosArea,
+)
+from .resumenes import (
+    ajustar_usuarios_area,
+    reconstruir_resumen_consultas,
+    reconstruir_resumen_habitos,
+    reconstruir_resumen_usuarios,
+)
+
+
+def _foto_resumenes():
+    """ Devuelve el contenido de las tablas de resumen ignorando filas en cero. """
+    # `str` para poder ordenar filas con llaves NULL
+    return (
+        sorted(ResumenConsultas.objects.filter(total__gt=0).values_list('categoria_id', 'area_id', 'sexo', 'total'), key=str),
+        sorted(ResumenPacientesAtendidos.objects.filter(total__gt=0).values_list('area_id', 'sexo', 'total'), key=str),
+        sorted(ResumenUsuariosArea.objects.filter(total__gt=0).values_list('area_id', 'total'), key=str),
+        sorted(ResumenHabitos.objects.filter(total__gt=0).values_list('habito', 'total'), key=str),
+    )
+
+
+class ResumenesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_usuario('ISC221733', sexo='M')
+        cls.medico = crear_usuario('ISC221734', 'medico')
+        cls.iras = CategoriaPadecimiento.objects.get(padecimiento='IRAS')
+        cls.cefalea = CategoriaPadecimiento.objects.get(padecimiento='CEFALEA')
+
+    def _crear_consulta(self, categoria):
+        return Consulta.objects.create(
+            padecimiento_actual='Padecimiento actual',
+            categoria_de_padecimiento=categoria,
+            clave_paciente=self.paciente,
+            clave_medico=self.medico
+        )
+
+    def assertResumenesCoincidenConReconstruccion(self):
+        incrementales = _foto_resumenes()
+        reconstruir_resumen_consultas()
+        reconstruir_resumen_usuarios()
+        reconstruir_resumen_habitos()
+        self.assertEqual(incrementales, _foto_resumenes())
+
+    def test_consultas_actualizan_resumen(self):
+        self._crear_consulta(self.iras)
+        self._crear_consulta(self.iras)
+        self._crear_consulta(self.cefalea)
+
+        totales = dict(ResumenConsultas.objects.filter(total__gt=0).values_list('categoria_id', 'total'))
+        self.assertEqual({self.iras.pk: 2, self.cefalea.pk: 1}, totales)
+        atendidos = ResumenPacientesAtendidos.objects.get(area_id='ING. SISTEMAS COMP.', sexo='M')
+        self.assertEqual(1, atendidos.total)
+        self.assertResumenesCoincidenConReconstruccion()
+
+    def test_cambios_y_borrados_mantienen_resumen(self):
+        consulta = self._crear_consulta(self.iras)
+        self._crear_consulta(self.cefalea)
+
+        consulta.categoria_de_padecimiento = self.cefalea
+        consulta.save()
+        self.paciente.sexo = 'F'
+        self.paciente.carrera_o_puesto_id = 'GASTRONOMÍA'
+        self.paciente.save()
+        consulta.delete()
+
+        historial = self.paciente.historial
+        historial.usa_lentes = True
+        historial.save()
+        self.assertEqual(1, ResumenHabitos.objects.get(habito='usa_lentes').total)
+
+        self.assertResumenesCoincidenConReconstruccion()
+
+    def test_borrar_paciente_descuenta_sus_consultas(self):
+        self._crear_consulta(self.iras)
+        self._crear_consulta(self.cefalea)
+
+        self.paciente.delete()
+
+        self.assertFalse(ResumenConsultas.objects.filter(total__gt=0).exists())
+        self.assertFalse(ResumenPacientesAtendidos.objects.filter(total__gt=0).exists())
+        self.assertResumenesCoincidenConReconstruccion()
+
+    def test_usuarios_sin_area(self):
+        from apps.usuarios.views_dashboard_utils import generate_area_distribution_figure
+
+        self.paciente.carrera_o_puesto = None
+        self.paciente.save()
+        # La fila con área NULL es única: el segundo ajuste la suma en lugar de duplicarla
+        ajustar_usuarios_area(None, 1)
+        self.assertEqual([2], list(ResumenUsuariosArea.objects.filter(area=None).values_list('total', flat=True)))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ResumenUsuariosArea.objects.create(area=None, total=1)
+
+        barras = generate_area_distribution_figure().data[0]
+        self.assertEqual('Sin área', barras.x[-1])
+        self.assertEqual(2, barras.y[-1])
+        ajustar_usuarios_area(None, -1)
+        self.assertResumenesCoincidenConReconstruccion()
+
+    def test_carga_masiva_ajusta_solo_lo_que_cambia(self):
+        import pandas as pd
+
+        self._crear_consulta(self.iras)
+        self._crear_consulta(self.cefalea)
+        historial = self.paciente.historial
+        historial.usa_lentes = True
+        historial.save()
+        Usuario.objects.filter(pk=self.paciente.pk).update(is_active=False)
+        reconstruir_resumen_habitos()
+
+        df = pd.DataFrame({
+            'clave': ['ISC221733', 'ISC221735'],
+            'email': ['isc221733@itsatlixco.edu.mx', 'isc221735@itsatlixco.edu.mx'],
+            'nombres': ['JOHN', 'JANE'],
+            'apellido_paterno': ['DOE', 'DOE'],
+            'carrera_o_puesto': ['GASTRONOMÍA', 'ING. SISTEMAS COMP.'],
+            'sexo': ['F', 'F'],
+        })
+        with transaction.atomic():
+            creados, actualizados, errores = importar_bloque(df, 'P@ssword123')
+        self.assertEqual((1, 1, []), (creados, actualizados, errores))
+
+        self.assertEqual(
+            {(self.iras.pk, 'GASTRONOMÍA', 'F', 1), (self.cefalea.pk, 'GASTRONOMÍA', 'F', 1)},
+            set(ResumenConsultas.objects.filter(total__gt=0).values_list('categoria_id', 'area_id', 'sexo', 'total')),
+        )
+        self.assertEqual(1, ResumenHabitos.objects.get(habito='usa_lentes').total)
+        self.assertResumenesCoincidenConReconstruccion()
@@ -1,16 +1,23 @@
-from datetime import datetime
-
 from admin_extra_buttons.api import ExtraButtonsMixin, button
 from django.contrib import admin, messages
-from django.shortcuts import redirect, render
-from django.urls import path
-import pandas as pd
-
+from django.db import transaction
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .carga_masiva import (
+    MAXIMO_ERRORES,
+    errores_a_csv,
+    importar_bloque,
+    leer_bloques,
+    validar_formato,
+)
+from .admin_listas import ListaGrandeMixin
 from .forms import BulkUserUploadForm, ValidarForm
-from .models import Area, HistorialMedico, Role, Usuario
+from .models import Area, HistorialMedico, Role, TrabajoImportacion, Usuario
 from django.contrib.admin import AdminSite
 from django.conf import settings
-import re
 
 
 class SitioAdminSoloSuperusuarios(AdminSite):
@@ -30,7 +37,11 @@ class SitioAdminSoloSuperusuarios(AdminSite):
 admin_site = SitioAdminSoloSuperusuarios(name='miadmin')
 
 
-class UsuarioAdmin(ExtraButtonsMixin, admin.ModelAdmin):
+# Reporte de errores de la última carga masiva, guardado en la sesión del administrador
+SESION_ERRORES = 'errores_carga_masiva'
+
+
+class UsuarioAdmin(ExtraButtonsMixin, ListaGrandeMixin, admin.ModelAdmin):
     """
     Configuración personalizada del modelo Usuario para el sitio de administración.
     Esta clase define cómo se muestran, ordenan, filtran y buscan los usuarios
@@ -40,6 +51,7 @@ class UsuarioAdmin(ExtraButtonsMixin, admin.ModelAdmin):
     """
     model = Usuario
     list_display = ('clave', 'nombres', 'role', 'is_staff') #Campos mostrados en la lista de registros.
+    list_select_related = ('role',) #El rol sale en el mismo SELECT que los usuarios
     ordering = ('email',) #Orden predeterminado de los registros.
     list_filter = ('role', 'is_staff') #Filtros disponibles en la barra lateral.
     search_fields = ('clave', 'email', 'nombres',) #Campos que pueden ser buscados desde el buscador.
@@ -51,6 +63,9 @@ class UsuarioAdmin(ExtraButtonsMixin, admin.ModelAdmin):
             if not password:
                 password = settings.DEFAULT_PASSWORD  # Cambia esto por la contraseña que desees
             obj.set_password(password)
+            # La clave es la llave primaria: sin force_insert Django intentaría un UPDATE antes del INSERT
+            obj.save(force_insert=True)
+            return
 
         super().save_model(request, obj, form, change)
 
@@ -63,6 +78,26 @@ class UsuarioAdmin(ExtraButtonsMixin, admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path("bulk_upload", self.admin_site.admin_view(self.bulk_upload), name="bulk_upload"),
+            path(
+                "bulk_upload/errores/",
+                self.admin_site.admin_view(self.errores_carga_view),
+                name="usuarios_usuario_errores_carga",
+            ),
+            path(
+                "importaciones/<int:pk>/",
+                self.admin_site.admin_view(self.importacion_view),
+                name="usuarios_usuario_importacion",
+            ),
+            path(
+                "importaciones/<int:pk>/estado/",
+                self.admin_site.admin_view(self.importacion_estado_view),
+                name="usuarios_usuario_importacion_estado",
+            ),
+            path(
+                "importaciones/<int:pk>/errores/",
+                self.admin_site.admin_view(self.importacion_errores_view),
+                name="usuarios_usuario_importacion_errores",
+            ),
         ]
         return custom_urls + urls
 
@@ -71,9 +106,11 @@ class UsuarioAdmin(ExtraButtonsMixin, admin.ModelAdmin):
         """
         Vista personalizada para la carga masiva de usuarios desde un archivo CSV o Excel.
 
-        - Lee el archivo con pandas.
-        - Crea usuarios nuevos con bulk_create en lotes.
-        - Actualiza usuarios existentes con bulk_update en lotes.
+        - Lee el archivo por bloques y valida cada bloque por columnas.
+        - Cifra las contraseñas de los usuarios nuevos en varios procesos.
+        - Crea y actualiza los usuarios de cada bloque en su propia transacción.
+        - Con "en segundo plano" solo guarda el archivo; el comando
+          `procesar_importaciones` lo importa y esta vista redirige a su avance.
         - Devuelve mensajes claros de cuántos se crearon y cuántos se actualizaron.
         """
         if request.method == "POST":
@@ -81,125 +118,98 @@ class UsuarioAdmin(ExtraButtonsMixin, admin.ModelAdmin):
             if form.is_valid():
                 file = request.FILES["file"]
                 try:
-                    # Leer archivo
-                    if file.name.endswith(".csv"):
-                        df = pd.read_csv(file, dtype=str)
-                    elif file.name.endswith((".xls", ".xlsx")):
-                        df = pd.read_excel(file, dtype=str)
-                    else:
-                        messages.error(request, "Formato de archivo no compatible.")
-                        return redirect("..")
-
-                    usuarios_nuevos = []
-                    usuarios_existentes = []
-
-                    # Obtener claves de usuarios ya registrados
-                    claves_existentes = set(Usuario.objects.values_list("clave", flat=True))
-
-                    for index, row in df.iterrows():
-                        try:
-                            # Validar valores vacíos y corregir tipos de datos
-                            apellido_materno = str(row.get("apellido_materno", "")).strip() or None
-                            valor_pas = row.get("password", "")
-                            pas = settings.DEFAULT_PASSWORD if pd.isna(valor_pas) or str(valor_pas).strip() == "" else str(valor_pas).strip()
-
-                            # Validar contraseña
-                            token_password = r'^(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[@$!%#?&ñ_])[A-Za-z\d@$!%#?&ñ_]{8,15}$'
-                            if not re.match(token_password, pas):
-                                messages.error(request, f"Fila {index + 1}: La contraseña no cumple con el formato.")
-                                continue
-
-                            # Obtener área y rol
-                            area_obj = Area.objects.get(carrera_o_puesto=row.get("carrera_o_puesto"))
-                            area_nombre = area_obj.carrera_o_puesto.strip()
-                            role_obj = Role.objects.get(nombre_rol="medico" if area_nombre == "Médico" else "paciente")
-
-                            # Convertir fecha de nacimiento
-                            fecha_nacimiento = None
-                            if row.get("fecha_nacimiento"):
-                                fecha_nacimiento = datetime.strptime(
-                                    str(row["fecha_nacimiento"]), "%d/%m/%Y"
-                                ).strftime("%Y-%m-%d")
-
-                            usuario = Usuario(
-                                clave=row["clave"],
-                                email=row["email"],
-                                nombres=row["nombres"],
-                                apellido_paterno=row["apellido_paterno"],
-                                apellido_materno=apellido_materno,
-                                fecha_nacimiento=fecha_nacimiento,
-                                sexo=row.get("sexo", None),
-                                is_active=True,
-                                is_staff=row.get("is_staff", "False") == "True",
-                                carrera_o_puesto_id=row.get("carrera_o_puesto", None),
-                                role_id=role_obj.nombre_rol,
-                            )
-
-                            if row["clave"] in claves_existentes:
-                                usuarios_existentes.append(usuario)
-                            else:
-                                usuario.set_password(pas)
-                                usuarios_nuevos.append(usuario)
-
-                        except Exception as e:
-                            messages.error(request, f"Error en la fila {index + 1}: {e}")
-
-                    # Inserción y actualización en lotes
-                    if usuarios_nuevos:
-                        # Guardar los usuarios creados
-                        usuarios_creados = Usuario.objects.bulk_create(usuarios_nuevos, batch_size=100)
-
-                        # Crear historiales médicos para los nuevos pacientes
-                        from django.contrib.auth.models import Group
-                        from .models import HistorialMedico
-
-                        for usuario in usuarios_creados:
-                            # Verificar si es un paciente que necesita historial
-                            if (hasattr(usuario, 'role') and
-                                hasattr(usuario.role, 'nombre_rol') and
-                                usuario.role.nombre_rol.lower() == 'paciente' and
-                                hasattr(usuario, 'carrera_o_puesto') and
-                                usuario.carrera_o_puesto != 'Médico'):
-
-                                HistorialMedico.objects.get_or_create(
-                                    id_historial=usuario.clave,
-                                    defaults={'paciente': usuario}
-                                )
-
-                            # Asignar grupo correspondiente
-                            if hasattr(usuario, 'role') and hasattr(usuario.role, 'nombre_rol'):
-                                group_name = usuario.role.nombre_rol.capitalize()
-                                try:
-                                    group = Group.objects.get(name=group_name)
-                                    usuario.groups.add(group)
-                                except Group.DoesNotExist:
-                                    pass
-
-                    if usuarios_existentes:
-                        Usuario.objects.bulk_update(
-                            usuarios_existentes,
-                            [
-                                "email", "nombres", "apellido_paterno", "apellido_materno",
-                                "fecha_nacimiento", "sexo", "is_active", "is_staff",
-                                "carrera_o_puesto_id", "role_id"
-                            ],
-                            batch_size=100
-                        )
-
-                    messages.success(
-                        request,
-                        f"Usuarios creados: {len(usuarios_nuevos)}, actualizados: {len(usuarios_existentes)}."
-                    )
+                    validar_formato(file.name)
+                except ValueError as e:
+                    messages.error(request, str(e))
                     return redirect("..")
 
+                if form.cleaned_data["en_segundo_plano"]:
+                    trabajo = TrabajoImportacion.objects.create(
+                        administrador=request.user, archivo=file, nombre=file.name
+                    )
+                    return redirect("admin:usuarios_usuario_importacion", pk=trabajo.pk)
+
+                creados = actualizados = 0
+                errores = []
+                try:
+                    # Cada bloque se guarda en su propia transacción
+                    for df in leer_bloques(file, file.name):
+                        with transaction.atomic():
+                            nuevos, existentes, errores_bloque = importar_bloque(df, settings.DEFAULT_PASSWORD)
+                        creados += nuevos
+                        actualizados += existentes
+                        errores += errores_bloque[:MAXIMO_ERRORES - len(errores)]
                 except Exception as e:
                     messages.error(request, f"Ocurrió un error: {e}")
                     return redirect("..")
+
+                if errores:
+                    request.session[SESION_ERRORES] = errores
+                    messages.warning(request, format_html(
+                        'Se omitieron {} filas con errores. <a href="{}">Descargar reporte de errores</a>',
+                        len({error["fila"] for error in errores}),
+                        reverse("admin:usuarios_usuario_errores_carga"),
+                    ))
+                else:
+                    request.session.pop(SESION_ERRORES, None)
+
+                messages.success(request, f"Usuarios creados: {creados}, actualizados: {actualizados}.")
+                return redirect("..")
         else:
             form = BulkUserUploadForm()
 
         return render(request, "admin_custom/bulk_upload.html", {"form": form, "opts": self.model._meta})
 
+    def errores_carga_view(self, request):
+        """ Descarga como CSV los errores por fila de la última carga masiva. """
+        errores = request.session.get(SESION_ERRORES)
+        if not errores:
+            raise Http404("No hay errores de carga masiva")
+        return self._reporte_errores(errores)
+
+    def _reporte_errores(self, errores):
+        response = HttpResponse(errores_a_csv(errores), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="errores_carga_masiva.csv"'
+        return response
+
+    def importacion_view(self, request, pk):
+        """ Página que consulta periódicamente el avance de una importación en segundo plano. """
+        trabajo = get_object_or_404(TrabajoImportacion, pk=pk)
+        return render(request, "admin_custom/importacion.html", {"trabajo": trabajo, "opts": self.model._meta})
+
+    def importacion_estado_view(self, request, pk):
+        """ Avance de una importación en JSON. """
+        trabajo = get_object_or_404(TrabajoImportacion, pk=pk)
+        return JsonResponse({
+            "estado": trabajo.estado,
+            "activo": trabajo.activo,
+            "total_filas": trabajo.total_filas,
+            "filas_procesadas": trabajo.filas_procesadas,
+            "porcentaje": trabajo.porcentaje,
+            "creados": trabajo.creados,
+            "actualizados": trabajo.actualizados,
+            "total_errores": trabajo.total_errores,
+            "error": trabajo.error,
+        })
+
+    def importacion_errores_view(self, request, pk):
+        """ Descarga como CSV los errores por fila de una importación en segundo plano. """
+        trabajo = get_object_or_404(TrabajoImportacion, pk=pk)
+        if not trabajo.errores:
+            raise Http404("La importación no tiene errores")
+        return self._reporte_errores(trabajo.errores)
+
+
+class TrabajoImportacionAdmin(admin.ModelAdmin):
+    model = TrabajoImportacion
+    list_display = ('id', 'nombre', 'estado', 'filas_procesadas', 'creados', 'actualizados', 'total_errores', 'creado')
+    list_filter = ('estado',)
+    readonly_fields = [campo.name for campo in TrabajoImportacion._meta.fields]
+    exclude = ('errores',)
+
+    def has_add_permission(self, request):
+        return False
+
 
 class HistorialAdmin(admin.ModelAdmin):
     """
@@ -230,4 +240,5 @@ class AreaAdmin(admin.ModelAdmin):
 admin.site.register(Usuario, UsuarioAdmin)
 admin.site.register(HistorialMedico, HistorialAdmin)
 admin.site.register(Role, RoleAdmin)
-admin.site.register(Area, AreaAdmin)
\ No newline at end of file
+admin.site.register(Area, AreaAdmin)
+admin.site.register(TrabajoImportacion, TrabajoImportacionAdmin)
\ No newline at end of file
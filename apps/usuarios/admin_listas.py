@@ -0,0 +1,101 @@
+"""
+Piezas para que las listas del admin sigan siendo rápidas con tablas grandes.
+
+- `FiltroAutocompletar`: filtro lateral para llaves foráneas a `Usuario` que
+  no lista a todos los usuarios; se elige uno con el autocompletado del admin
+  (select2 sobre `admin:autocomplete`, que usa los `search_fields` de
+  `UsuarioAdmin`).
+- `PaginadorEstimado`: en PostgreSQL, la lista sin filtros de una tabla grande
+  usa el número de filas que estima el planificador (`pg_class.reltuples`) en
+  lugar de un COUNT(*) que recorre toda la tabla.
+- `ListaGrandeMixin`: usa el paginador, desactiva el segundo COUNT del total
+  sin filtros y agrega los archivos de select2 y `js/filtro_autocompletar.js`
+  cuando hay filtros de autocompletado.
+"""
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms import Media
+from django.core.paginator import Paginator
+from django.db import connections
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+
+# Debajo de este número de filas el COUNT exacto es barato y se prefiere
+MINIMO_PARA_ESTIMAR = 10000
+
+
+def filas_estimadas(modelo, using):
+    """ Filas de la tabla de `modelo` según las estadísticas de PostgreSQL; None en otras bases. """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [modelo._meta.db_table])
+        fila = cursor.fetchone()
+    # -1 si la tabla nunca se ha analizado
+    return int(fila[0]) if fila and fila[0] >= 0 else None
+
+
+class PaginadorEstimado(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimado = filas_estimadas(queryset.model, queryset.db)
+            if estimado is not None and estimado >= MINIMO_PARA_ESTIMAR:
+                return estimado
+        return super().count
+
+
+class FiltroAutocompletar(admin.FieldListFilter):
+    template = 'admin/filtro_autocompletar.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        self.field_name = field.name
+        self.url_autocompletar = reverse(f'{model_admin.admin_site.name}:autocomplete')
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # URL con un marcador que js/filtro_autocompletar.js reemplaza por la clave elegida
+        self.url_seleccion = changelist.get_query_string({self.lookup_kwarg: '__valor__'})
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'Todos',
+        }
+        if self.lookup_val is not None:
+            yield {
+                'selected': True,
+                'query_string': changelist.get_query_string({self.lookup_kwarg: self.lookup_val}),
+                'display': self.lookup_val,
+            }
+
+
+class ListaGrandeMixin:
+    paginator = PaginadorEstimado
+    # Sin esto, cada página filtrada hace además un COUNT de la tabla completa
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        campos = [
+            filtro[0] for filtro in self.list_filter
+            if isinstance(filtro, tuple) and issubclass(filtro[1], FiltroAutocompletar)
+        ]
+        if campos:
+            campo = self.model._meta.get_field(campos[0])
+            # Una sola vez aunque haya varios filtros, para no repetir la navegación
+            media += AutocompleteSelect(campo, self.admin_site).media + Media(js=['js/filtro_autocompletar.js'])
+        return media
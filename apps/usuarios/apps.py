@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class UsuariosConfig(AppConfig):
@@ -7,3 +8,8 @@ class UsuariosConfig(AppConfig):
 
     def ready(self):
         import apps.usuarios.signals
+        from apps.usuarios.signals import crear_grupos_permisos, crear_roles_y_areas_por_defecto
+
+        # Solo con la señal de esta app, no con la de cada app migrada
+        post_migrate.connect(crear_roles_y_areas_por_defecto, sender=self)
+        post_migrate.connect(crear_grupos_permisos, sender=self)
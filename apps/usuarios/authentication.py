@@ -5,8 +5,21 @@ class ClaveBackend(ModelBackend):
     def authenticate(self, request, clave=None, password=None, **kwargs):
         Usuario = get_user_model()
         try:
-            user = Usuario.objects.get(clave=clave)
+            user = Usuario.objects.select_related('role', 'carrera_o_puesto').get(clave=clave)
             if user.check_password(password):
                 return user
         except Usuario.DoesNotExist:
             return None
+
+    def get_user(self, user_id):
+        """
+        Carga el usuario de la sesión junto con su rol y su área en una sola
+        consulta; `role_required`, la barra de navegación y las vistas los leen
+        en cada petición.
+        """
+        Usuario = get_user_model()
+        try:
+            user = Usuario._default_manager.select_related('role', 'carrera_o_puesto').get(pk=user_id)
+        except Usuario.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,42 @@
+"""
+Búsqueda de pacientes por clave.
+
+La clave se compara en mayúsculas (`UPPER(columna)`) porque la carga masiva
+puede guardar claves tal como vienen en el archivo. En PostgreSQL las
+migraciones crean dos índices sobre esa expresión en las columnas donde se
+busca:
+
+- `gin_trgm_ops` (extensión pg_trgm) para buscar una subcadena (`LIKE '%2217%'`),
+  que es lo que hacen los buscadores del sistema.
+- `text_pattern_ops` para las búsquedas por prefijo (`LIKE 'ISC22%'`), que
+  hay que pedir con `modo=PREFIJO` (la casilla "Solo al inicio de la clave"
+  de la lista de consultas y de historiales).
+
+En SQLite no existen esos índices y las mismas consultas recorren la tabla,
+lo que basta para el desarrollo local.
+"""
+from django.db.models.functions import Upper
+
+
+PREFIJO = 'prefijo'
+CONTIENE = 'contiene'
+
+
+def normalizar_clave(texto):
+    return (texto or '').strip().upper()
+
+
+def filtrar_por_clave(queryset, campo, texto, modo=CONTIENE):
+    """
+    Filtra `queryset` por la clave guardada en `campo` (p. ej. `clave_paciente_id`
+    o `id_historial`). Usar la columna local en lugar de `clave_paciente__clave`
+    evita el JOIN con la tabla de usuarios. Por omisión el texto puede estar en
+    cualquier parte de la clave, igual que el `icontains` anterior.
+    """
+    clave = normalizar_clave(texto)
+    if not clave:
+        return queryset
+    queryset = queryset.alias(clave_normalizada=Upper(campo))
+    if modo == PREFIJO:
+        return queryset.filter(clave_normalizada__startswith=clave)
+    return queryset.filter(clave_normalizada__contains=clave)
@@ -0,0 +1,425 @@
+"""
+Carga masiva de usuarios desde el admin.
+
+Un archivo pasa por estos pasos:
+
+- Lectura por bloques: `leer_bloques` entrega el CSV o Excel en DataFrames de
+  `TAMANO_BLOQUE` filas, así que ni el DataFrame ni los objetos `Usuario` de un
+  archivo grande se tienen en memoria a la vez. El admin procesa los bloques
+  en la petición o, para archivos grandes, lo hace el comando
+  `procesar_importaciones` (ver `trabajos.py`).
+- Validación: `validar_filas` revisa cada bloque por columnas con pandas
+  (formatos de clave, correo, contraseña y fecha) y toma las áreas y roles de
+  `datos_referencia`, en lugar de hacer consultas y expresiones regulares fila
+  por fila. Los errores por fila se ofrecen como CSV (`errores_a_csv`).
+- Cifrado: PBKDF2 cuesta decenas de milisegundos por contraseña.
+  `cifrar_contrasenas` reparte ese trabajo entre varios procesos, devuelve los
+  resultados en el orden de entrada y aísla los errores por fila.
+- Inserción: `importar_bloque` inserta los usuarios nuevos y actualiza los que
+  ya existían con operaciones en bloque; `crear_historiales_y_grupos` crea los
+  historiales y las membresías de grupo que haría la señal `post_save`.
+- Datos derivados: como las operaciones en bloque no emiten señales,
+  `ajustar_resumenes` aplica a los resúmenes del dashboard solo los cambios de
+  las filas cargadas y el índice de pacientes se invalida al confirmar.
+
+pandas se importa dentro de cada función: es pesado y solo lo usa la carga
+masiva.
+"""
+import csv
+import io
+import os
+import warnings
+from collections import Counter
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.contrib.auth.hashers import make_password
+from django.core.validators import RegexValidator
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+
+from apps.estadisticas import resumenes
+
+from .indice_pacientes import indice_pacientes
+from .models import HistorialMedico, Usuario
+from .referencias import AREA_MEDICO, GRUPOS_POR_ROL, datos_referencia
+
+
+COLUMNAS_OBLIGATORIAS = ('clave', 'email', 'nombres', 'apellido_paterno', 'carrera_o_puesto')
+COLUMNAS_OPCIONALES = ('apellido_materno', 'fecha_nacimiento', 'sexo', 'is_staff', 'password')
+PATRON_PASSWORD = r'^(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[@$!%#?&ñ_])[A-Za-z\d@$!%#?&ñ_]{8,15}$'
+FORMATO_FECHA = '%d/%m/%Y'
+ENCABEZADOS_ERRORES = ('fila', 'clave', 'columna', 'error')
+FORMATOS = ('.csv', '.xls', '.xlsx')
+# Filas que se validan e insertan en cada transacción
+TAMANO_BLOQUE = 1000
+# Errores por fila que se guardan para el reporte
+MAXIMO_ERRORES = 5000
+# Filas por cada INSERT o UPDATE en bloque
+TAMANO_LOTE = 500
+# Campos que se sobrescriben en los usuarios que ya existían
+CAMPOS_ACTUALIZABLES = [
+    'email', 'nombres', 'apellido_paterno', 'apellido_materno',
+    'fecha_nacimiento', 'sexo', 'is_active', 'is_staff',
+    'carrera_o_puesto_id', 'role_id',
+]
+# Con pocas contraseñas arrancar los procesos cuesta más que cifrarlas aquí
+MINIMO_PARA_PROCESOS = 32
+
+
+def validar_formato(nombre):
+    if not nombre.endswith(FORMATOS):
+        raise ValueError('Formato de archivo no compatible.')
+
+
+def leer_bloques(archivo, nombre, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Lee el CSV o Excel `archivo` como DataFrames de texto de a lo más
+    `tamano_bloque` filas, sin cargar el archivo completo en memoria. El
+    índice continúa de un bloque a otro para que los números de fila de los
+    errores correspondan al archivo.
+    """
+    import pandas as pd
+
+    validar_formato(nombre)
+    if nombre.endswith('.csv'):
+        yield from pd.read_csv(archivo, dtype=str, chunksize=tamano_bloque)
+    elif nombre.endswith('.xlsx'):
+        yield from _bloques_xlsx(archivo, tamano_bloque)
+    else:
+        # El formato .xls antiguo no se puede leer por partes
+        df = pd.read_excel(archivo, dtype=str)
+        for inicio in range(0, len(df), tamano_bloque):
+            yield df.iloc[inicio:inicio + tamano_bloque]
+
+
+def _texto_celda(valor):
+    """ Convierte una celda de Excel al texto que tendría en un CSV. """
+    if valor is None:
+        return None
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime(FORMATO_FECHA)
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _bloques_xlsx(archivo, tamano_bloque):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezados = [_texto_celda(valor) for valor in next(filas, ())]
+        bloque, inicio = [], 0
+        for fila in filas:
+            if all(valor is None for valor in fila):
+                continue
+            bloque.append([_texto_celda(valor) for valor in fila])
+            if len(bloque) == tamano_bloque:
+                yield pd.DataFrame(bloque, columns=encabezados, index=range(inicio, inicio + len(bloque)))
+                inicio += len(bloque)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=encabezados, index=range(inicio, inicio + len(bloque)))
+    finally:
+        libro.close()
+
+
+def contar_filas(archivo, nombre):
+    """
+    Número aproximado de filas de datos para mostrar el avance, o None si no
+    se puede saber sin leer el archivo completo.
+    """
+    if nombre.endswith('.csv'):
+        total = sum(1 for linea in archivo if linea.strip())
+        archivo.seek(0)
+        return max(total - 1, 0)
+    if nombre.endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        libro = load_workbook(archivo, read_only=True)
+        total = libro.active.max_row
+        libro.close()
+        archivo.seek(0)
+        return total - 1 if total else None
+    return None
+
+
+def _patron_de(campo):
+    """ Expresión regular del validador del modelo, para no duplicarla aquí. """
+    validadores = Usuario._meta.get_field(campo).validators
+    return next(v for v in validadores if isinstance(v, RegexValidator)).regex.pattern
+
+
+def _coincide(serie, patron):
+    """ `RegexValidator` usa `re.search`; `str.contains` hace lo mismo para toda la columna. """
+    with warnings.catch_warnings():
+        # pandas avisa cuando el patrón tiene grupos, pero aquí solo interesa si coincide
+        warnings.simplefilter('ignore', UserWarning)
+        return serie.str.contains(patron, regex=True)
+
+
+def validar_filas(df, password_por_defecto):
+    """
+    Valida el bloque `df` y devuelve `(validas, errores)`.
+
+    `validas` es una lista de diccionarios listos para construir `Usuario`
+    (con `fila`, `password` sin cifrar, `fecha_nacimiento` en ISO y `role_id`);
+    `errores` es una lista de diccionarios con `fila`, `clave`, `columna` y
+    `error`, ordenada por fila. Las filas se numeran desde 1 sin contar el
+    encabezado.
+    """
+    import pandas as pd
+
+    df = df.copy()
+    for columna in COLUMNAS_OBLIGATORIAS + COLUMNAS_OPCIONALES:
+        if columna not in df.columns:
+            df[columna] = ''
+    df = df.fillna('').astype(str).apply(lambda columna: columna.str.strip())
+    df['fila'] = df.index + 1
+    df['password'] = df['password'].mask(df['password'] == '', password_por_defecto)
+
+    # Áreas y roles salen de la copia en memoria: una sola consulta por bloque
+    areas = list(datos_referencia.areas())
+    roles = list(datos_referencia.roles())
+    duenos_email = {
+        email.lower(): clave
+        for email, clave in Usuario.objects.annotate(email_minusculas=Lower('email')).filter(
+            email_minusculas__in=set(df['email'].str.lower()) - {''}
+        ).values_list('email', 'clave')
+    }
+
+    errores = []
+
+    def marcar(mascara, columna, mensaje):
+        for fila, clave in df.loc[mascara, ['fila', 'clave']].itertuples(index=False):
+            errores.append({'fila': int(fila), 'clave': clave, 'columna': columna, 'error': mensaje})
+
+    for columna in COLUMNAS_OBLIGATORIAS:
+        marcar(df[columna] == '', columna, 'Campo obligatorio vacío')
+
+    con_clave = df['clave'] != ''
+    marcar(con_clave & ~_coincide(df['clave'], _patron_de('clave')), 'clave', 'Formato de clave no válido')
+    marcar(con_clave & df['clave'].duplicated(keep='first'), 'clave', 'Clave repetida en el archivo')
+
+    con_email = df['email'] != ''
+    marcar(con_email & ~_coincide(df['email'], _patron_de('email')), 'email', 'Formato de correo no válido')
+    marcar(con_email & df['email'].str.lower().duplicated(keep='first'), 'email', 'Correo repetido en el archivo')
+    # El correo es único: no puede pertenecer ya a otro usuario
+    dueno = df['email'].str.lower().map(duenos_email)
+    marcar(dueno.notna() & (dueno != df['clave']), 'email', 'El correo ya pertenece a otro usuario')
+
+    marcar(~df['password'].str.match(PATRON_PASSWORD), 'password', 'La contraseña no cumple con el formato')
+
+    fechas = pd.to_datetime(df['fecha_nacimiento'], format=FORMATO_FECHA, errors='coerce')
+    marcar((df['fecha_nacimiento'] != '') & fechas.isna(), 'fecha_nacimiento', f'Fecha no válida (se espera {FORMATO_FECHA})')
+
+    marcar(~df['sexo'].isin(['', 'M', 'F']), 'sexo', 'El sexo debe ser M o F')
+
+    con_area = df['carrera_o_puesto'] != ''
+    marcar(con_area & ~df['carrera_o_puesto'].isin(areas), 'carrera_o_puesto', 'La carrera o puesto no existe')
+
+    df['role_id'] = (df['carrera_o_puesto'] == AREA_MEDICO).map({True: 'medico', False: 'paciente'})
+    marcar(con_area & ~df['role_id'].isin(roles), 'role', 'El rol no existe')
+
+    errores.sort(key=lambda error: error['fila'])
+    filas_con_error = {error['fila'] for error in errores}
+    # object para que las fechas vacías queden como None y no como NaN
+    df['fecha_nacimiento'] = fechas.dt.strftime('%Y-%m-%d').astype(object).where(fechas.notna(), None)
+    df['is_staff'] = df['is_staff'] == 'True'
+
+    validas = df[~df['fila'].isin(filas_con_error)]
+    columnas = ['fila', 'role_id', *COLUMNAS_OBLIGATORIAS, *COLUMNAS_OPCIONALES]
+    return validas[columnas].to_dict('records'), errores
+
+
+def errores_a_csv(errores):
+    """ Reporte de errores como texto CSV (con BOM para que Excel respete los acentos). """
+    salida = io.StringIO()
+    salida.write('\ufeff')
+    escritor = csv.DictWriter(salida, fieldnames=ENCABEZADOS_ERRORES)
+    escritor.writeheader()
+    escritor.writerows(errores)
+    return salida.getvalue()
+
+
+class ResultadoCifrado:
+    """ Contraseña cifrada de una fila o el error que impidió cifrarla. """
+
+    def __init__(self, password=None, error=None):
+        self.password = password
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _iniciar_proceso():
+    # Con el método "spawn" (macOS, Windows) el proceso hijo no hereda la
+    # configuración de Django y make_password necesita PASSWORD_HASHERS
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_medico.settings')
+        django.setup()
+
+
+def _cifrar(password):
+    try:
+        return ResultadoCifrado(password=make_password(password))
+    except Exception as e:
+        return ResultadoCifrado(error=str(e))
+
+
+def procesos_disponibles():
+    """ Núcleos que este proceso puede usar (respeta la afinidad de CPU del contenedor). """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def cifrar_contrasenas(contrasenas, procesos=None):
+    """
+    Cifra `contrasenas` y devuelve una lista de `ResultadoCifrado` en el mismo
+    orden. `procesos` limita el número de procesos; por omisión usa todos los
+    núcleos disponibles.
+    """
+    contrasenas = list(contrasenas)
+    procesos = min(procesos or procesos_disponibles(), len(contrasenas))
+    if procesos <= 1 or len(contrasenas) < MINIMO_PARA_PROCESOS:
+        return [_cifrar(password) for password in contrasenas]
+
+    # Bloques grandes para no pagar la comunicación entre procesos por cada contraseña
+    bloque = max(1, len(contrasenas) // (procesos * 4))
+    try:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+            return list(pool.map(_cifrar, contrasenas, chunksize=bloque))
+    except (BrokenProcessPool, OSError):
+        # Sin permiso para crear procesos o un proceso murió: cifrar aquí mismo
+        return [_cifrar(password) for password in contrasenas]
+
+
+def crear_historiales_y_grupos(usuarios, tamano_lote=TAMANO_LOTE):
+    """
+    Crea el historial médico de cada paciente de `usuarios` y agrega a cada
+    usuario al grupo de su rol. `bulk_create` no emite `post_save`, así que
+    esto reemplaza a la señal para los usuarios de la carga masiva.
+
+    Son dos consultas más una por cada lote de `tamano_lote`, sin importar
+    cuántos usuarios sean; `ignore_conflicts` hace que repetir la carga no falle
+    por historiales o membresías que ya existen. Devuelve
+    `(historiales, membresias)` enviados a insertar.
+    """
+    historiales = [
+        HistorialMedico(id_historial=usuario.clave, paciente_id=usuario.clave)
+        for usuario in usuarios
+        if usuario.role_id == 'paciente' and usuario.carrera_o_puesto_id != AREA_MEDICO
+    ]
+    HistorialMedico.objects.bulk_create(historiales, batch_size=tamano_lote, ignore_conflicts=True)
+
+    grupos = datos_referencia.grupos()
+    Membresia = Usuario.groups.through
+    membresias = [
+        Membresia(usuario_id=usuario.clave, group_id=grupos[GRUPOS_POR_ROL[usuario.role_id]])
+        for usuario in usuarios
+        if GRUPOS_POR_ROL.get(usuario.role_id) in grupos
+    ]
+    Membresia.objects.bulk_create(membresias, batch_size=tamano_lote, ignore_conflicts=True)
+    return len(historiales), len(membresias)
+
+
+def importar_bloque(df, password_por_defecto, tamano_lote=TAMANO_LOTE):
+    """
+    Valida `df`, cifra las contraseñas de los usuarios nuevos, los inserta con
+    sus historiales y grupos, y actualiza los que ya existían. Debe llamarse
+    dentro de una transacción. Devuelve `(creados, actualizados, errores)`.
+    """
+    filas, errores = validar_filas(df, password_por_defecto)
+    # Área, sexo y estado de los que ya existen, para ajustar los resúmenes del dashboard
+    anteriores = {
+        clave: datos for clave, *datos in Usuario.objects.filter(
+            clave__in=[fila['clave'] for fila in filas]
+        ).values_list('clave', 'carrera_o_puesto_id', 'sexo', 'is_active')
+    }
+
+    nuevos, existentes, contrasenas = [], [], []
+    for fila in filas:
+        usuario = Usuario(
+            clave=fila['clave'],
+            email=fila['email'],
+            nombres=fila['nombres'],
+            apellido_paterno=fila['apellido_paterno'],
+            apellido_materno=fila['apellido_materno'] or None,
+            fecha_nacimiento=fila['fecha_nacimiento'],
+            sexo=fila['sexo'] or None,
+            is_active=True,
+            is_staff=fila['is_staff'],
+            carrera_o_puesto_id=fila['carrera_o_puesto'],
+            role_id=fila['role_id'],
+        )
+        if fila['clave'] in anteriores:
+            existentes.append(usuario)
+        else:
+            nuevos.append(usuario)
+            contrasenas.append((fila['fila'], fila['password']))
+
+    # Cifrar las contraseñas en paralelo; una fila que falla no detiene a las demás
+    cifrados = []
+    for usuario, (fila, _), resultado in zip(nuevos, contrasenas, cifrar_contrasenas(pas for _, pas in contrasenas)):
+        if resultado.ok:
+            usuario.password = resultado.password
+            cifrados.append(usuario)
+        else:
+            errores.append({
+                'fila': fila, 'clave': usuario.clave, 'columna': 'password',
+                'error': f'No se pudo cifrar la contraseña: {resultado.error}',
+            })
+
+    if cifrados:
+        Usuario.objects.bulk_create(cifrados, batch_size=tamano_lote)
+        # bulk_create no emite post_save: historiales y grupos también en bloque
+        crear_historiales_y_grupos(cifrados, tamano_lote)
+    if existentes:
+        Usuario.objects.bulk_update(existentes, CAMPOS_ACTUALIZABLES, batch_size=100)
+    if cifrados or existentes:
+        ajustar_resumenes(cifrados, existentes, anteriores)
+        transaction.on_commit(indice_pacientes.invalidar)
+
+    errores.sort(key=lambda error: error['fila'])
+    return len(cifrados), len(existentes), errores
+
+
+def ajustar_resumenes(creados, actualizados, anteriores):
+    """
+    `bulk_create` y `bulk_update` no emiten señales: aplica a los resúmenes del
+    dashboard los mismos ajustes que las señales de `apps.estadisticas` harían
+    fila por fila. `anteriores` tiene `{clave: [área, sexo, is_active]}` de los
+    usuarios de `actualizados` antes de la carga. Solo los usuarios que
+    cambiaron de área o sexo mueven sus consultas.
+    """
+    por_area = Counter(usuario.carrera_o_puesto_id for usuario in creados)
+    activados = []
+    for usuario in actualizados:
+        area, sexo, activo = anteriores[usuario.clave]
+        if area != usuario.carrera_o_puesto_id:
+            por_area[area] -= 1
+            por_area[usuario.carrera_o_puesto_id] += 1
+        if (area, sexo) != (usuario.carrera_o_puesto_id, usuario.sexo):
+            resumenes.mover_consultas_paciente(
+                usuario.clave, (area, sexo), (usuario.carrera_o_puesto_id, usuario.sexo)
+            )
+        if usuario.is_active and not activo:
+            activados.append(usuario.clave)
+
+    for area, delta in por_area.items():
+        resumenes.ajustar_usuarios_area(area, delta)
+    # Los historiales nuevos no tienen hábitos; solo cuentan los de pacientes reactivados
+    if activados:
+        resumenes.ajustar_habitos(HistorialMedico.objects.filter(paciente_id__in=activados).aggregate(
+            **{habito: Count('pk', filter=Q(**{habito: True})) for habito in resumenes.HABITOS}
+        ))
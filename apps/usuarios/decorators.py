@@ -4,7 +4,8 @@ from django.shortcuts import redirect
 def role_required(allowed_roles):
     def decorator(view_func):
         def _wrapped_view(request, *args, **kwargs):
-            if request.user.is_authenticated and request.user.role.nombre_rol in allowed_roles:
+            # `nombre_rol` es la llave primaria de Role, así que `role_id` ya es el nombre sin leer la tabla de roles
+            if request.user.is_authenticated and request.user.role_id in allowed_roles:
                 return view_func(request, *args, **kwargs)
             # return HttpResponseForbidden("No tienes permiso para acceder a esta página.")
             return redirect('404.html')
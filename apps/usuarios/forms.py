@@ -100,6 +100,10 @@ class BulkUserUploadForm(forms.Form):
 
     """
     file = forms.FileField(label="Selecciona un archivo (.csv o .xls)")
+    en_segundo_plano = forms.BooleanField(
+        label="Procesar en segundo plano (recomendado para archivos grandes)",
+        required=False,
+    )
 
 
 class ValidarForm(forms.ModelForm):
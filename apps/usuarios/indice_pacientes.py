@@ -0,0 +1,92 @@
+"""
+Índice en memoria de los pacientes activos para el autocompletado al crear una
+consulta.
+
+Cada proceso guarda una lista ordenada de llaves normalizadas (mayúsculas y sin
+acentos): la clave, "NOMBRES APELLIDOS" y "APELLIDOS NOMBRES". Buscar un
+prefijo es una búsqueda binaria con `bisect` más el recorrido de las
+coincidencias, así que no toca la base de datos mientras el médico escribe.
+
+El índice se invalida con las señales de `Usuario` del mismo proceso y, como
+las señales no llegan a los demás procesos de gunicorn ni se emiten en los
+`bulk_create`, también caduca después de `DURACION` segundos.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+
+DURACION = 60
+LIMITE = 10
+
+
+def normalizar(texto):
+    """ Mayúsculas, sin acentos y con espacios simples: 'José  Pérez' -> 'JOSE PEREZ'. """
+    sin_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return ' '.join(sin_acentos.upper().split())
+
+
+class IndicePacientes:
+    def __init__(self, duracion=DURACION):
+        self.duracion = duracion
+        self._datos = ([], [], {})
+        self._construido = None
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        self._construido = None
+
+    def _construir(self):
+        from .models import Usuario
+
+        entradas = []
+        nombres = {}
+        pacientes = Usuario.objects.filter(role_id='paciente', is_active=True).values_list(
+            'clave', 'nombres', 'apellido_paterno', 'apellido_materno'
+        )
+        for clave, nombre, paterno, materno in pacientes.iterator():
+            apellidos = ' '.join(parte for parte in (paterno, materno) if parte)
+            nombres[clave] = f'{nombre} {apellidos}'.strip()
+            entradas.append((normalizar(clave), clave))
+            entradas.append((normalizar(f'{nombre} {apellidos}'), clave))
+            entradas.append((normalizar(f'{apellidos} {nombre}'), clave))
+        entradas.sort()
+        # Se reemplaza la tupla completa para que las búsquedas en curso en otros
+        # hilos sigan viendo una versión consistente
+        self._datos = ([llave for llave, _ in entradas], [clave for _, clave in entradas], nombres)
+        self._construido = time.monotonic()
+
+    def _asegurar_vigente(self):
+        construido = self._construido
+        if construido is not None and time.monotonic() - construido < self.duracion:
+            return
+        with self._lock:
+            construido = self._construido
+            if construido is None or time.monotonic() - construido >= self.duracion:
+                self._construir()
+
+    def buscar(self, texto, limite=LIMITE):
+        """
+        Devuelve hasta `limite` pacientes activos cuya clave o nombre empiece con
+        `texto`, como diccionarios con `clave` y `nombre`.
+        """
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        self._asegurar_vigente()
+        llaves, claves, nombres = self._datos
+
+        resultados = []
+        vistos = set()
+        i = bisect_left(llaves, prefijo)
+        while i < len(llaves) and llaves[i].startswith(prefijo) and len(resultados) < limite:
+            clave = claves[i]
+            if clave not in vistos:
+                vistos.add(clave)
+                resultados.append({'clave': clave, 'nombre': nombres[clave]})
+            i += 1
+        return resultados
+
+
+indice_pacientes = IndicePacientes()
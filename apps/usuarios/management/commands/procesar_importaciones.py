@@ -0,0 +1,16 @@
+from sistema_medico.trabajos import ComandoTrabajos
+
+from ...models import TrabajoImportacion
+from ...trabajos import procesar
+
+
+class Command(ComandoTrabajos):
+    help = 'Procesa por bloques las cargas masivas de usuarios enviadas desde el admin'
+    modelo = TrabajoImportacion
+    nombre = 'importaciones'
+
+    def procesar(self, trabajo):
+        procesar(trabajo)
+
+    def resumen(self, trabajo):
+        return f'{trabajo.creados} creados, {trabajo.actualizados} actualizados, {trabajo.total_errores} errores'
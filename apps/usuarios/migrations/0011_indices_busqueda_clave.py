@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from sistema_medico.migraciones import RunSQLPostgreSQL
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0010_contactoemergencia_and_more'),
+    ]
+
+    # Índices sobre UPPER(id_historial) para la búsqueda de historiales por clave
+    operations = [
+        RunSQLPostgreSQL(
+            sql='CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            # La extensión puede usarla otra tabla; no se borra al revertir
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        RunSQLPostgreSQL(
+            sql='CREATE INDEX IF NOT EXISTS usuarios_historial_clave_upper_like ON usuarios_historialmedico '
+                'USING btree ((UPPER(id_historial)) text_pattern_ops)',
+            reverse_sql='DROP INDEX IF EXISTS usuarios_historial_clave_upper_like',
+        ),
+        RunSQLPostgreSQL(
+            sql='CREATE INDEX IF NOT EXISTS usuarios_historial_clave_upper_trgm ON usuarios_historialmedico '
+                'USING gin ((UPPER(id_historial)) gin_trgm_ops)',
+            reverse_sql='DROP INDEX IF EXISTS usuarios_historial_clave_upper_trgm',
+        ),
+    ]
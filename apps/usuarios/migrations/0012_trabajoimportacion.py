@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:51
+
+import apps.usuarios.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0011_indices_busqueda_clave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(upload_to=apps.usuarios.models._ruta_importacion)),
+                ('nombre', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('terminado', 'Terminado'), ('error', 'Error')], default='pendiente', max_length=10)),
+                ('total_filas', models.IntegerField(blank=True, null=True)),
+                ('filas_procesadas', models.IntegerField(default=0)),
+                ('creados', models.IntegerField(default=0)),
+                ('actualizados', models.IntegerField(default=0)),
+                ('errores', models.JSONField(blank=True, default=list)),
+                ('total_errores', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('administrador', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='importaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-creado', '-id'],
+                'indexes': [models.Index(fields=['estado', 'creado'], name='usuarios_tr_estado_7ea63f_idx')],
+            },
+        ),
+    ]
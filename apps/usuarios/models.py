@@ -4,11 +4,14 @@ from django.contrib.auth.models import (
     BaseUserManager,
     PermissionsMixin,
 )
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
+from sistema_medico.trabajos import Trabajo, ruta_aleatoria
+
+from .referencias import datos_referencia, rol_por_area
+
 
 class UsuarioManager(BaseUserManager):
     """
@@ -23,7 +26,7 @@ class UsuarioManager(BaseUserManager):
     Returns:
         Usuario: Objeto de usuario creado y guardado en la base de datos.
     """
-    def create_user(self, clave, nombres, email, apellido_paterno, fecha_nacimiento, sexo=None, apellido_materno=None, password=None, role=None, carrera_o_puesto=None):
+    def create_user(self, clave, nombres, email, apellido_paterno, fecha_nacimiento, sexo=None, apellido_materno=None, password=None, role=None, carrera_o_puesto=None, **extra_fields):
         if not email:
             raise ValueError('El usuario debe tener un correo electrónico')
 
@@ -32,25 +35,12 @@ class UsuarioManager(BaseUserManager):
 
         # Asignar el rol por defecto si no se proporciona uno
         if role is None:
-            # role = Role.objects.get(nombre_rol='paciente')
-            area_nombre = carrera_o_puesto
-            if area_nombre == 'Médico':
-                role = Role.objects.get(nombre_rol='medico')
-            # if area_nombre == 'ADMINISTRATIVO':
-            #     role = Role.objects.get(nombre_rol='administrador')
-            else:
-                role = Role.objects.get(nombre_rol='paciente')
-
-        # Buscar role y carrera
-        try:
-            role_obj = Role.objects.get(nombre_rol=role)
-        except ObjectDoesNotExist:
-            raise ValueError(f"El rol {role} no existe")
+            role = rol_por_area(carrera_o_puesto)
 
-        # Buscar objeto de área correspondiente en la base de datos
-        try:
-            carrera_o_puesto_obj = Area.objects.get(carrera_o_puesto=carrera_o_puesto)
-        except ObjectDoesNotExist:
+        # Roles y áreas salen de la copia en memoria, sin consultar la base de datos
+        if not datos_referencia.existe_rol(role):
+            raise ValueError(f"El rol {role} no existe")
+        if not datos_referencia.existe_area(carrera_o_puesto):
             raise ValueError(f"La carrera o puesto {carrera_o_puesto} no existe")
 
         # Crear instancia de usuario con los datos proporcionados
@@ -62,11 +52,19 @@ class UsuarioManager(BaseUserManager):
             apellido_materno=apellido_materno,
             fecha_nacimiento=fecha_nacimiento,
             sexo=sexo,
-            role=role_obj,
-            carrera_o_puesto=carrera_o_puesto_obj
+            role_id=role,
+            carrera_o_puesto_id=carrera_o_puesto,
+            **extra_fields
         )
         usuario.set_password(password)  # Hashea la contraseña
-        usuario.save(using=self._db)
+        # El usuario, su grupo y su historial (señal post_save) se guardan juntos.
+        # Si quien llama ya abrió una transacción (p. ej. la carga masiva) basta
+        # con la suya y se evita el SAVEPOINT
+        if transaction.get_connection(using=self._db).in_atomic_block:
+            usuario.save(using=self._db, force_insert=True)
+        else:
+            with transaction.atomic(using=self._db):
+                usuario.save(using=self._db, force_insert=True)
 
         return usuario
 
@@ -81,7 +79,7 @@ class UsuarioManager(BaseUserManager):
         Usuario: Objeto de superusuario creado y guardado en la base de datos.
     """
     def create_superuser(self, clave, nombres, email, apellido_paterno=None, apellido_materno=None, fecha_nacimiento=None, sexo=None, password=None, role="paciente", carrera_o_puesto="ADMINISTRATIVO"):
-        usuario = self.create_user(
+        return self.create_user(
             clave=clave,
             nombres=nombres,
             email=email,
@@ -91,12 +89,10 @@ class UsuarioManager(BaseUserManager):
             sexo=sexo,
             password=password,
             role=role,
-            carrera_o_puesto=carrera_o_puesto
+            carrera_o_puesto=carrera_o_puesto,
+            is_staff=True,
+            is_superuser=True,
         )
-        usuario.is_staff = True
-        usuario.is_superuser = True
-        usuario.save(using=self._db)
-        return usuario
 
 
 class Area(models.Model):
@@ -200,8 +196,9 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         if not self.pk and not self.has_usable_password():
             self.set_password(settings.DEFAULT_PASSWORD)
 
-        if self.role is None:
-            self.role = Role.objects.get(nombre_rol='paciente')
+        # role_id es el nombre del rol: asignarlo no requiere consultar Role
+        if self.role_id is None:
+            self.role_id = 'paciente'
 
         super().save(*args, **kwargs)
 
@@ -262,3 +259,40 @@ class ContactoEmergencia(models.Model):
 
     def __str__(self):
         return f"{self.nombre} ({self.parentesco}) - {self.telefono}"
+
+
+def _ruta_importacion(instance, filename):
+    return ruta_aleatoria('importaciones', filename)
+
+
+class TrabajoImportacion(Trabajo):
+    """
+    Carga masiva de usuarios procesada por bloques fuera de la petición por el
+    comando `procesar_importaciones`. Cada bloque se guarda en su propia
+    transacción junto con el avance, así que el admin puede consultar cuántas
+    filas van y una interrupción no deshace los bloques ya terminados.
+    """
+    MENSAJE_INTERRUMPIDO = 'La importación se interrumpió.'
+
+    administrador = models.ForeignKey('Usuario', on_delete=models.SET_NULL, null=True, related_name='importaciones')
+    archivo = models.FileField(upload_to=_ruta_importacion)
+    nombre = models.CharField(max_length=255)
+    total_filas = models.IntegerField(null=True, blank=True)
+    filas_procesadas = models.IntegerField(default=0)
+    creados = models.IntegerField(default=0)
+    actualizados = models.IntegerField(default=0)
+    # Solo los primeros errores por fila; `total_errores` los cuenta todos
+    errores = models.JSONField(default=list, blank=True)
+    total_errores = models.IntegerField(default=0)
+
+    class Meta(Trabajo.Meta):
+        indexes = [models.Index(fields=["estado", "creado"]),]
+
+    def __str__(self):
+        return f"Importación {self.pk} - {self.nombre} - {self.estado}"
+
+    @property
+    def porcentaje(self):
+        if not self.total_filas:
+            return 100 if self.estado == self.TERMINADO else 0
+        return min(100, round(self.filas_procesadas * 100 / self.total_filas))
@@ -0,0 +1,164 @@
+"""
+Datos de referencia: roles, áreas, grupos y categorías de padecimiento.
+
+Son tablas pequeñas que casi nunca cambian, así que cada proceso las lee una
+vez y las consulta en memoria como diccionarios en lugar de pedirlas a la base
+de datos en cada formulario, alta de usuario o gráfica del dashboard.
+
+Las señales `post_save`/`post_delete` de esos modelos invalidan la copia del
+proceso que hizo el cambio y, al confirmarse la transacción, publican una
+versión nueva en la caché compartida `referencias` (en la base de datos). Cada
+proceso revisa esa versión a lo más cada `REVISAR` segundos y vuelve a leer
+las tablas si cambió, así que los demás workers de gunicorn ven el cambio sin
+reiniciarse. Si un nombre no aparece, se vuelve a leer antes de darlo por
+inexistente, por si se creó en otro proceso después de la última revisión; el
+faltante se recuerda hasta la siguiente revisión para no releer las tablas en
+cada búsqueda del mismo nombre.
+
+La caché compartida es opcional: si no se puede leer (p. ej. falta correr
+`createcachetable`) cada proceso sigue con su copia y solo ve los cambios
+hechos por él mismo.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+
+
+logger = logging.getLogger(__name__)
+
+REVISAR = 5
+ALIAS_CACHE = 'referencias'
+LLAVE_VERSION = 'datos_referencia:version'
+
+# Grupo que recibe cada rol al crear un usuario
+GRUPOS_POR_ROL = {'medico': 'Medico', 'paciente': 'Paciente'}
+AREA_MEDICO = 'Médico'
+
+
+def rol_por_area(area):
+    """ Rol que recibe un usuario según su carrera o puesto cuando no se indica uno. """
+    return 'medico' if area == AREA_MEDICO else 'paciente'
+
+
+def _version_compartida():
+    try:
+        # Punto de guardado: en PostgreSQL un error dentro de una transacción la invalida
+        with transaction.atomic():
+            return caches[ALIAS_CACHE].get(LLAVE_VERSION)
+    except DatabaseError as e:
+        logger.warning('No se pudo leer la versión de los datos de referencia: %s', e)
+        return None
+
+
+def _publicar_version():
+    try:
+        caches[ALIAS_CACHE].set(LLAVE_VERSION, uuid.uuid4().hex, None)
+    except DatabaseError as e:
+        # Sin la tabla de la caché (p. ej. durante el primer `migrate`, antes de
+        # `createcachetable`) no hay otros procesos que avisar
+        logger.warning('No se pudo publicar la versión de los datos de referencia: %s', e)
+
+
+class DatosReferencia:
+    def __init__(self, revisar=REVISAR):
+        self.revisar = revisar
+        self._datos = None
+        self._version = None
+        self._revisado = None
+        # Cuántas veces se han leído las tablas en este proceso
+        self._lecturas = 0
+        # (tipo, llave) buscados que no existían en la última lectura
+        self._faltantes = set()
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        self._revisado = None
+        self._datos = None
+        self._faltantes = set()
+
+    def publicar_cambio(self):
+        """ Invalida la copia de este proceso y, al confirmar la transacción, la de los demás. """
+        self.invalidar()
+
+        def publicar():
+            self.invalidar()
+            _publicar_version()
+
+        transaction.on_commit(publicar)
+
+    def _cargar(self):
+        from django.contrib.auth.models import Group
+
+        from apps.consultas.models import CategoriaPadecimiento
+
+        from .models import Area, Role
+
+        # La versión se lee antes que las tablas: un cambio a la mitad provoca otra lectura
+        version = _version_compartida()
+        self._datos = {
+            'roles': dict(Role.objects.values_list('nombre_rol', 'descripcion')),
+            'areas': dict.fromkeys(Area.objects.values_list('carrera_o_puesto', flat=True), True),
+            'grupos': dict(Group.objects.values_list('name', 'pk')),
+            'categorias': dict(CategoriaPadecimiento.objects.order_by('pk').values_list('pk', 'padecimiento')),
+        }
+        self._version = version
+        self._lecturas += 1
+
+    def vigentes(self):
+        """ Diccionarios de referencia de este proceso, revisando la versión compartida si toca. """
+        datos, revisado = self._datos, self._revisado
+        if datos is not None and revisado is not None and time.monotonic() - revisado < self.revisar:
+            return datos
+        with self._lock:
+            if self._datos is None or _version_compartida() != self._version:
+                self._cargar()
+            self._faltantes = set()
+            self._revisado = time.monotonic()
+            return self._datos
+
+    def _buscar(self, tipo, llave):
+        lecturas = self._lecturas
+        datos = self.vigentes()
+        if llave in datos[tipo] or (tipo, llave) in self._faltantes:
+            return datos[tipo]
+        with self._lock:
+            # Si `vigentes` acaba de leer las tablas no hace falta otra lectura
+            if self._lecturas == lecturas:
+                self._cargar()
+            if llave not in self._datos[tipo]:
+                self._faltantes.add((tipo, llave))
+            self._revisado = time.monotonic()
+            return self._datos[tipo]
+
+    def existe_rol(self, nombre):
+        return nombre in self._buscar('roles', nombre)
+
+    def existe_area(self, nombre):
+        return nombre in self._buscar('areas', nombre)
+
+    def grupo_id(self, nombre):
+        """ Id del grupo `nombre` o None si no existe. """
+        return self._buscar('grupos', nombre).get(nombre)
+
+    def roles(self):
+        """ {nombre_rol: descripcion} """
+        return self.vigentes()['roles']
+
+    def areas(self):
+        """ {carrera_o_puesto: True}, para buscar por nombre. """
+        return self.vigentes()['areas']
+
+    def grupos(self):
+        """ {name: id} de los grupos de permisos. """
+        return self.vigentes()['grupos']
+
+    def categorias(self):
+        """ {id_padecimiento: padecimiento} en orden de id. """
+        return self.vigentes()['categorias']
+
+
+datos_referencia = DatosReferencia()
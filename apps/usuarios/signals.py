@@ -1,93 +1,92 @@
+from django.apps import apps as global_apps
+from django.contrib.auth.management import create_permissions
 from django.contrib.auth.models import Group, Permission
-from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_migrate, post_save
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from apps.consultas.models import Consulta
+from apps.consultas.models import CategoriaPadecimiento
 
+from .referencias import AREA_MEDICO, GRUPOS_POR_ROL, datos_referencia
+from .indice_pacientes import indice_pacientes
 from .models import Area, HistorialMedico, Role, Usuario
 
 
-@receiver(post_migrate)
-def crear_roles_por_defecto(sender, **kwargs):
+ROLES = ["paciente", "medico"]  # admin
+
+AREAS = [
+    "ING. SISTEMAS COMP.",
+    "ING. BIOQUÍMICA",
+    "ING. MECATRÓNICA",
+    "ING. INDUSTRIAL",
+    "I. ELECTROMECÁNICA",
+    "GASTRONOMÍA",
+    "M. EN INGENIERÍA",
+    AREA_MEDICO,
+    "ADMINISTRATIVO",
+    "DOCENTE",
+]
+
+# Permisos de cada grupo como (app, codename); el grupo Administrador recibe todos
+PERMISOS_GRUPOS = {
+    "Medico": [
+        ("consultas", "view_consulta"),  # Permiso para ver consultas
+        ("consultas", "add_consulta"),  # Permiso para agregar consultas
+        ("usuarios", "view_historialmedico"),  # Permiso para ver historial médico
+        ("usuarios", "view_usuario"),  # Permiso para ver usuarios
+        ("usuarios", "change_usuario"),  # Permiso para cambiar usuarios
+    ],
+    "Paciente": [
+        ("consultas", "view_consulta"),  # Permiso para ver consultas
+        ("usuarios", "view_historialmedico"),  # Permiso para ver historial médico
+        ("usuarios", "change_historialmedico"),  # Permiso para cambiar historial médico
+        ("usuarios", "view_usuario"),  # Permiso para ver usuarios
+        ("usuarios", "change_usuario"),  # Permiso para cambiar usuarios
+    ],
+    "Administrador": None,
+}
+
+
+# Los dos receptores se conectan a `post_migrate` en `UsuariosConfig.ready` con
+# `sender` igual a esta app, así que corren una sola vez por `migrate`
+def crear_roles_y_areas_por_defecto(sender, using=DEFAULT_DB_ALIAS, **kwargs):
     """
-    Esta función crea los roles por defecto en la base de datos después de que se haya realizado una migración.
-
-    Los roles por defecto son: 'paciente', 'medico', y 'admin'.
-    Si ya existen en la base de datos, no se crean nuevamente.
+    Crea los roles ('paciente', 'medico') y las áreas por defecto después de migrar,
+    con dos inserciones en bloque; los que ya existen se ignoran.
     """
-    roles = ["paciente", "medico"] # admin
-    for role in roles:
-        Role.objects.get_or_create(nombre_rol=role)
+    Role.objects.using(using).bulk_create([Role(nombre_rol=rol) for rol in ROLES], ignore_conflicts=True)
+    Area.objects.using(using).bulk_create([Area(carrera_o_puesto=area) for area in AREAS], ignore_conflicts=True)
 
 
-@receiver(post_migrate)
-def crear_areas_por_defecto(sender, **kwargs):
+def crear_grupos_permisos(sender, using=DEFAULT_DB_ALIAS, apps=global_apps, **kwargs):
     """
-    Esta función crea áreas por defecto en la base de datos después de que se haya realizado una migración.
+    Crea los grupos 'Medico', 'Paciente' y 'Administrador' y les agrega sus
+    permisos; el grupo Administrador recibe todos los permisos.
 
-    Las áreas por defecto incluyen diferentes disciplinas y puestos relacionados con la institución.
-    Si ya existen en la base de datos, no se crean nuevamente.
-    """
-    areas = [
-        "ING. SISTEMAS COMP.",
-        "ING. BIOQUÍMICA",
-        "ING. MECATRÓNICA",
-        "ING. INDUSTRIAL",
-        "I. ELECTROMECÁNICA",
-        "GASTRONOMÍA",
-        "M. EN INGENIERÍA",
-        "Médico",
-        "ADMINISTRATIVO",
-        "DOCENTE",
-    ]
-    for area in areas:
-        Area.objects.get_or_create(carrera_o_puesto=area)
-
-
-@receiver(post_migrate)
-def crear_grupos_permisos(sender, **kwargs):
+    Usa inserciones en bloque que ignoran los grupos y permisos ya asignados y
+    publica la versión nueva de los datos de referencia sembrados.
     """
-    Esta función crea los grupos de usuarios y asigna los permisos correspondientes a cada uno después de una migración.
+    # `post_migrate` de las apps que van después de esta en INSTALLED_APPS (p. ej.
+    # consultas) aún no ha creado sus permisos; `create_permissions` solo inserta
+    # los que faltan
+    for app_config in global_apps.get_app_configs():
+        create_permissions(app_config, verbosity=0, using=using, apps=apps)
 
-    Los grupos creados son: 'Medico', 'Paciente', y 'Administrador'.
-    Además, se asignan permisos específicos a cada grupo según el modelo al que se refieren.
-    """
-    # Crear grupos si no existen
-    medico_group, _ = Group.objects.get_or_create(name="Medico")  # Crear el grupo 'Medico'
-    paciente_group, _ = Group.objects.get_or_create(name="Paciente")  # Crear el grupo 'Paciente'
-    admin_group, _ = Group.objects.get_or_create(name="Administrador")  # Crear el grupo 'Administrador'
-
-    # Definir permisos y grupos
-    permisos_medico = [
-        ('view_consulta', Consulta),  # Permiso para ver consultas
-        ('add_consulta', Consulta),  # Permiso para agregar consultas
-        ('view_historialmedico', HistorialMedico),  # Permiso para ver historial médico
-        ('view_usuario', Usuario),  # Permiso para ver usuarios
-        ('change_usuario', Usuario),  # Permiso para cambiar usuarios
-    ]
-    permisos_paciente = [
-        ('view_consulta', Consulta),  # Permiso para ver consultas
-        ('view_historialmedico', HistorialMedico),  # Permiso para ver historial médico
-        ('change_historialmedico', HistorialMedico),  # Permiso para cambiar historial médico
-        ('view_usuario', Usuario),  # Permiso para ver usuarios
-        ('change_usuario', Usuario),  # Permiso para cambiar usuarios
-    ]
-
-    # Asignar permisos a los grupos
-    def asignar_permisos(grupo, permisos):
-        for permiso_codename, model in permisos:
-            content_type = ContentType.objects.get_for_model(model)
-            permission, _ = Permission.objects.get_or_create(codename=permiso_codename, content_type=content_type)
-            grupo.permissions.add(permission)
-
-    # Asignar permisos a cada grupo
-    asignar_permisos(medico_group, permisos_medico)
-    asignar_permisos(paciente_group, permisos_paciente)
-
-    # Asignar todos los permisos al grupo Administrador
-    all_permissions = Permission.objects.all()
-    admin_group.permissions.set(all_permissions)
+    Group.objects.using(using).bulk_create([Group(name=nombre) for nombre in PERMISOS_GRUPOS], ignore_conflicts=True)
+    grupos = dict(Group.objects.using(using).filter(name__in=PERMISOS_GRUPOS).values_list('name', 'pk'))
+    permisos = {
+        (app, codename): pk
+        for app, codename, pk in Permission.objects.using(using).values_list('content_type__app_label', 'codename', 'pk')
+    }
+
+    GrupoPermiso = Group.permissions.through
+    asignaciones = []
+    for nombre, lista in PERMISOS_GRUPOS.items():
+        ids = permisos.values() if lista is None else [permisos[permiso] for permiso in lista if permiso in permisos]
+        asignaciones.extend(GrupoPermiso(group_id=grupos[nombre], permission_id=pk) for pk in ids)
+    GrupoPermiso.objects.using(using).bulk_create(asignaciones, batch_size=500, ignore_conflicts=True)
+
+    datos_referencia.publicar_cambio()
 
 
 @receiver(post_save, sender=Usuario)
@@ -95,27 +94,43 @@ def asignar_grupo_y_crear_historial(sender, instance, created, **kwargs):
     """
     Esta función se ejecuta automáticamente después de que se cree un nuevo usuario ('Usuario').
 
-    Dependiendo del rol del usuario, se asigna a un grupo correspondiente (Medico, Paciente, Administrador).
+    Dependiendo del rol del usuario, se asigna a un grupo correspondiente (Medico, Paciente).
     Si el rol es 'paciente', también se crea un historial médico para el paciente si corresponde.
+    El grupo sale de `datos_referencia`, así que solo se escriben la membresía y el
+    historial, dentro de la misma transacción que el usuario y sin volver a guardarlo.
     """
     # Verificar si el usuario ha sido creado (no actualizado)
-    if created:
-        # Si el usuario es un médico, asignarlo al grupo 'Medico'
-        if instance.role == Role.objects.get(nombre_rol='medico'):
-            medico_group = Group.objects.get(name='Medico')
-            instance.groups.add(medico_group)
-
-        # Si el usuario es un paciente, asignarlo al grupo 'Paciente' y crear un historial médico
-        elif instance.role == Role.objects.get(nombre_rol='paciente'):
-            paciente_group = Group.objects.get(name='Paciente')
-            instance.groups.add(paciente_group)
-            # Si el paciente tiene una carrera o puesto (y no es médico), crear su historial médico
-            if instance.carrera_o_puesto and instance.carrera_o_puesto != 'Médico':
-                HistorialMedico.objects.create(id_historial=instance.clave, paciente=instance)
-
-        # Si el usuario es un administrador, asignarlo al grupo 'Administrador'
-        # elif instance.role == Role.objects.get(nombre_rol='admin'):
-        #     admin_group = Group.objects.get(name='Administrador')
-        #     instance.groups.add(admin_group)
-        # Guardar el usuario con los cambios de grupo
-        instance.save()
+    if not created:
+        return
+
+    grupo = GRUPOS_POR_ROL.get(instance.role_id)
+    grupo_id = grupo and datos_referencia.grupo_id(grupo)
+    if grupo_id:
+        instance.groups.add(grupo_id)
+
+    # Si el paciente tiene una carrera o puesto (y no es médico), crear su historial médico
+    if instance.role_id == 'paciente' and instance.carrera_o_puesto_id not in (None, AREA_MEDICO):
+        HistorialMedico.objects.create(id_historial=instance.clave, paciente=instance)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=CategoriaPadecimiento)
+@receiver(post_delete, sender=CategoriaPadecimiento)
+def invalidar_referencias(sender, **kwargs):
+    """ Vuelve a leer los datos de referencia en este proceso y en los demás workers. """
+    datos_referencia.publicar_cambio()
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_indice_pacientes(sender, instance, update_fields=None, **kwargs):
+    """ Reconstruye el índice del autocompletado en la siguiente búsqueda. """
+    # Iniciar sesión solo actualiza `last_login`, que no forma parte del índice
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    indice_pacientes.invalidar()
@@ -1,5 +1,36 @@
-from django.test import TestCase
-from apps.usuarios.models import Usuario, HistorialMedico, Role
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.contrib.auth.hashers import check_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.consultas.models import CategoriaPadecimiento, Consulta
+from apps.usuarios.carga_masiva import (
+    cifrar_contrasenas,
+    crear_historiales_y_grupos,
+    leer_bloques,
+    validar_filas,
+)
+from apps.usuarios.busqueda import PREFIJO, filtrar_por_clave
+from apps.usuarios.indice_pacientes import IndicePacientes, indice_pacientes
+from apps.usuarios.referencias import ALIAS_CACHE, LLAVE_VERSION, DatosReferencia, datos_referencia
+from apps.usuarios.models import Area, Usuario, HistorialMedico, Role, TrabajoImportacion
+from apps.usuarios.trabajos import procesar
+from sistema_medico.medicion import MedicionPeticionesMiddleware
+from sistema_medico.tests_utils import STORAGES_PRUEBAS, crear_usuario
 
 
 class UsuarioTestCase(TestCase):
@@ -35,6 +66,31 @@ class UsuarioTestCase(TestCase):
         usuario = Usuario.objects.get(email='isc221733@itsatlixco.edu.mx')
         self.assertEqual('paciente', usuario.role.nombre_rol)
 
+    def test_crear_usuario_en_una_sola_escritura(self):
+        # INSERT del usuario, de su grupo y de su historial, y el UPDATE del resumen por área;
+        # la prueba ya corre dentro de una transacción, así que no hay SAVEPOINT
+        datos_referencia.vigentes()
+        with self.assertNumQueries(4):
+            usuario = Usuario.objects.create_user(
+                clave='ISC221735',
+                email='isc221735@itsatlixco.edu.mx',
+                nombres='JANE',
+                apellido_paterno='DOE',
+                fecha_nacimiento='1990-01-01',
+                carrera_o_puesto='ING. SISTEMAS COMP.',
+                password='P@ssword123',
+            )
+        self.assertEqual('paciente', usuario.role_id)
+        self.assertEqual(['Paciente'], list(usuario.groups.values_list('name', flat=True)))
+        self.assertTrue(HistorialMedico.objects.filter(id_historial='ISC221735').exists())
+        self.assertTrue(Usuario.objects.get(clave='ISC221735').check_password('P@ssword123'))
+
+        with self.assertRaisesMessage(ValueError, 'La carrera o puesto NO EXISTE no existe'):
+            Usuario.objects.create_user(
+                clave='ISC221736', email='isc221736@itsatlixco.edu.mx', nombres='JANE',
+                apellido_paterno='DOE', fecha_nacimiento=None, carrera_o_puesto='NO EXISTE',
+            )
+
     def test_user2_exists(self):
         usuario = Usuario.objects.get(email='isc221734@itsatlixco.edu.mx')
         self.assertEqual(self.user2, usuario)
@@ -84,3 +140,493 @@ class HistorialMedicoTestCase(TestCase):
     def test_user_role(self):
         usuario = Usuario.objects.get(email='isc221744@itsatlixco.edu.mx')
         self.assertEqual('paciente', usuario.role.nombre_rol)
+
+    def test_buscar_historial_por_clave(self):
+        historiales = HistorialMedico.objects.all()
+        for texto in (' isc2217 ', 'ISC221744', '1744', 'sc22'):
+            self.assertEqual(
+                [self.historial_medico.pk],
+                list(filtrar_por_clave(historiales, 'id_historial', texto).values_list('pk', flat=True)),
+            )
+        # Solo cuando se pide prefijo la coincidencia tiene que empezar la clave
+        self.assertFalse(filtrar_por_clave(historiales, 'id_historial', 'SC22', modo=PREFIJO).exists())
+        self.assertEqual(1, filtrar_por_clave(historiales, 'id_historial', 'ISC22', modo=PREFIJO).count())
+
+
+@override_settings(STORAGES=STORAGES_PRUEBAS)
+class MedicoDashboardTestCase(TestCase):
+    # Tamaño máximo aceptable del HTML del dashboard (plotly.js ya no va incrustado)
+    LIMITE_BYTES_DASHBOARD = 100 * 1024
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_usuario('ISC221734', 'medico')
+        cls.paciente = crear_usuario('ISC221733', sexo='F')
+        Consulta.objects.create(
+            padecimiento_actual='Padecimiento actual',
+            categoria_de_padecimiento=CategoriaPadecimiento.objects.get(padecimiento='IRAS'),
+            clave_paciente=cls.paciente,
+            clave_medico=cls.medico
+        )
+
+    def test_dashboard_dentro_del_presupuesto(self):
+        self.client.force_login(self.medico)
+        response = self.client.get(reverse('medico_dashboard'))
+
+        self.assertEqual(200, response.status_code)
+        self.assertLess(len(response.content), self.LIMITE_BYTES_DASHBOARD)
+        self.assertContains(response, 'js/plotly.min.js', count=1)
+
+    def test_graficas_json_con_etag(self):
+        self.client.force_login(self.medico)
+        for grafica in ('habitos', 'consultas', 'areas', 'padecimientos', 'genero'):
+            response = self.client.get(reverse('medico_grafica', args=[grafica]))
+            self.assertEqual(200, response.status_code)
+            self.assertTrue(response.json()['figuras'])
+            self.assertTrue(response.has_header('ETag'))
+
+            response = self.client.get(
+                reverse('medico_grafica', args=[grafica]),
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+            self.assertEqual(304, response.status_code)
+
+    def test_grafica_cambia_etag_con_datos_nuevos(self):
+        self.client.force_login(self.medico)
+        url = reverse('medico_grafica', args=['consultas'])
+        etag = self.client.get(url)['ETag']
+
+        Consulta.objects.create(
+            padecimiento_actual='Padecimiento actual',
+            categoria_de_padecimiento=CategoriaPadecimiento.objects.get(padecimiento='CEFALEA'),
+            clave_paciente=self.paciente,
+            clave_medico=self.medico
+        )
+
+        self.assertEqual(200, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_grafica_inexistente(self):
+        self.client.force_login(self.medico)
+        response = self.client.get(reverse('medico_grafica', args=['inexistente']))
+        self.assertEqual(404, response.status_code)
+
+
+class IndicePacientesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        datos = [
+            ('ISC221733', 'JOSÉ', 'PÉREZ', 'LUNA', 'paciente'),
+            ('ISC221734', 'MARÍA', 'PÉREZ', 'SOLÍS', 'paciente'),
+            ('IND230001', 'JOSEFINA', 'RAMOS', '', 'paciente'),
+            ('1001', 'JOSÉ', 'PÉREZ', 'MÉDICO', 'medico'),
+        ]
+        for clave, nombres, paterno, materno, role in datos:
+            crear_usuario(clave, role, nombres=nombres, apellido_paterno=paterno, apellido_materno=materno)
+
+    def claves(self, indice, texto, **kwargs):
+        return [resultado['clave'] for resultado in indice.buscar(texto, **kwargs)]
+
+    def test_buscar_por_prefijo(self):
+        indice = IndicePacientes()
+        self.assertEqual(['ISC221733', 'ISC221734'], self.claves(indice, 'isc2217'))
+        # Nombre o apellidos primero, sin acentos ni mayúsculas, y solo pacientes
+        self.assertEqual(['ISC221733', 'IND230001'], self.claves(indice, 'jose'))
+        self.assertEqual(['ISC221733'], self.claves(indice, 'perez luna'))
+        self.assertEqual(['ISC221734'], self.claves(indice, 'María'))
+        self.assertEqual(['ISC221733'], self.claves(indice, 'isc', limite=1))
+        self.assertEqual([], self.claves(indice, '   '))
+        self.assertEqual(
+            [{'clave': 'IND230001', 'nombre': 'JOSEFINA RAMOS'}],
+            indice.buscar('ramos'),
+        )
+
+    def test_buscar_sin_consultar_la_base_de_datos(self):
+        indice = IndicePacientes()
+        indice.buscar('isc')
+        with self.assertNumQueries(0):
+            indice.buscar('jos')
+
+    def test_invalidar_al_guardar_usuario(self):
+        indice_pacientes.invalidar()
+        self.assertEqual(['ISC221733', 'ISC221734'], self.claves(indice_pacientes, 'ISC')[:2])
+        paciente = Usuario.objects.get(clave='ISC221733')
+        paciente.is_active = False
+        paciente.save()
+        self.assertEqual(['ISC221734'], self.claves(indice_pacientes, 'ISC'))
+
+        # Iniciar sesión solo actualiza last_login y no reconstruye el índice
+        indice_pacientes.buscar('ISC')
+        Usuario.objects.get(clave='ISC221734').save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            indice_pacientes.buscar('ISC')
+
+
+# Sin límite de peticiones para no consumir el de las demás pruebas, que comparten la caché
+class DatosReferenciaTestCase(TestCase):
+    def test_consultas_solo_al_cargar(self):
+        datos = DatosReferencia()
+        with self.assertNumQueries(7):
+            # Versión compartida (entre SAVEPOINT y RELEASE) y las cuatro tablas
+            self.assertIn('paciente', datos.roles())
+        with self.assertNumQueries(0):
+            self.assertTrue(datos.existe_area('ING. SISTEMAS COMP.'))
+            self.assertIsNotNone(datos.grupo_id('Paciente'))
+            datos.categorias()
+
+    def test_otro_proceso_ve_el_cambio_por_la_version_compartida(self):
+        # Otro worker: no recibe las señales de este proceso
+        otro = DatosReferencia(revisar=0)
+        self.assertNotIn('NUEVA AREA', otro.areas())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Area.objects.create(carrera_o_puesto='NUEVA AREA')
+        self.assertIsNotNone(caches[ALIAS_CACHE].get(LLAVE_VERSION))
+        self.assertIn('NUEVA AREA', otro.areas())
+
+        # Sin cambios de versión solo se consulta la caché compartida, dentro de su punto de guardado
+        with self.assertNumQueries(3):
+            otro.areas()
+
+    def test_nombre_desconocido_se_vuelve_a_leer(self):
+        datos = DatosReferencia(revisar=3600)
+        datos.vigentes()
+        Area.objects.bulk_create([Area(carrera_o_puesto='SIN SENAL')])  # sin post_save
+        self.assertTrue(datos.existe_area('SIN SENAL'))
+        self.assertFalse(datos.existe_area('NO EXISTE'))
+        # El faltante no vuelve a leer las tablas hasta la siguiente revisión
+        with self.assertNumQueries(0):
+            self.assertFalse(datos.existe_area('NO EXISTE'))
+            self.assertFalse(datos.existe_area('NO EXISTE'))
+        datos.invalidar()
+        with self.assertNumQueries(7):
+            self.assertFalse(datos.existe_area('NO EXISTE'))
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'referencias': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'tabla_inexistente'},
+    })
+    def test_sin_tabla_de_cache_usa_la_copia_del_proceso(self):
+        datos = DatosReferencia(revisar=0)
+        with self.assertLogs('apps.usuarios.referencias', 'WARNING'):
+            self.assertIn('paciente', datos.roles())
+            self.assertTrue(datos.existe_area('ING. SISTEMAS COMP.'))
+            # La transacción sigue utilizable después del error de la caché
+            self.assertTrue(Area.objects.filter(carrera_o_puesto='ING. SISTEMAS COMP.').exists())
+
+
+@override_settings(RATELIMIT_ENABLE=False, STORAGES=STORAGES_PRUEBAS)
+class ConsultasPorPeticionTestCase(TestCase):
+    """ Las vistas protegidas no deben leer el rol del usuario en consultas aparte. """
+    # Sesión, usuario con su rol y área, y lo que la vista necesita
+    VISTAS_MEDICO = {
+        'medico_dashboard': 2,
+        'medico_historiales': 4,
+        'medico_consultas': 3,
+        'crear_consulta': 4,
+        'exportaciones': 3,
+    }
+    VISTAS_PACIENTE = {
+        'paciente_dashboard': 3,
+        'historial': 3,
+        'paciente_consultas': 3,
+        'informacion': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_usuario('ISC221734', 'medico')
+        cls.paciente = crear_usuario('ISC221733')
+        categoria = CategoriaPadecimiento.objects.get(padecimiento='IRAS')
+        for _ in range(3):
+            Consulta.objects.create(
+                padecimiento_actual='Padecimiento actual',
+                categoria_de_padecimiento=categoria,
+                clave_paciente=cls.paciente,
+                clave_medico=cls.medico
+            )
+
+    def medir(self, usuario, vistas):
+        self.client.login(clave=usuario.clave, password='P@ssword123')
+        for nombre, limite in vistas.items():
+            with self.subTest(vista=nombre), CaptureQueriesContext(connection) as consultas:
+                response = self.client.get(reverse(nombre))
+                self.assertEqual(200, response.status_code)
+                self.assertLessEqual(len(consultas), limite, [q['sql'] for q in consultas.captured_queries])
+                self.assertFalse([q for q in consultas.captured_queries if 'FROM "usuarios_role"' in q['sql']])
+
+    def test_vistas_del_medico(self):
+        self.medir(self.medico, self.VISTAS_MEDICO)
+
+    def test_vistas_del_paciente(self):
+        self.medir(self.paciente, self.VISTAS_PACIENTE)
+
+    def test_login_redirige_sin_leer_el_rol(self):
+        self.client.login(clave=self.medico.clave, password='P@ssword123')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('login'))
+        self.assertRedirects(response, reverse('medico_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(2, len(consultas))
+
+
+@override_settings(MEDICION_PETICIONES=True, MEDICION_MAX_CONSULTAS=30, MEDICION_MAX_MS=60000, STORAGES=STORAGES_PRUEBAS)
+class MedicionPeticionesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_usuario('ISC221734', 'medico')
+
+    def cliente(self):
+        # Un cliente nuevo carga el middleware con los ajustes vigentes
+        cliente = Client()
+        cliente.force_login(self.medico)
+        return cliente
+
+    def test_server_timing_y_registro(self):
+        cliente = self.cliente()
+        with self.assertLogs('sistema_medico.medicion', 'INFO') as registro, \
+                CaptureQueriesContext(connection) as consultas:
+            response = cliente.get(reverse('medico_dashboard'))
+        self.assertEqual(200, response.status_code)
+        metricas = dict(parte.strip().split(';', 1) for parte in response['Server-Timing'].split(','))
+        self.assertEqual({'sql', 'plantillas', 'total'}, set(metricas))
+        self.assertIn(f'desc="{len(consultas)} consultas"', metricas['sql'])
+        self.assertNotRegex(metricas['plantillas'], r'dur=0\.0$')
+        [linea] = registro.records
+        self.assertEqual('INFO', linea.levelname)
+        self.assertIn(f'ruta=/medico/dashboard/ estado=200 consultas={len(consultas)} ', linea.getMessage())
+
+    def test_respuesta_en_flujo(self):
+        from django.template.base import Template
+
+        render = Template.render
+        cliente = self.cliente()
+        with self.assertLogs('sistema_medico.medicion', 'INFO') as registro, \
+                CaptureQueriesContext(connection) as consultas:
+            response = cliente.get(reverse('exportar_consultas'), {'formato': 'csv'})
+            antes = len(consultas)
+            self.assertEqual([], registro.records)
+            b''.join(response.streaming_content)
+            response.close()
+        # Las consultas de las filas se hacen al recorrer el contenido, después de los encabezados
+        self.assertGreater(len(consultas), antes)
+        self.assertIn(f'desc="{antes} consultas"', response['Server-Timing'])
+        [linea] = registro.records
+        self.assertIn(f' consultas={len(consultas)} ', linea.getMessage())
+        self.assertTrue(linea.getMessage().endswith(' flujo=1'))
+        # El render de plantillas se restaura al terminar cada petición
+        self.assertIs(render, Template.render)
+
+    def test_excede_limites(self):
+        with self.settings(MEDICION_MAX_CONSULTAS=0, MEDICION_MAX_MS=0), \
+                self.assertLogs('sistema_medico.medicion', 'WARNING') as registro:
+            self.cliente().get(reverse('medico_dashboard'))
+        self.assertTrue(registro.records[0].getMessage().endswith('excede=consultas,tiempo'))
+
+    def test_desactivado(self):
+        with self.settings(MEDICION_PETICIONES=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                MedicionPeticionesMiddleware(lambda request: HttpResponse())
+            self.assertNotIn('Server-Timing', self.cliente().get(reverse('medico_dashboard')))
+
+
+# MD5 solo para que las pruebas no tarden lo que tarda PBKDF2
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], DEFAULT_PASSWORD='P@ssword123', STORAGES=STORAGES_PRUEBAS)
+class CargaMasivaTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(
+            clave='admin1',
+            nombres='ADMIN',
+            email='admin1@admin.com',
+            apellido_paterno='ADMIN',
+            password='P@ssword123',
+        )
+
+    def test_cifrar_en_procesos_conserva_el_orden(self):
+        contrasenas = [f'P@ssword{i}' for i in range(40)]
+        contrasenas[7] = 7  # no es texto: make_password falla solo para esta fila
+        resultados = cifrar_contrasenas(contrasenas, procesos=2)
+
+        self.assertEqual(40, len(resultados))
+        self.assertFalse(resultados[7].ok)
+        for password, resultado in zip(contrasenas, resultados):
+            if password != 7:
+                self.assertTrue(check_password(password, resultado.password))
+
+    def test_validar_filas_por_columnas(self):
+        import pandas as pd
+
+        df = pd.DataFrame([
+            ['ISC221801', 'isc221801@itsatlixco.edu.mx', 'ANA', 'LOPEZ', 'ING. SISTEMAS COMP.', '01/02/2003', 'Clave@123'],
+            ['XYZ1', 'isc221802@itsatlixco.edu.mx', 'LUIS', 'RAMOS', 'ING. SISTEMAS COMP.', '31/02/2003', None],
+            ['ISC221803', 'admin1@admin.com', 'EVA', '', 'NO EXISTE', None, 'corta'],
+            ['1234', '1234@itsatlixco.edu.mx', 'JUAN', 'PEREZ', 'Médico', None, None],
+        ], columns=['clave', 'email', 'nombres', 'apellido_paterno', 'carrera_o_puesto', 'fecha_nacimiento', 'password'])
+
+        datos_referencia.vigentes()
+        # Solo los dueños de los correos: áreas y roles salen de la copia en memoria
+        with self.assertNumQueries(1):
+            filas, errores = validar_filas(df, 'P@ssword123')
+
+        self.assertEqual(['ISC221801', '1234'], [fila['clave'] for fila in filas])
+        self.assertEqual(('2003-02-01', 'paciente'), (filas[0]['fecha_nacimiento'], filas[0]['role_id']))
+        self.assertEqual(('P@ssword123', 'medico'), (filas[1]['password'], filas[1]['role_id']))
+        self.assertEqual(
+            [
+                (2, 'clave'), (2, 'fecha_nacimiento'),
+                (3, 'apellido_paterno'), (3, 'email'), (3, 'password'), (3, 'carrera_o_puesto'),
+            ],
+            [(error['fila'], error['columna']) for error in errores],
+        )
+
+    def test_historiales_y_grupos_en_bloque(self):
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(
+                clave=f'ISC2219{i:02d}', email=f'isc2219{i:02d}@itsatlixco.edu.mx', nombres='ANA',
+                apellido_paterno='LOPEZ', carrera_o_puesto_id='ING. SISTEMAS COMP.', role_id='paciente',
+            )
+            for i in range(12)
+        ] + [
+            Usuario(
+                clave='1234', email='1234@itsatlixco.edu.mx', nombres='JUAN',
+                apellido_paterno='PEREZ', carrera_o_puesto_id='Médico', role_id='medico',
+            )
+        ])
+
+        # Historiales y membresías: las mismas consultas para 13 usuarios que para 1000
+        datos_referencia.vigentes()
+        with self.assertNumQueries(2):
+            self.assertEqual((12, 13), crear_historiales_y_grupos(usuarios))
+        self.assertEqual(12, HistorialMedico.objects.filter(id_historial__startswith='ISC2219').count())
+        self.assertEqual(['Medico'], list(Usuario.objects.get(clave='1234').groups.values_list('name', flat=True)))
+        self.assertEqual(12, Usuario.objects.filter(clave__startswith='ISC2219', groups__name='Paciente').count())
+
+        # Repetir no duplica ni falla
+        crear_historiales_y_grupos(usuarios)
+        self.assertEqual(12, HistorialMedico.objects.filter(id_historial__startswith='ISC2219').count())
+
+    def test_reporte_de_errores_descargable(self):
+        csv = (
+            'clave,email,nombres,apellido_paterno,carrera_o_puesto\n'
+            'ISC221801,isc221801@itsatlixco.edu.mx,ANA,LOPEZ,ING. SISTEMAS COMP.\n'
+            'ISC221802,correo-no-valido,LUIS,RAMOS,ING. SISTEMAS COMP.\n'
+        )
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin:usuarios_usuario_bulk_upload'), {
+            'file': SimpleUploadedFile('alumnos.csv', csv.encode(), content_type='text/csv'),
+        })
+        self.assertTrue(Usuario.objects.filter(clave='ISC221801').exists())
+        self.assertFalse(Usuario.objects.filter(clave='ISC221802').exists())
+
+        response = self.client.get(reverse('admin:usuarios_usuario_errores_carga'))
+        self.assertEqual('text/csv; charset=utf-8', response['Content-Type'])
+        lineas = response.content.decode('utf-8-sig').splitlines()
+        self.assertEqual(['fila,clave,columna,error', '2,ISC221802,email,Formato de correo no válido'], lineas)
+
+    def test_carga_masiva_crea_usuarios_con_contrasena(self):
+        csv = (
+            'clave,email,nombres,apellido_paterno,apellido_materno,fecha_nacimiento,sexo,carrera_o_puesto,password\n'
+            'ISC221801,isc221801@itsatlixco.edu.mx,ANA,LOPEZ,,01/02/2003,F,ING. SISTEMAS COMP.,Clave@123\n'
+            'ISC221802,isc221802@itsatlixco.edu.mx,LUIS,RAMOS,DIAZ,03/04/2003,M,ING. SISTEMAS COMP.,\n'
+        )
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:usuarios_usuario_bulk_upload'), {
+            'file': SimpleUploadedFile('alumnos.csv', csv.encode(), content_type='text/csv'),
+        })
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(Usuario.objects.get(clave='ISC221801').check_password('Clave@123'))
+        self.assertTrue(Usuario.objects.get(clave='ISC221802').check_password(settings.DEFAULT_PASSWORD))
+        self.assertTrue(HistorialMedico.objects.filter(id_historial='ISC221801').exists())
+
+    def test_leer_xlsx_por_bloques(self):
+        from openpyxl import Workbook
+        from datetime import date
+
+        libro = Workbook()
+        hoja = libro.active
+        hoja.append(['clave', 'nombres', 'fecha_nacimiento'])
+        for i in range(5):
+            hoja.append([f'ISC22180{i}', 'ANA', date(2003, 2, 1)])
+        hoja.append([None, None, None])
+        hoja.append([1234, 'JUAN', None])
+        archivo = io.BytesIO()
+        libro.save(archivo)
+        archivo.seek(0)
+
+        bloques = list(leer_bloques(archivo, 'alumnos.xlsx', tamano_bloque=2))
+        self.assertEqual([2, 2, 2], [len(df) for df in bloques])
+        # El índice continúa entre bloques para numerar bien los errores
+        self.assertEqual([4, 5], list(bloques[2].index))
+        self.assertEqual(['ISC221804', '1234'], list(bloques[2]['clave']))
+        self.assertEqual('01/02/2003', bloques[0]['fecha_nacimiento'][0])
+
+    def test_importacion_en_segundo_plano_por_bloques(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        Usuario.objects.create(
+            clave='ISC221800', email='isc221800@itsatlixco.edu.mx', nombres='ANTES',
+            apellido_paterno='LOPEZ', carrera_o_puesto_id='ING. SISTEMAS COMP.', role_id='paciente',
+        )
+        csv = 'clave,email,nombres,apellido_paterno,carrera_o_puesto\n' + ''.join(
+            f'ISC2218{i:02d},isc2218{i:02d}@itsatlixco.edu.mx,ANA,LOPEZ,ING. SISTEMAS COMP.\n' for i in range(5)
+        ) + 'ISC221805,correo-no-valido,LUIS,RAMOS,ING. SISTEMAS COMP.\n'
+
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:usuarios_usuario_bulk_upload'), {
+            'file': SimpleUploadedFile('alumnos.csv', csv.encode(), content_type='text/csv'),
+            'en_segundo_plano': 'on',
+        })
+        trabajo = TrabajoImportacion.objects.get()
+        self.assertRedirects(
+            response, reverse('admin:usuarios_usuario_importacion', args=[trabajo.pk]), fetch_redirect_response=False
+        )
+        # La petición solo guarda el archivo
+        self.assertFalse(Usuario.objects.filter(clave='ISC221801').exists())
+
+        procesar(TrabajoImportacion.objects.tomar_siguiente(), tamano_bloque=2)
+
+        estado = self.client.get(reverse('admin:usuarios_usuario_importacion_estado', args=[trabajo.pk])).json()
+        self.assertEqual(
+            {'estado': 'terminado', 'activo': False, 'total_filas': 6, 'filas_procesadas': 6, 'porcentaje': 100,
+             'creados': 4, 'actualizados': 1, 'total_errores': 1, 'error': ''},
+            estado,
+        )
+        self.assertEqual('ANA', Usuario.objects.get(clave='ISC221800').nombres)
+        self.assertEqual(5, HistorialMedico.objects.filter(id_historial__startswith='ISC2218').count())
+        self.assertIsNone(TrabajoImportacion.objects.tomar_siguiente())
+
+        response = self.client.get(reverse('admin:usuarios_usuario_importacion_errores', args=[trabajo.pk]))
+        lineas = response.content.decode('utf-8-sig').splitlines()
+        self.assertEqual(['fila,clave,columna,error', '6,ISC221805,email,Formato de correo no válido'], lineas)
+        self.assertContains(
+            self.client.get(reverse('admin:usuarios_usuario_importacion', args=[trabajo.pk])), 'Terminado'
+        )
+
+    def test_importacion_sin_archivo(self):
+        # El archivo se guardó en un MEDIA_ROOT que el proceso de importación no ve
+        trabajo = TrabajoImportacion.objects.create(archivo='importaciones/no-existe/alumnos.csv', nombre='alumnos.csv')
+        with self.assertLogs('apps.usuarios.trabajos', 'ERROR'):
+            procesar(TrabajoImportacion.objects.tomar_siguiente())
+        trabajo.refresh_from_db()
+        self.assertEqual(TrabajoImportacion.ERROR, trabajo.estado)
+        self.assertIn('no está disponible', trabajo.error)
+
+
+class ArranqueTestCase(SimpleTestCase):
+    def test_arranque_no_importa_librerias_pesadas(self):
+        """ Cargar la aplicación y sus URLs no debe importar pandas ni plotly. """
+        codigo = (
+            "import sys, sistema_medico.wsgi\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            "print('pesadas:' + ','.join(m for m in ('pandas', 'plotly', 'numpy') if m in sys.modules))\n"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='sistema_medico.settings')
+        salida = subprocess.run(
+            [sys.executable, '-c', codigo],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual('pesadas:', salida.strip().splitlines()[-1])
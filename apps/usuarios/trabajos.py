@@ -0,0 +1,68 @@
+"""
+Cargas masivas de usuarios en segundo plano.
+
+El admin solo guarda el archivo y registra un `TrabajoImportacion`; el comando
+`procesar_importaciones` los toma en orden de llegada (ver
+`sistema_medico/trabajos.py`) y lee el archivo por bloques. Cada bloque se
+valida, se inserta y registra su avance en una sola transacción, así que la
+memoria no crece con el tamaño del archivo, ninguna petición espera a que
+termine y el admin puede consultar el avance.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .carga_masiva import (
+    MAXIMO_ERRORES,
+    TAMANO_BLOQUE,
+    contar_filas,
+    importar_bloque,
+    leer_bloques,
+)
+from .models import TrabajoImportacion
+
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_AVANCE = ['filas_procesadas', 'creados', 'actualizados', 'errores', 'total_errores', 'actualizado']
+
+
+def registrar_bloque(trabajo, filas, creados, actualizados, errores):
+    """ Suma el resultado de un bloque al avance del trabajo y lo guarda. """
+    trabajo.filas_procesadas += filas
+    trabajo.creados += creados
+    trabajo.actualizados += actualizados
+    trabajo.total_errores += len(errores)
+    trabajo.errores += errores[:MAXIMO_ERRORES - len(trabajo.errores)]
+    trabajo.save(update_fields=CAMPOS_AVANCE)
+
+
+def procesar(trabajo, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Importa el archivo del trabajo bloque por bloque. Si un bloque falla, los
+    anteriores quedan guardados y el trabajo termina con error.
+    """
+    try:
+        with trabajo.archivo.open('rb') as archivo:
+            trabajo.total_filas = contar_filas(archivo, trabajo.nombre)
+            trabajo.save(update_fields=['total_filas', 'actualizado'])
+            for df in leer_bloques(archivo, trabajo.nombre, tamano_bloque):
+                with transaction.atomic():
+                    creados, actualizados, errores = importar_bloque(df, settings.DEFAULT_PASSWORD)
+                    registrar_bloque(trabajo, len(df), creados, actualizados, errores)
+    except FileNotFoundError:
+        logger.error('La importación %s no encuentra su archivo %s', trabajo.pk, trabajo.archivo.name)
+        trabajo.estado = TrabajoImportacion.ERROR
+        trabajo.error = 'El archivo subido no está disponible para el proceso de importación.'
+    except Exception as e:
+        logger.exception('Falló la importación %s', trabajo.pk)
+        trabajo.estado = TrabajoImportacion.ERROR
+        trabajo.error = str(e)
+    else:
+        trabajo.estado = TrabajoImportacion.TERMINADO
+    trabajo.terminado = timezone.now()
+    trabajo.save()
+    return trabajo
+
@@ -5,6 +5,7 @@ urlpatterns = [
     path("", views.login_view, name="login"),
     path("logout/", views.logout_view, name="logout"),
     path("medico/dashboard/", views.medico_dashboard_view, name="medico_dashboard"),
+    path("medico/dashboard/graficas/<slug:grafica>/", views.medico_grafica_view, name="medico_grafica"),
     path("paciente/dashboard/", views.paciente_dashboard_view, name="paciente_dashboard"),
     path("paciente/historial/", views.historial_view, name="historial"),
     path("paciente/mis_consultas/", views.paciente_consultas_view, name="paciente_consultas"),
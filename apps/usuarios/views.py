@@ -8,29 +8,29 @@ from django.contrib.auth import authenticate, login, logout, update_session_auth
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Count
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition
 from django_ratelimit.decorators import ratelimit
 from django.utils import timezone
-from datetime import datetime, timedelta
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 
 
+from apps.consultas.filtros import FiltroConsultas
 from apps.consultas.models import CategoriaPadecimiento, Consulta, SignosVitales
+from apps.consultas.paginacion import paginar_por_cursor
 
+from apps.usuarios.busqueda import CONTIENE, PREFIJO, filtrar_por_clave, normalizar_clave
 from apps.usuarios.decorators import role_required
 from apps.usuarios.forms import HistorialMedicoForm
 from apps.usuarios.forms import LoginForm
 from apps.usuarios.models import Area, HistorialMedico, Usuario,ContactoEmergencia
 
 from apps.usuarios.views_dashboard_utils import (
-    generate_habitos_figure,
-    generate_consultas_figure,
-    generate_area_distribution_figure,
-    generate_area_vs_padecimientos_figure,
-    generate_gender_figures,
+    GRAFICAS_DASHBOARD,
+    estado_grafica,
+    generar_grafica,
+    plantilla_graficas,
 )
 
 from apps.publicaciones.views import obtener_publicaciones
@@ -50,7 +50,7 @@ def login_view(request):
         HttpResponse: Redirección al panel de usuario correspondiente o renderizado del formulario de login.
     """
     if request.user.is_authenticated:
-        rol = request.user.role.nombre_rol
+        rol = request.user.role_id
         if rol == "medico":
             return redirect("medico_dashboard")
         if rol == "paciente":
@@ -76,7 +76,7 @@ def login_view(request):
             return render(request, "login.html", {"form": form})
 
         login(request, user)
-        rol = user.role.nombre_rol
+        rol = user.role_id
         if rol == "medico":
             return redirect("medico_dashboard")
         if rol == "paciente":
@@ -107,23 +107,39 @@ def logout_view(request):
 @login_required
 @role_required(["medico"])
 def medico_dashboard_view(request):
-    habitos_fig = generate_habitos_figure()
-    consultas_fig = generate_consultas_figure()
-    areas_fig = generate_area_distribution_figure()
-    padecimientos_fig = generate_area_vs_padecimientos_figure()
-    genero_fig, genero_pastel = generate_gender_figures()
-
-    context = {
-        'habitos_graph': habitos_fig.to_html(full_html=False),
-        'consultas_graph': consultas_fig.to_html(full_html=False),
-        'areas_graph': areas_fig.to_html(full_html=False),
-        'padecimientos_graph': padecimientos_fig.to_html(full_html=False),
-        'genero_graph': genero_fig.to_html(full_html=False),
-        'genero_pastel': genero_pastel.to_html(full_html=False),
-    }
+    """
+    Vista del panel principal para los médicos.
+
+    Solo entrega la estructura de la página; cada gráfica se descarga en paralelo
+    desde `medico_grafica_view`, así una agregación lenta solo retrasa su panel.
+    """
+    return render(request, 'medico_dashboard.html', {'plantilla_graficas': plantilla_graficas()})
+
+
+def _estado_grafica(request, grafica):
+    """ Calcula la firma de la gráfica una sola vez por petición (ETag y Last-Modified la usan). """
+    if not hasattr(request, '_estado_grafica'):
+        request._estado_grafica = estado_grafica(grafica) if grafica in GRAFICAS_DASHBOARD else (None, None)
+    return request._estado_grafica
 
-    return render(request, 'medico_dashboard.html', context)
 
+@cache_control(private=True, no_cache=True)
+@login_required
+@role_required(["medico"])
+@condition(
+    etag_func=lambda request, grafica: _estado_grafica(request, grafica)[0],
+    last_modified_func=lambda request, grafica: _estado_grafica(request, grafica)[1],
+)
+def medico_grafica_view(request, grafica):
+    """
+    Devuelve en JSON las figuras de una gráfica del dashboard.
+
+    Responde con ETag y Last-Modified; si los datos no han cambiado desde la
+    última descarga del navegador responde 304 sin volver a generar la gráfica.
+    """
+    if grafica not in GRAFICAS_DASHBOARD:
+        raise Http404("Gráfica no encontrada")
+    return JsonResponse({'figuras': generar_grafica(grafica)})
 
 
 @never_cache
@@ -190,18 +206,12 @@ def paciente_consultas_view(request):
     """
     Vista para mostrar las consultas médicas del paciente autenticado.
 
-    Aplica paginación para mostrar un número limitado de consultas por página.
+    Aplica paginación por cursor para mostrar un número limitado de consultas por página.
     """
-    consultas = Consulta.objects.filter(clave_paciente=request.user).select_related('signos_vitales')
-
-    paginador = Paginator(consultas, 20)  # Mostrar 10 consultas por páginas
-    pagina = request.GET.get('page', 1)
-    try:
-        consultas = paginador.page(pagina)
-    except PageNotAnInteger:
-        consultas = paginador.page(1)
-    except EmptyPage:
-        consultas = paginador.page(paginador.num_pages)
+    consultas = Consulta.objects.filter(clave_paciente=request.user).select_related(
+        'clave_medico', 'clave_paciente', 'categoria_de_padecimiento', 'signos_vitales'
+    )
+    consultas = paginar_por_cursor(consultas, request.GET.get('cursor'))
 
     return render(request, "paciente_consultas.html", {"consultas": consultas})
 
@@ -291,57 +301,20 @@ def medico_consultas_view(request):
     Si el parámetro 'todas' está presente en la URL, se mostrarán todas las consultas.
     Si no, se mostrarán solo las consultas relacionadas con el médico autenticado.
     """
-    mostrar_todas = request.GET.get('todas', '0') == '1'  # Leer parámetro 'todas'
-    consultas_base = Consulta.objects.select_related('clave_medico', 'clave_paciente', 'signos_vitales')
-
-    if not mostrar_todas:
-        consultas_base = consultas_base.filter(clave_medico=request.user)
-
-    clave_paciente_query = request.GET.get('clave_paciente') #variables para la busqueda
-    fecha_inicio_query = request.GET.get('fecha_inicio')
-    fecha_fin_query = request.GET.get('fecha_fin')
-
-
-    if clave_paciente_query: #busqueda por clave del paciente
-        consultas_base = consultas_base.filter(clave_paciente__clave__icontains=clave_paciente_query)
-
-    if fecha_inicio_query and fecha_fin_query:
-        try:
-            fecha_inicio = datetime.strptime(fecha_inicio_query, '%Y-%m-%d')
-            fecha_fin = datetime.strptime(fecha_fin_query, '%Y-%m-%d') + timedelta(days=1)
-            consultas_base = consultas_base.filter(fecha__gte=fecha_inicio, fecha__lt=fecha_fin)
-        except ValueError:
-            pass
-    elif fecha_inicio_query:
-        try:
-            fecha_inicio = datetime.strptime(fecha_inicio_query, '%Y-%m-%d')
-            consultas_base = consultas_base.filter(fecha__gte=fecha_inicio)
-        except ValueError:
-            pass
-    elif fecha_fin_query:
-        try:
-            fecha_fin_query = datetime.strptime(fecha_fin_query, '%Y-%m-%d') + timedelta(days=1)
-            consultas_base = consultas_base.filter(fecha__lt=fecha_fin)
-        except ValueError:
-            pass
-
-    consultas = consultas_base.order_by('-fecha')
-
-    paginador = Paginator(consultas, 20)  # Mostrar 10 consultas por páginas
-    pagina = request.GET.get('page', 1)
-    try:
-        consultas = paginador.page(pagina)
-    except PageNotAnInteger:
-        consultas = paginador.page(1)
-    except EmptyPage:
-        consultas = paginador.page(paginador.num_pages)
+    filtros = FiltroConsultas(request.GET, request.user)
+    consultas_base = filtros.aplicar(
+        Consulta.objects.select_related('clave_medico', 'clave_paciente', 'categoria_de_padecimiento', 'signos_vitales')
+    )
+
+    consultas = paginar_por_cursor(consultas_base, request.GET.get('cursor'), campo=filtros.orden)
 
     return render(request, "medico_consultas.html", {
         "consultas": consultas,
-        "mostrar_todas": mostrar_todas,
-        "clave_paciente": clave_paciente_query,
-        "fecha_inicio": fecha_inicio_query,
-        "fecha_fin": fecha_fin_query,
+        "filtros": filtros,
+        "mostrar_todas": filtros.todas,
+        "clave_paciente": filtros.clave_paciente,
+        "fecha_inicio": filtros.fecha_inicio,
+        "fecha_fin": filtros.fecha_fin,
     })
 
 
@@ -352,23 +325,21 @@ def medico_historiales_view(request):
     """
     Vista para que los médicos vean los historiales médicos de los pacientes.
 
-    Si se proporciona un parámetro de búsqueda, los historiales se filtrarán de acuerdo al ID del historial.
+    Si se proporciona un parámetro de búsqueda, los historiales se filtrarán de acuerdo al ID del historial
+    (en cualquier parte de la clave o, con `prefijo=1`, solo desde su inicio).
     También se paginan los resultados para mostrar solo una cantidad limitada por página.
     """
-    query = request.GET.get('search', '')
-    query = query.strip().upper()
-    # Si hay una consulta, filtrar los historiales de acuerdo a la consulta
-    if query:
-        historiales = HistorialMedico.objects.filter(
-            id_historial__icontains=query,
-            paciente__role__nombre_rol='paciente',
-            paciente__is_active=True
-        ).exclude(paciente__carrera_o_puesto__carrera_o_puesto="Médico").order_by('id_historial')
-    else:
-        historiales = HistorialMedico.objects.filter(
-            paciente__role__nombre_rol='paciente',
-            paciente__is_active=True
-        ).exclude(paciente__carrera_o_puesto__carrera_o_puesto="Médico").order_by('id_historial')
+    query = normalizar_clave(request.GET.get('search', ''))
+    prefijo = request.GET.get('prefijo') == '1'
+    # El paciente y su resumen se leen en el mismo JOIN en lugar de una consulta por tarjeta
+    historiales = HistorialMedico.objects.filter(
+        paciente__role__nombre_rol='paciente',
+        paciente__is_active=True
+    ).exclude(paciente__carrera_o_puesto__carrera_o_puesto="Médico").select_related(
+        'paciente', 'paciente__resumen'
+    ).order_by('id_historial')
+    # Si hay una consulta, filtrar los historiales por su clave
+    historiales = filtrar_por_clave(historiales, 'id_historial', query, PREFIJO if prefijo else CONTIENE)
 
     paginador = Paginator(historiales, 10)  # Mostrar 10 consultas por páginas
     pagina = request.GET.get('page', 1)
@@ -379,7 +350,7 @@ def medico_historiales_view(request):
     except EmptyPage:
         historiales = paginador.page(paginador.num_pages)
 
-    return render(request, "medico_historiales.html", {"historiales": historiales, "query": query})
+    return render(request, "medico_historiales.html", {"historiales": historiales, "query": query, "prefijo": prefijo})
 
 
 @never_cache
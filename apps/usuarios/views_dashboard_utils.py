@@ -1,35 +1,45 @@
 # dashboard_utils.py
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from django.db.models import Count
-from apps.consultas.models import Consulta, CategoriaPadecimiento
-from apps.usuarios.models import Usuario, HistorialMedico
+# pandas y plotly se importan dentro de cada función: son pesados y solo los
+# necesitan las peticiones del dashboard, no el arranque de cada worker.
+import hashlib
+import json
+from functools import lru_cache
+
+from django.db.models import Count, Max, Sum
+from apps.consultas.models import CategoriaPadecimiento
+from apps.estadisticas.models import (
+    ResumenConsultas,
+    ResumenHabitos,
+    ResumenPacientesAtendidos,
+    ResumenUsuariosArea,
+)
+from apps.estadisticas.resumenes import HABITOS
+from apps.usuarios.referencias import datos_referencia
 
 
 def generate_habitos_figure():
-    historiales = HistorialMedico.objects.filter(paciente__is_active=True)
-    habitos = {
-        'Fuman': historiales.filter(usa_cigarro=True).count(),
-        'Ingiere alcohol': historiales.filter(ingiere_alcohol=True).count(),
-        'Usa drogas': historiales.filter(usa_drogas=True).count(),
-        'Embarazadas': historiales.filter(es_embarazada=True).count(),
-        'Usa lentes': historiales.filter(usa_lentes=True).count(),
-        'Vida sexual activa': historiales.filter(vida_sexual_activa=True).count(),
-        'Usa métodos anticonceptivos': historiales.filter(usa_metodos_anticonceptivos=True).count(),
-    }
+    import plotly.graph_objects as go
+
+    totales = dict(ResumenHabitos.objects.values_list('habito', 'total'))
+    habitos = {etiqueta: totales.get(campo, 0) for campo, etiqueta in HABITOS.items()}
     fig = go.Figure([go.Bar(x=list(habitos.keys()), y=list(habitos.values()), marker_color='indianred')])
     fig.update_layout(title_text="Pacientes con hábitos", xaxis_title="Hábito", yaxis_title="Cantidad")
     return fig
 
 
 def generate_consultas_figure():
-    consultas = Consulta.objects.values('categoria_de_padecimiento').annotate(total=Count('categoria_de_padecimiento'))
-    padecimientos_dict = {p.id_padecimiento: p.padecimiento for p in CategoriaPadecimiento.objects.all()}
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    consultas = (
+        ResumenConsultas.objects.values('categoria').annotate(total=Sum('total'))
+        .filter(total__gt=0).order_by('categoria')
+    )
+    padecimientos_dict = datos_referencia.categorias()
 
     if consultas:
         fig = px.bar(
-            x=[padecimientos_dict.get(c['categoria_de_padecimiento'], "OTROS") for c in consultas],
+            x=[padecimientos_dict.get(c['categoria'], "OTROS") for c in consultas],
             y=[c['total'] for c in consultas],
             title="Distribución de tipos de consultas"
         )
@@ -47,10 +57,16 @@ def generate_consultas_figure():
 
 
 def generate_area_distribution_figure():
-    datos = Usuario.objects.values('carrera_o_puesto_id').annotate(total=Count('carrera_o_puesto_id')).exclude(carrera_o_puesto_id="Médico")
+    import plotly.graph_objects as go
+
+    # Los usuarios sin área van al final como "Sin área"
+    datos = sorted(
+        ResumenUsuariosArea.objects.filter(total__gt=0).exclude(area_id="Médico").values('area_id', 'total'),
+        key=lambda d: (d['area_id'] is None, d['area_id'] or ''),
+    )
     fig = go.Figure([
         go.Bar(
-            x=[d['carrera_o_puesto_id'] for d in datos],
+            x=[d['area_id'] or 'Sin área' for d in datos],
             y=[d['total'] for d in datos],
             marker_color='indianred'
         )
@@ -59,26 +75,44 @@ def generate_area_distribution_figure():
     return fig
 
 
+def _barras_agrupadas(filas, x, grupo, y):
+    """
+    Arma una traza de barras por cada valor de `grupo` a partir de filas ya
+    agregadas en la base de datos (equivalente a `px.bar(color=grupo, barmode="group")`).
+    """
+    import plotly.graph_objects as go
+
+    trazas = {}
+    for fila in filas:
+        traza = trazas.setdefault(fila[grupo], {'x': [], 'y': []})
+        traza['x'].append(fila[x])
+        traza['y'].append(fila[y])
+    return [
+        go.Bar(name=str(nombre), x=datos['x'], y=datos['y'])
+        for nombre, datos in trazas.items()
+    ]
+
+
 def generate_area_vs_padecimientos_figure():
-    datos = Consulta.objects.values("clave_paciente__carrera_o_puesto_id", "categoria_de_padecimiento").annotate(total=Count("clave_paciente__carrera_o_puesto_id"))
-    padecimientos_dict = {p.id_padecimiento: p.padecimiento for p in CategoriaPadecimiento.objects.all()}
+    import plotly.graph_objects as go
+
+    # Consultas por área y categoría sumadas en la base de datos: unas cuantas filas
+    datos = list(
+        ResumenConsultas.objects.values("area", "categoria").annotate(total=Sum("total"))
+        .filter(total__gt=0).order_by("area", "categoria")
+    )
+    padecimientos_dict = datos_referencia.categorias()
 
     if datos:
-        df = pd.DataFrame(datos)
-        df["categoria_de_padecimiento"] = df["categoria_de_padecimiento"].map(padecimientos_dict)
-        labels = {
-            "categoria_de_padecimiento": "Categoría de padecimiento",
-            "total": "Total de pacientes",
-            "clave_paciente__carrera_o_puesto_id": "Área o puesto"
-        }
-        fig = px.bar(
-            df,
-            x="categoria_de_padecimiento",
-            y="total",
-            color="clave_paciente__carrera_o_puesto_id",
+        for fila in datos:
+            fila["categoria"] = padecimientos_dict.get(fila["categoria"])
+        fig = go.Figure(_barras_agrupadas(datos, x="categoria", grupo="area", y="total"))
+        fig.update_layout(
             barmode="group",
             title="Distribución de pacientes por área y tipo de consulta",
-            labels=labels
+            xaxis_title="Categoría de padecimiento",
+            yaxis_title="Total de pacientes",
+            legend_title_text="Área o puesto",
         )
     else:
         fig = go.Figure()
@@ -94,27 +128,27 @@ def generate_area_vs_padecimientos_figure():
 
 
 def generate_gender_figures():
-    pacientes = Consulta.objects.values('clave_paciente__clave', 'clave_paciente__sexo', 'clave_paciente__carrera_o_puesto_id')
-    df = pd.DataFrame(pacientes).drop_duplicates(subset=['clave_paciente__clave'])
+    import plotly.graph_objects as go
 
-    if not df.empty:
-        cantidad_hombres = df[df['clave_paciente__sexo'] == 'M'].count()['clave_paciente__clave']
-        cantidad_mujeres = df[df['clave_paciente__sexo'] == 'F'].count()['clave_paciente__clave']
+    # Pacientes distintos por área y sexo, ya contados en la base de datos
+    pacientes = ResumenPacientesAtendidos.objects.filter(total__gt=0)
+    por_area = list(
+        pacientes.filter(area__isnull=False, sexo__isnull=False)
+        .order_by('sexo', 'area').values('area', 'sexo', 'total')
+    )
+    por_sexo = dict(pacientes.values('sexo').annotate(cantidad=Sum('total')).order_by().values_list('sexo', 'cantidad'))
 
-        df_grouped = df.groupby(['clave_paciente__carrera_o_puesto_id', 'clave_paciente__sexo']).size().reset_index(name='cantidad')
+    if por_sexo:
+        cantidad_hombres = por_sexo.get('M', 0)
+        cantidad_mujeres = por_sexo.get('F', 0)
 
-        bar_fig = px.bar(
-            df_grouped,
-            x="clave_paciente__carrera_o_puesto_id",
-            y="cantidad",
-            color="clave_paciente__sexo",
+        bar_fig = go.Figure(_barras_agrupadas(por_area, x='area', grupo='sexo', y='total'))
+        bar_fig.update_layout(
             barmode="group",
             title="Cantidad de pacientes por carrera/puesto y género",
-            labels={
-                "clave_paciente__carrera_o_puesto_id": "Carrera/puesto",
-                "cantidad": "Cantidad de pacientes",
-                "clave_paciente__sexo": "Género"
-            }
+            xaxis_title="Carrera/puesto",
+            yaxis_title="Cantidad de pacientes",
+            legend_title_text="Género",
         )
 
         pie_fig = go.Figure(data=[go.Pie(labels=['Hombres', 'Mujeres'], values=[cantidad_hombres, cantidad_mujeres])])
@@ -141,3 +175,64 @@ def generate_gender_figures():
         )
 
     return bar_fig, pie_fig
+
+
+def figura_a_json(fig):
+    """
+    Convierte una figura en una especificación JSON compacta para dibujarla con
+    el plotly.js servido como archivo estático. La plantilla de estilo es igual
+    en todas las figuras y se envía una sola vez con `plantilla_graficas()`.
+    """
+    spec = json.loads(fig.to_json())
+    spec.get('layout', {}).pop('template', None)
+    return spec
+
+
+@lru_cache(maxsize=None)
+def plantilla_graficas():
+    """ Plantilla de estilo por defecto de plotly, compartida por todas las gráficas. """
+    import plotly.graph_objects as go
+
+    return json.loads(go.Figure().to_json())['layout'].get('template')
+
+
+def _figuras_genero():
+    return list(generate_gender_figures())
+
+
+# Nombre de la gráfica -> (función que genera sus figuras, tablas de las que depende)
+GRAFICAS_DASHBOARD = {
+    'habitos': (lambda: [generate_habitos_figure()], [ResumenHabitos]),
+    'consultas': (lambda: [generate_consultas_figure()], [ResumenConsultas, CategoriaPadecimiento]),
+    'areas': (lambda: [generate_area_distribution_figure()], [ResumenUsuariosArea]),
+    'padecimientos': (lambda: [generate_area_vs_padecimientos_figure()], [ResumenConsultas, CategoriaPadecimiento]),
+    'genero': (_figuras_genero, [ResumenPacientesAtendidos]),
+}
+
+
+def estado_grafica(nombre):
+    """
+    Calcula una firma barata de los datos de una gráfica sin construirla.
+
+    Devuelve (etag, última modificación). Las tablas de resumen se comparan por
+    número de filas, suma de totales y fecha de la última actualización; el
+    catálogo de categorías sale de `datos_referencia` y se compara completo.
+    """
+    _, tablas = GRAFICAS_DASHBOARD[nombre]
+    partes = [nombre]
+    ultima_modificacion = None
+    for tabla in tablas:
+        if tabla is CategoriaPadecimiento:
+            partes.append(list(datos_referencia.categorias().items()))
+            continue
+        datos = tabla.objects.aggregate(filas=Count('pk'), suma=Sum('total'), ultima=Max('actualizado'))
+        partes.append([datos['filas'], datos['suma'], datos['ultima'] and datos['ultima'].isoformat()])
+        if datos['ultima'] and (ultima_modificacion is None or datos['ultima'] > ultima_modificacion):
+            ultima_modificacion = datos['ultima']
+    etag = hashlib.md5(json.dumps(partes).encode()).hexdigest()
+    return etag, ultima_modificacion
+
+
+def generar_grafica(nombre):
+    generador, _ = GRAFICAS_DASHBOARD[nombre]
+    return [figura_a_json(fig) for fig in generador()]
@@ -0,0 +1,82 @@
+"""
+Mide el costo de arranque de un worker de gunicorn: tiempo de importación y
+memoria residente (RSS) al cargar `sistema_medico.wsgi` y las URLs del proyecto.
+
+Cada repetición se ejecuta en un intérprete nuevo para no aprovechar módulos ya
+cargados. También informa qué librerías pesadas (pandas, plotly, numpy,
+openpyxl) quedaron importadas: ninguna debería cargarse al arrancar.
+
+Uso:
+    python benchmarks/arranque.py
+    python benchmarks/arranque.py --repeticiones 10 --max-ms 800 --max-mb 120
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+LIBRERIAS_PESADAS = ('pandas', 'plotly', 'numpy', 'openpyxl')
+
+CODIGO_WORKER = f"""
+import json, os, resource, sys, time
+inicio = time.perf_counter()
+import sistema_medico.wsgi
+from django.urls import get_resolver
+get_resolver().url_patterns  # gunicorn carga las URLs en la primera petición
+duracion = time.perf_counter() - inicio
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024  # macOS reporta bytes
+print(json.dumps({{
+    'ms': duracion * 1000,
+    'rss_mb': rss_kb / 1024,
+    'pesadas': [m for m in {LIBRERIAS_PESADAS!r} if m in sys.modules],
+}}))
+"""
+
+
+def medir_arranque():
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_medico.settings')
+    salida = subprocess.run(
+        [sys.executable, '-c', CODIGO_WORKER],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, help='Falla si la mediana del tiempo de importación lo supera')
+    parser.add_argument('--max-mb', type=float, help='Falla si la mediana del RSS lo supera')
+    args = parser.parse_args()
+
+    resultados = [medir_arranque() for _ in range(args.repeticiones)]
+    ms = statistics.median(r['ms'] for r in resultados)
+    rss = statistics.median(r['rss_mb'] for r in resultados)
+    pesadas = sorted({m for r in resultados for m in r['pesadas']})
+
+    print(f'Importación de sistema_medico.wsgi + URLs: {ms:.0f} ms (mediana de {args.repeticiones})')
+    print(f'RSS máximo: {rss:.1f} MB')
+    print(f'Librerías pesadas cargadas al arrancar: {", ".join(pesadas) or "ninguna"}')
+
+    errores = []
+    if pesadas:
+        errores.append('se importaron librerías pesadas al arrancar')
+    if args.max_ms is not None and ms > args.max_ms:
+        errores.append(f'el arranque tardó más de {args.max_ms:.0f} ms')
+    if args.max_mb is not None and rss > args.max_mb:
+        errores.append(f'el RSS superó {args.max_mb:.0f} MB')
+    if errores:
+        print('REGRESIÓN: ' + '; '.join(errores))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
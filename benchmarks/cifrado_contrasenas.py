@@ -0,0 +1,58 @@
+"""
+Mide cuánto tarda cifrar las contraseñas de una carga masiva con
+`cifrar_contrasenas` según el número de procesos.
+
+Usa el hasher configurado en el proyecto (PBKDF2 por omisión), así que cada
+contraseña cuesta lo mismo que en producción. Con un proceso por núcleo el
+tiempo debe bajar casi en proporción al número de núcleos, porque cada hash
+es trabajo de CPU independiente y solo se envían las contraseñas y los hashes
+entre procesos.
+
+Uso:
+    python benchmarks/cifrado_contrasenas.py
+    python benchmarks/cifrado_contrasenas.py --contrasenas 5000 --procesos 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+from dashboard_memoria import BASE_DIR  # noqa: F401  (agrega el proyecto al path)
+
+
+def configurar_django():
+    os.environ['DEBUG'] = 'False'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_medico.settings')
+    import django
+    django.setup()
+
+
+def main():
+    configurar_django()
+    from apps.usuarios.carga_masiva import cifrar_contrasenas, procesos_disponibles
+
+    nucleos = procesos_disponibles()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--contrasenas', type=int, default=500)
+    parser.add_argument('--procesos', type=int, nargs='+',
+                        default=sorted({1, 2, 4, nucleos} & set(range(1, nucleos + 1))))
+    args = parser.parse_args()
+
+    contrasenas = [f'Alumno@{i:05d}' for i in range(args.contrasenas)]
+    print(f'{args.contrasenas} contraseñas, {nucleos} núcleos disponibles\n')
+    print(f'{"procesos":>9} | {"tiempo":>9} | {"por hash":>9} | {"aceleración":>11}')
+
+    base = None
+    for procesos in args.procesos:
+        inicio = time.perf_counter()
+        resultados = cifrar_contrasenas(contrasenas, procesos=procesos)
+        segundos = time.perf_counter() - inicio
+        assert all(resultado.ok for resultado in resultados)
+        base = base or segundos
+        print(f'{procesos:>9} | {segundos:>8.2f}s | {segundos * 1000 / len(contrasenas):>7.1f}ms | {base / segundos:>10.2f}x')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Compara la memoria y el tiempo de las gráficas de género y de área×padecimiento
+contra el número de consultas registradas.
+
+Siembra una base SQLite aparte con pacientes y consultas (por defecto hasta
+500 000) y, en cada punto de medición, ejecuta:
+
+- "pandas": la forma anterior, que traía una fila por consulta a un DataFrame
+  y contaba pacientes únicos con `drop_duplicates`.
+- "reconstrucción": `reconstruir_resumen_consultas()`, que agrega con
+  COUNT/COUNT(DISTINCT) en la base de datos.
+- "gráficas": `generate_gender_figures()` y `generate_area_vs_padecimientos_figure()`
+  leyendo las tablas de resumen.
+
+El pico de memoria de Python (tracemalloc) de las dos últimas debe mantenerse
+plano mientras crece el número de consultas. En SQLite el tiempo de la
+reconstrucción lo domina `TruncDate`, que se evalúa con una función de Python
+por fila; en PostgreSQL es nativo.
+
+Resultado de referencia (SQLite):
+
+     consultas |        pandas       |    reconstrucción   |     gráficas
+        100000 |  5625 ms   94.1 MB  | 19042 ms   15.9 MB  |  105 ms   0.3 MB
+        250000 | 17734 ms  167.8 MB  | 30978 ms   16.0 MB  |  111 ms   0.3 MB
+        500000 | 21016 ms  335.1 MB  | 95972 ms   16.0 MB  |   76 ms   0.3 MB
+
+Uso:
+    python benchmarks/dashboard_memoria.py
+    python benchmarks/dashboard_memoria.py --puntos 50000 100000 --db /tmp/bench.sqlite3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+
+def configurar_django(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    os.environ['DEBUG'] = 'False'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_medico.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def sembrar(total_consultas, pacientes):
+    """ Inserta pacientes y consultas con bulk_create hasta llegar a `total_consultas`. """
+    from django.utils import timezone
+
+    from apps.consultas.models import CategoriaPadecimiento, Consulta
+    from apps.usuarios.models import Area, Usuario
+
+    areas = list(Area.objects.exclude(carrera_o_puesto='Médico').values_list('pk', flat=True))
+    categorias = list(CategoriaPadecimiento.objects.values_list('pk', flat=True))
+    # Contraseña ya cifrada: bulk_create no llama a save() y así no se paga el hash
+    password = 'pbkdf2_sha256$600000$benchmark$benchmark='
+
+    if not Usuario.objects.filter(pk='9999').exists():
+        Usuario.objects.bulk_create([Usuario(
+            clave='9999', email='9999@itsatlixco.edu.mx', nombres='MEDICO', apellido_paterno='BENCHMARK',
+            carrera_o_puesto_id='Médico', role_id='medico', password=password,
+        )])
+    existentes = Usuario.objects.filter(role_id='paciente').count()
+    Usuario.objects.bulk_create([
+        Usuario(
+            clave=f'{100000 + i}', email=f'{100000 + i}@itsatlixco.edu.mx', nombres='PACIENTE',
+            apellido_paterno='BENCHMARK', sexo=random.choice('MF'), carrera_o_puesto_id=random.choice(areas),
+            role_id='paciente', password=password,
+        )
+        for i in range(existentes, pacientes)
+    ], batch_size=1000)
+    claves = list(Usuario.objects.filter(role_id='paciente').values_list('pk', flat=True))
+
+    # bulk_create respeta auto_now_add; se desactiva para repartir las fechas en tres años
+    campo_fecha = Consulta._meta.get_field('fecha')
+    campo_fecha.auto_now_add = False
+    ahora = timezone.now()
+    faltantes = total_consultas - Consulta.objects.count()
+    while faltantes > 0:
+        lote = min(faltantes, 5000)
+        Consulta.objects.bulk_create([
+            Consulta(
+                fecha=ahora - timedelta(minutes=random.randrange(3 * 365 * 24 * 60)),
+                padecimiento_actual='Benchmark',
+                categoria_de_padecimiento_id=random.choice(categorias),
+                clave_paciente_id=random.choice(claves),
+                clave_medico_id='9999',
+            )
+            for _ in range(lote)
+        ])
+        faltantes -= lote
+    campo_fecha.auto_now_add = True
+
+
+def medir(funcion):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    funcion()
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracion * 1000, pico / 1024 / 1024
+
+
+def enfoque_pandas():
+    """ Reproduce la carga de datos que hacía la versión con pandas. """
+    import pandas as pd
+
+    from apps.consultas.models import Consulta
+
+    pacientes = Consulta.objects.values('clave_paciente__clave', 'clave_paciente__sexo', 'clave_paciente__carrera_o_puesto_id')
+    df = pd.DataFrame(pacientes).drop_duplicates(subset=['clave_paciente__clave'])
+    df.groupby(['clave_paciente__carrera_o_puesto_id', 'clave_paciente__sexo']).size()
+    datos = Consulta.objects.values('clave_paciente__carrera_o_puesto_id', 'categoria_de_padecimiento')
+    pd.DataFrame(datos).groupby(['clave_paciente__carrera_o_puesto_id', 'categoria_de_padecimiento']).size()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--puntos', type=int, nargs='+', default=[50_000, 100_000, 250_000, 500_000],
+                        help='Número de consultas en cada punto de medición')
+    parser.add_argument('--pacientes', type=int, default=5000)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'salud_lince_benchmark.sqlite3'))
+    args = parser.parse_args()
+
+    configurar_django(args.db)
+
+    from apps.estadisticas.resumenes import reconstruir_resumen_consultas
+    from apps.usuarios.views_dashboard_utils import (
+        generate_area_vs_padecimientos_figure,
+        generate_gender_figures,
+    )
+
+    def graficas():
+        generate_gender_figures()
+        generate_area_vs_padecimientos_figure()
+
+    # Importar plotly antes de medir para no contar la importación como memoria de la gráfica
+    graficas()
+
+    print(f'{"consultas":>10} | {"pandas":>20} | {"reconstrucción":>20} | {"gráficas":>20}')
+    for total in sorted(args.puntos):
+        sembrar(total, args.pacientes)
+        filas = [medir(enfoque_pandas), medir(reconstruir_resumen_consultas), medir(graficas)]
+        celdas = ' | '.join(f'{ms:8.0f} ms {mb:7.1f} MB' for ms, mb in filas)
+        print(f'{total:>10} | {celdas}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Compara el costo de los datos iniciales que se siembran con `post_migrate`.
+
+`post_migrate` se envía una vez por cada app con modelos (8 en este
+proyecto) en cada `migrate`, `flush` y creación de la base de pruebas.
+
+- "anterior": los receptores sin filtrar por `sender`, que hacían un
+  `get_or_create` por rol, área, categoría y permiso, y
+  `permissions.set(Permission.objects.all())`, todo una vez por app.
+- "actual": los receptores de `apps/usuarios/signals.py` y
+  `apps/consultas/signals.py`, que corren una sola vez por `migrate` con
+  inserciones en bloque. Incluye crear de antemano los permisos que faltan de
+  todas las apps, porque los grupos se siembran con la señal de usuarios.
+
+Ambos se ejecutan sobre una base SQLite ya migrada (el caso de cada `migrate`
+sin cambios y de cada `flush` en las pruebas). También se mide un `migrate`
+completo sobre una base vacía.
+
+Resultado de referencia (SQLite):
+
+      siembra |    tiempo | consultas
+     anterior |  278.4 ms |       640
+       actual |   29.9 ms |        57
+
+Uso:
+    python benchmarks/siembra_migrate.py
+    python benchmarks/siembra_migrate.py --repeticiones 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from dashboard_memoria import BASE_DIR  # noqa: F401  (agrega el proyecto al path)
+
+
+def configurar_django(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    os.environ['DEBUG'] = 'False'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sistema_medico.settings')
+    import django
+    django.setup()
+
+
+def siembra_anterior():
+    """ Los tres receptores de usuarios y el de consultas como estaban antes, para comparar. """
+    from django.contrib.auth.models import Group, Permission
+    from django.contrib.contenttypes.models import ContentType
+
+    from apps.consultas.models import CategoriaPadecimiento, Consulta
+    from apps.usuarios.models import Area, HistorialMedico, Role, Usuario
+    from apps.usuarios.signals import AREAS, ROLES
+
+    for rol in ROLES:
+        Role.objects.get_or_create(nombre_rol=rol)
+    for area in AREAS:
+        Area.objects.get_or_create(carrera_o_puesto=area)
+
+    medico, _ = Group.objects.get_or_create(name='Medico')
+    paciente, _ = Group.objects.get_or_create(name='Paciente')
+    administrador, _ = Group.objects.get_or_create(name='Administrador')
+    permisos = {
+        medico: [('view_consulta', Consulta), ('add_consulta', Consulta), ('view_historialmedico', HistorialMedico),
+                 ('view_usuario', Usuario), ('change_usuario', Usuario)],
+        paciente: [('view_consulta', Consulta), ('view_historialmedico', HistorialMedico),
+                   ('change_historialmedico', HistorialMedico), ('view_usuario', Usuario), ('change_usuario', Usuario)],
+    }
+    for grupo, lista in permisos.items():
+        for codename, modelo in lista:
+            content_type = ContentType.objects.get_for_model(modelo)
+            permiso, _ = Permission.objects.get_or_create(codename=codename, content_type=content_type)
+            grupo.permissions.add(permiso)
+    administrador.permissions.set(Permission.objects.all())
+
+    for padecimiento in CategoriaPadecimiento.objects.values_list('padecimiento', flat=True).distinct():
+        CategoriaPadecimiento.objects.get_or_create(padecimiento=padecimiento)
+
+
+def siembra_actual(app_config):
+    from apps.consultas.signals import crear_motivos_de_consultas
+    from apps.usuarios.signals import crear_grupos_permisos, crear_roles_y_areas_por_defecto
+
+    # Los receptores solo están conectados con `sender` igual a su app
+    if app_config.name == 'apps.usuarios':
+        crear_roles_y_areas_por_defecto(sender=app_config, using='default')
+        crear_grupos_permisos(sender=app_config, using='default')
+    elif app_config.name == 'apps.consultas':
+        crear_motivos_de_consultas(sender=app_config, using='default')
+
+
+def medir(funcion, repeticiones):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    inicio = time.perf_counter()
+    with CaptureQueriesContext(connection) as consultas:
+        for _ in range(repeticiones):
+            funcion()
+    return (time.perf_counter() - inicio) * 1000 / repeticiones, len(consultas) / repeticiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        configurar_django(os.path.join(directorio, 'siembra.sqlite3'))
+        from django.apps import apps
+        from django.core.management import call_command
+
+        inicio = time.perf_counter()
+        call_command('migrate', verbosity=0)
+        call_command('createcachetable', verbosity=0)
+        print(f'migrate sobre una base vacía: {(time.perf_counter() - inicio) * 1000:.0f} ms\n')
+
+        configs = [config for config in apps.get_app_configs() if config.models_module is not None]
+        print(f'Una emisión de post_migrate ({len(configs)} apps con modelos):')
+        print(f'{"siembra":>9} | {"tiempo":>9} | {"consultas":>9}')
+        for nombre, funcion in (
+            ('anterior', lambda: [siembra_anterior() for _ in configs]),
+            ('actual', lambda: [siembra_actual(config) for config in configs]),
+        ):
+            milisegundos, consultas = medir(funcion, args.repeticiones)
+            print(f'{nombre:>9} | {milisegundos:>6.1f} ms | {consultas:>9.0f}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
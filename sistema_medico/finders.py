@@ -0,0 +1,37 @@
+import os
+from importlib.util import find_spec
+
+from django.contrib.staticfiles.finders import BaseFinder
+from django.core.files.storage import FileSystemStorage
+
+
+class PlotlyJsFinder(BaseFinder):
+    """
+    Expone el `plotly.min.js` incluido en el paquete `plotly` como el archivo
+    estático `js/plotly.min.js`.
+
+    Así `collectstatic` lo copia con hash en el nombre y WhiteNoise lo sirve con
+    caché de larga duración, en lugar de incrustarlo en cada gráfica. Tomarlo del
+    paquete instalado garantiza que la versión de plotly.js coincida con la de
+    plotly en Python.
+    """
+    prefijo = 'js'
+    nombre = 'plotly.min.js'
+
+    def __init__(self, app_names=None, *args, **kwargs):
+        spec = find_spec('plotly')
+        directorio = os.path.join(spec.submodule_search_locations[0], 'package_data')
+        self.storage = FileSystemStorage(location=directorio)
+        self.storage.prefix = self.prefijo
+
+    def find(self, path, all=False):
+        if path != f'{self.prefijo}/{self.nombre}':
+            return [] if all else None
+        ruta = self.storage.path(self.nombre)
+        if not os.path.exists(ruta):
+            return [] if all else None
+        return [ruta] if all else ruta
+
+    def list(self, ignore_patterns):
+        if self.storage.exists(self.nombre):
+            yield self.nombre, self.storage
@@ -0,0 +1,164 @@
+"""
+Medición de cada petición: número de consultas SQL, tiempo en la base de datos,
+tiempo de render de plantillas y tiempo total de la vista.
+
+Los valores se envían en el encabezado `Server-Timing` (visible en la pestaña
+de red del navegador) y en una línea de registro por petición en el logger
+`sistema_medico.medicion`. Las peticiones que pasan de
+`MEDICION_MAX_CONSULTAS` consultas o de `MEDICION_MAX_MS` milisegundos se
+registran como advertencia.
+
+Con `MEDICION_PETICIONES = False` el middleware lanza `MiddlewareNotUsed` y
+Django lo quita de la cadena al arrancar, así que no cuesta nada por petición.
+El tiempo de plantillas incluye el SQL que se ejecuta mientras se renderizan
+(querysets que se evalúan en la plantilla).
+
+En las respuestas en flujo (`StreamingHttpResponse`, p. ej. la exportación en
+CSV) los encabezados salen antes de recorrer el contenido, así que
+`Server-Timing` solo cubre la vista; las consultas que se hacen al generar el
+contenido se siguen contando y la línea de registro se escribe al terminar el
+flujo, con `flujo=1` y los totales de la petición completa. Los archivos
+(`FileResponse`) no se envuelven para no perder `wsgi.file_wrapper`.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+
+logger = logging.getLogger(__name__)
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    def __init__(self):
+        self.consultas = 0
+        self.sql = 0.0
+        self.plantillas = 0.0
+        self.en_plantilla = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """ Envoltura de `connection.execute_wrapper`: cuenta y cronometra cada consulta. """
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+_plantillas_lock = threading.Lock()
+_plantillas_usos = 0
+_render_original = None
+
+
+def _render_medido(self, context):
+    """ `Template.render` que cronometra la petición en curso; las plantillas anidadas no se suman dos veces. """
+    medicion = _medicion_actual.get()
+    if medicion is None or medicion.en_plantilla:
+        return _render_original(self, context)
+    medicion.en_plantilla = True
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context)
+    finally:
+        medicion.plantillas += time.perf_counter() - inicio
+        medicion.en_plantilla = False
+
+
+@contextmanager
+def _plantillas_medidas():
+    """
+    Sustituye `Template.render` mientras haya alguna petición midiéndose y deja
+    el original al salir la última. Las demás peticiones que rendericen en ese
+    lapso no se miden porque no tienen `_medicion_actual`.
+    """
+    global _plantillas_usos, _render_original
+    with _plantillas_lock:
+        if _plantillas_usos == 0:
+            _render_original = Template.render
+            Template.render = _render_medido
+        _plantillas_usos += 1
+    try:
+        yield
+    finally:
+        with _plantillas_lock:
+            _plantillas_usos -= 1
+            # Si alguien más lo reemplazó mientras tanto, no se pisa su cambio
+            if _plantillas_usos == 0 and Template.render is _render_medido:
+                Template.render = _render_original
+
+
+@contextmanager
+def _midiendo(medicion):
+    """ Cuenta en `medicion` las consultas de todas las conexiones y el render de plantillas. """
+    token = _medicion_actual.set(medicion)
+    try:
+        with ExitStack() as pila:
+            pila.enter_context(_plantillas_medidas())
+            for connection in connections.all():
+                pila.enter_context(connection.execute_wrapper(medicion))
+            yield
+    finally:
+        _medicion_actual.reset(token)
+
+
+class MedicionPeticionesMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'MEDICION_PETICIONES', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_consultas = settings.MEDICION_MAX_CONSULTAS
+        self.max_ms = settings.MEDICION_MAX_MS
+
+    def __call__(self, request):
+        medicion = Medicion()
+        inicio = time.perf_counter()
+        with _midiendo(medicion):
+            response = self.get_response(request)
+        total = (time.perf_counter() - inicio) * 1000
+
+        response['Server-Timing'] = ', '.join([
+            f'sql;desc="{medicion.consultas} consultas";dur={medicion.sql * 1000:.1f}',
+            f'plantillas;dur={medicion.plantillas * 1000:.1f}',
+            f'total;dur={total:.1f}',
+        ])
+
+        if response.streaming and not response.is_async and getattr(response, 'file_to_stream', None) is None:
+            response.streaming_content = self._medir_flujo(response.streaming_content, request, response, medicion, inicio)
+        else:
+            self.registrar(request, response, medicion, total)
+        return response
+
+    def _medir_flujo(self, contenido, request, response, medicion, inicio):
+        """ Recorre el contenido de la respuesta midiendo sus consultas y registra al terminar. """
+        try:
+            with _midiendo(medicion):
+                yield from contenido
+        finally:
+            self.registrar(request, response, medicion, (time.perf_counter() - inicio) * 1000, flujo=True)
+
+    def registrar(self, request, response, medicion, total, flujo=False):
+        excede = []
+        if medicion.consultas > self.max_consultas:
+            excede.append('consultas')
+        if total > self.max_ms:
+            excede.append('tiempo')
+        linea = (
+            f'metodo={request.method} ruta={request.path} estado={response.status_code} '
+            f'consultas={medicion.consultas} sql_ms={medicion.sql * 1000:.1f} '
+            f'plantillas_ms={medicion.plantillas * 1000:.1f} total_ms={total:.1f}'
+        )
+        if flujo:
+            linea += ' flujo=1'
+        if excede:
+            logger.warning('%s excede=%s', linea, ','.join(excede))
+        else:
+            logger.info(linea)
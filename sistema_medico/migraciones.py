@@ -0,0 +1,21 @@
+"""
+Operaciones de migración compartidas por las apps.
+"""
+from django.db import migrations
+
+
+class RunSQLPostgreSQL(migrations.RunSQL):
+    """
+    RunSQL que solo se ejecuta en PostgreSQL, p. ej. para índices con operator
+    classes o GIN, que no existen en SQLite. Lo que crea no entra al estado de
+    los modelos, así que SQLite no intenta crearlo al reconstruir la tabla en
+    migraciones posteriores.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
@@ -38,6 +38,7 @@ LOCAL_APPS = [
     'apps.usuarios',
     'apps.consultas',
     'apps.publicaciones',
+    'apps.estadisticas',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -45,6 +46,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'sistema_medico.medicion.MedicionPeticionesMiddleware',  # Solo con MEDICION_PETICIONES=True
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -138,10 +140,48 @@ STATICFILES_DIRS = [  # para cargar los archivos estáticos
     os.path.join(BASE_DIR, 'static'),
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'sistema_medico.finders.PlotlyJsFinder',  # js/plotly.min.js desde el paquete plotly
+]
+
+# Caché local de cada proceso; `referencias` vive en la base de datos para que
+# todos los workers vean la versión de los datos de referencia (requiere
+# `python manage.py createcachetable`, que corre en el despliegue)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'referencias': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_referencias',
+    },
+}
+
+# Medición por petición (consultas SQL, plantillas y tiempo total) en el
+# encabezado Server-Timing y en el logger `sistema_medico.medicion`; las
+# peticiones que pasan de los límites se registran como advertencia
+MEDICION_PETICIONES = os.getenv('MEDICION_PETICIONES', default=False) == 'True'
+MEDICION_MAX_CONSULTAS = int(os.getenv('MEDICION_MAX_CONSULTAS', default=30))
+MEDICION_MAX_MS = int(os.getenv('MEDICION_MAX_MS', default=1000))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'sistema_medico.medicion': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
 
 # Configuración para archivos subidos por usuarios
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Los procesos exportador e importador del Procfile leen y escriben aquí, así
+# que en producción debe ser un volumen compartido con la web (ver README)
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
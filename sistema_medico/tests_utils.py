@@ -0,0 +1,34 @@
+"""
+Apoyo compartido por las pruebas de las apps. Solo lo importan los `tests.py`.
+"""
+from apps.usuarios.models import Usuario
+from apps.usuarios.referencias import AREA_MEDICO
+
+
+# Sin el manifiesto de whitenoise, que solo existe después de `collectstatic`,
+# para las pruebas que renderizan plantillas
+STORAGES_PRUEBAS = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+PASSWORD_PRUEBAS = 'P@ssword123'
+
+
+def crear_usuario(clave, role='paciente', **campos):
+    """
+    Crea un usuario de prueba con el correo institucional de `clave` y datos
+    fijos para lo demás; `campos` reemplaza cualquiera de ellos. Los médicos
+    quedan en el área "Médico" y los pacientes en ING. SISTEMAS COMP.
+    """
+    datos = {
+        'email': f'{clave.lower()}@itsatlixco.edu.mx',
+        'nombres': 'JOHN',
+        'apellido_paterno': 'DOE',
+        'fecha_nacimiento': '1990-01-01',
+        'carrera_o_puesto': AREA_MEDICO if role == 'medico' else 'ING. SISTEMAS COMP.',
+        'password': PASSWORD_PRUEBAS,
+        'role': role,
+    }
+    datos.update(campos)
+    return Usuario.objects.create_user(clave=clave, **datos)
@@ -0,0 +1,160 @@
+"""
+Base común de los trabajos en segundo plano (exportaciones de consultas y
+cargas masivas de usuarios).
+
+- `Trabajo`: modelo abstracto con el estado del trabajo y sus fechas. Su
+  manager sabe tomar el siguiente pendiente, marcar los interrumpidos y borrar
+  los antiguos con sus archivos.
+- `ComandoTrabajos`: comando que atiende la cola de un modelo en un ciclo; cada
+  app solo indica el modelo y cómo procesar un trabajo.
+
+Los trabajos se registran desde una petición y los procesa el comando, así que
+el archivo que lee o escribe cada uno debe estar en un almacenamiento que vean
+los dos procesos (ver `Procfile`).
+"""
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+
+
+def ruta_aleatoria(carpeta, filename):
+    # Nombre aleatorio para que el archivo no pueda adivinarse desde MEDIA_URL
+    return f'{carpeta}/{uuid.uuid4().hex}/{filename}'
+
+
+class TrabajoQuerySet(models.QuerySet):
+    def tomar_siguiente(self):
+        """
+        Marca como en proceso el trabajo pendiente más antiguo y lo devuelve.
+        El UPDATE condicionado al estado evita que dos procesos tomen el mismo trabajo.
+        """
+        while True:
+            trabajo = self.filter(estado=Trabajo.PENDIENTE).order_by('creado', 'id').first()
+            if trabajo is None:
+                return None
+            ahora = timezone.now()
+            tomado = self.filter(pk=trabajo.pk, estado=Trabajo.PENDIENTE).update(
+                estado=Trabajo.PROCESANDO, iniciado=ahora, actualizado=ahora,
+            )
+            if tomado:
+                trabajo.refresh_from_db()
+                return trabajo
+
+    def expirar_interrumpidos(self, minutos):
+        """
+        Marca con error los trabajos en proceso que llevan más de `minutos` sin
+        avanzar, por ejemplo porque el proceso se reinició.
+        """
+        return self.filter(
+            estado=Trabajo.PROCESANDO,
+            actualizado__lt=timezone.now() - timedelta(minutes=minutos),
+        ).update(
+            estado=Trabajo.ERROR,
+            error=self.model.MENSAJE_INTERRUMPIDO,
+            terminado=timezone.now(),
+        )
+
+    def borrar_antiguos(self, dias):
+        """ Elimina los trabajos terminados hace más de `dias` junto con sus archivos. """
+        antiguos = self.filter(
+            estado__in=[Trabajo.TERMINADO, Trabajo.ERROR],
+            terminado__lt=timezone.now() - timedelta(days=dias),
+        )
+        borrados = 0
+        for trabajo in antiguos:
+            if trabajo.archivo:
+                trabajo.archivo.delete(save=False)
+            trabajo.delete()
+            borrados += 1
+        return borrados
+
+
+class Trabajo(models.Model):
+    """ Estado y fechas de un trabajo en segundo plano; cada subclase define su `archivo`. """
+    PENDIENTE = 'pendiente'
+    PROCESANDO = 'procesando'
+    TERMINADO = 'terminado'
+    ERROR = 'error'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (PROCESANDO, 'Procesando'),
+        (TERMINADO, 'Terminado'),
+        (ERROR, 'Error'),
+    ]
+    ACTIVOS = (PENDIENTE, PROCESANDO)
+    MENSAJE_INTERRUMPIDO = 'El trabajo se interrumpió.'
+
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    # Se actualiza con cada avance; sirve para detectar trabajos interrumpidos
+    actualizado = models.DateTimeField(auto_now=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    objects = TrabajoQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        ordering = ["-creado", "-id"]
+
+    @property
+    def activo(self):
+        return self.estado in self.ACTIVOS
+
+    def registrar_avance(self):
+        """ Renueva `actualizado` para que otro proceso no dé el trabajo por interrumpido. """
+        self.actualizado = timezone.now()
+        type(self).objects.filter(pk=self.pk).update(actualizado=self.actualizado)
+
+
+class ComandoTrabajos(BaseCommand):
+    """
+    Atiende la cola de `modelo`: marca los interrumpidos, procesa los
+    pendientes en orden de llegada y, cuando no hay, borra los antiguos y espera.
+    """
+    modelo = None
+    # En plural, para los mensajes: "exportaciones", "importaciones"
+    nombre = 'trabajos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help=f'Procesa las {self.nombre} pendientes y termina')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera cuando no hay trabajos')
+        parser.add_argument('--expirar-minutos', type=int, default=30,
+                            help='Minutos sin avance tras los que un trabajo en proceso se da por interrumpido')
+        parser.add_argument('--dias', type=int, default=7, help='Días que se conservan los trabajos y sus archivos')
+
+    def procesar(self, trabajo):
+        raise NotImplementedError
+
+    def resumen(self, trabajo):
+        """ Texto que se muestra al terminar `trabajo` sin error. """
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        trabajos = self.modelo.objects
+        while True:
+            expirados = trabajos.expirar_interrumpidos(options['expirar_minutos'])
+            if expirados:
+                self.stdout.write(self.style.WARNING(f'{expirados} {self.nombre} interrumpidas marcadas con error'))
+
+            trabajo = trabajos.tomar_siguiente()
+            if trabajo is not None:
+                self.procesar(trabajo)
+                if trabajo.error:
+                    self.stdout.write(self.style.ERROR(f'{trabajo}: {trabajo.error}'))
+                else:
+                    self.stdout.write(f'{trabajo}: {self.resumen(trabajo)}')
+                continue
+
+            borrados = trabajos.borrar_antiguos(options['dias'])
+            if borrados:
+                self.stdout.write(f'{borrados} {self.nombre} antiguas eliminadas')
+
+            if options['una_vez']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,8 @@
+'use strict';
+// Al elegir un usuario en un filtro de autocompletado, navega a la lista filtrada
+// por su clave. Se incluye una sola vez por página (ListaGrandeMixin.media).
+window.addEventListener('load', function () {
+  django.jQuery('select[data-url-seleccion]').on('select2:select', function (evento) {
+    window.location.search = this.dataset.urlSeleccion.replace('__valor__', encodeURIComponent(evento.params.data.id));
+  });
+});